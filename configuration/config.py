@@ -16,3 +16,33 @@ METRIC_TYPE = MILVUS['metric_type']
 
 CHATBOT_MODEL = config['chatbot_model']
 CHATBOT_MODEL_NAME = CHATBOT_MODEL['model_name']
+CHATBOT_BASE_URL = CHATBOT_MODEL.get('base_url')
+CHATBOT_API_KEY = os.environ.get(CHATBOT_MODEL['api_key_env'])
+
+INGESTION = config['ingestion']
+ENCODE_BATCH_SIZE = INGESTION['encode_batch_size']
+INSERT_BATCH_SIZE = INGESTION['insert_batch_size']
+INGEST_WORKERS = INGESTION['num_workers']
+STREAM_QUEUE_SIZE = INGESTION['stream_queue_size']
+
+EMBEDDING_CACHE = config['embedding_cache']
+EMBEDDING_CACHE_DIR = EMBEDDING_CACHE['path']
+EMBEDDING_CACHE_MAX_ENTRIES = EMBEDDING_CACHE['max_entries']
+
+ANSWER_CACHE = config['answer_cache']
+ANSWER_CACHE_MAX_ENTRIES = ANSWER_CACHE['max_entries']
+ANSWER_CACHE_TTL_SECONDS = ANSWER_CACHE['ttl_seconds']
+ANSWER_CACHE_SIMILARITY = ANSWER_CACHE['similarity_threshold']
+
+DATABASE = config['database']
+DATABASE_PATH = DATABASE['path']
+DATABASE_POOL_SIZE = DATABASE['pool_size']
+SQLITE_CACHE_SIZE_KB = DATABASE['cache_size_kb']
+SQLITE_MMAP_SIZE = DATABASE['mmap_size']
+DATABASE_IMPORT_BATCH_SIZE = DATABASE['import_batch_size']
+
+AUDIT_LOG = config['audit_log']
+AUDIT_LOG_QUEUE_SIZE = AUDIT_LOG['queue_size']
+AUDIT_LOG_BATCH_SIZE = AUDIT_LOG['batch_size']
+AUDIT_LOG_FLUSH_INTERVAL = AUDIT_LOG['flush_interval_seconds']
+AUDIT_LOG_SPILL_PATH = AUDIT_LOG['spill_path']
@@ -1,24 +1,324 @@
 import os
+import sys
 import glob
 import random
+import shutil
+import hashlib
+import inspect
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 import pandas as pd
 import numpy as np
 
+# Rows parsed per chunk when a table is filtered while it is read
+CSV_CHUNK_ROWS = 1_000_000
+
+# Compact dtypes for the columns read from the event tables. hadm_id is nullable:
+# labevents has outpatient rows without an admission.
+EVENT_COLUMNS = ["hadm_id", "itemid", "valuenum", "charttime"]
+EVENT_DTYPES = {"hadm_id": "Int32", "itemid": "int32",
+                "valuenum": "float32", "charttime": "str"}
+ICD_COLUMNS = ["hadm_id", "icd_code"]
+ICD_DTYPES = {"hadm_id": "int32", "icd_code": "str"}
+
+# Vital and lab features: each statistic over each window from admission
+# (None = the whole stay)
+FEATURE_WINDOWS = {"1h": pd.Timedelta(hours=1), "24h": pd.Timedelta(hours=24),
+                   "stay": None}
+FEATURE_STATS = ["mean", "min", "max", "first", "last"]
+
+# Parquet copies of the tables (see --build-cache), in a subfolder next to the CSVs
+PARQUET_DIR = "parquet"
+# Arrow types of the numeric MIMIC columns; every other column is stored as text
+PARQUET_COLUMN_TYPES = {
+    "subject_id": "int32", "hadm_id": "int32", "stay_id": "int32", "itemid": "int32",
+    "valuenum": "float32", "seq_num": "int16", "icd_version": "int8",
+    "anchor_age": "int16", "anchor_year": "int16",
+}
+# Event tables get one directory per itemid, so reading a few items skips the rest
+PARQUET_PARTITIONS = {"chartevents": "itemid", "labevents": "itemid"}
+
 
-def load_csv(folder, name):
+def find_csv(folder, name):
     """
-    Robust loader: finds any file in `folder` whose name starts with `name`
+    Robust lookup: finds any file in `folder` whose name starts with `name`
     (case-insensitive) and ends with .csv or .csv.gz.
     """
     for fname in os.listdir(folder):
         low = fname.lower()
-        if low.startswith(name.lower()) and low.endswith('.csv'):
-            return pd.read_csv(os.path.join(folder, fname))
-        if low.startswith(name.lower()) and low.endswith('.csv.gz'):
-            return pd.read_csv(os.path.join(folder, fname), compression='gzip')
+        if low.startswith(name.lower()) and low.endswith(('.csv', '.csv.gz')):
+            return os.path.join(folder, fname)
     raise FileNotFoundError(f"No {name}.csv(.gz) in {folder}")
 
 
+def _cache_is_fresh(cache, path):
+    return os.path.isdir(cache) and os.path.getmtime(cache) >= os.path.getmtime(path)
+
+
+def iter_csv(folder, name, usecols=None, dtype=None, where=None, chunksize=CSV_CHUNK_ROWS):
+    """
+    load_csv, streamed: yields the filtered table `chunksize` rows (or Parquet
+    batches) at a time, for consumers that fold chunks as they go.
+    """
+    path = find_csv(folder, name)
+    cache = parquet_path(folder, name)
+    if _cache_is_fresh(cache, path):
+        yield from iter_parquet(cache, name, usecols, dtype, where, chunksize)
+        return
+
+    keep = {col: pd.Index(list(values)) for col, values in (where or {}).items()}
+    with pd.read_csv(path, usecols=usecols, dtype=dtype, chunksize=chunksize) as reader:
+        for chunk in reader:
+            mask = np.ones(len(chunk), dtype=bool)
+            for col, values in keep.items():
+                mask &= chunk[col].isin(values).to_numpy()
+            yield chunk[mask]
+
+
+def load_csv(folder, name, usecols=None, dtype=None, where=None, chunksize=CSV_CHUNK_ROWS):
+    """
+    Loads only the `usecols` columns of a MIMIC table, parsed as `dtype`.
+
+    `where` maps columns to the values to keep, e.g. {"itemid": vmap, "hadm_id":
+    case_ids}. The file is then streamed `chunksize` rows at a time and every chunk
+    filtered as it is read, so memory holds the matching rows rather than the table.
+    A Parquet copy made by build_parquet_cache, if newer than the CSV, is read instead.
+    """
+    path = find_csv(folder, name)
+    cache = parquet_path(folder, name)
+    if _cache_is_fresh(cache, path):
+        return load_parquet(cache, name, usecols, dtype, where)
+    if not where:
+        return pd.read_csv(path, usecols=usecols, dtype=dtype)
+
+    parts = list(iter_csv(folder, name, usecols, dtype, where, chunksize))
+    if not parts:
+        return pd.read_csv(path, usecols=usecols, dtype=dtype, nrows=0)
+    return pd.concat(parts, ignore_index=True)
+
+
+def parquet_path(folder, name):
+    return os.path.join(folder, PARQUET_DIR, name)
+
+
+def _parquet_partitioning(name):
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    column = PARQUET_PARTITIONS.get(name)
+    if column is None:
+        return None
+    return ds.partitioning(
+        pa.schema([(column, pa.type_for_alias(PARQUET_COLUMN_TYPES[column]))]),
+        flavor="hive")
+
+
+def build_parquet_cache(folder, name):
+    """
+    One-time conversion of a MIMIC table to a Parquet dataset, which load_csv
+    reads from then on. The CSV is converted in streamed batches.
+    """
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    import pyarrow.dataset as ds
+
+    path = find_csv(folder, name)
+    header = pd.read_csv(path, nrows=0).columns
+    column_types = {col: pa.type_for_alias(PARQUET_COLUMN_TYPES.get(col, "string"))
+                    for col in header}
+    reader = pacsv.open_csv(path, convert_options=pacsv.ConvertOptions(
+        column_types=column_types, strings_can_be_null=True))
+
+    # Written aside and swapped in, so an interrupted build never looks complete
+    cache = parquet_path(folder, name)
+    building = cache + ".building"
+    shutil.rmtree(building, ignore_errors=True)
+    ds.write_dataset(reader, building, format="parquet",
+                     partitioning=_parquet_partitioning(name), max_partitions=100_000)
+    shutil.rmtree(cache, ignore_errors=True)
+    os.replace(building, cache)
+
+
+def load_parquet(cache, name, usecols=None, dtype=None, where=None):
+    """
+    load_csv from the Parquet cache: only `usecols` are read, and the `where`
+    filter is pushed down into the scan, skipping partitions and row groups.
+    """
+    dataset, condition = _parquet_scan(cache, name, where)
+    df = dataset.to_table(columns=usecols, filter=condition).to_pandas()
+    return _parquet_dtypes(df, dtype)
+
+
+def iter_parquet(cache, name, usecols=None, dtype=None, where=None, chunksize=CSV_CHUNK_ROWS):
+    """load_parquet, yielding record batches of up to `chunksize` rows"""
+    dataset, condition = _parquet_scan(cache, name, where)
+    for batch in dataset.to_batches(columns=usecols, filter=condition,
+                                    batch_size=chunksize):
+        yield _parquet_dtypes(batch.to_pandas(), dtype)
+
+
+def _parquet_scan(cache, name, where):
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(cache, format="parquet",
+                         partitioning=_parquet_partitioning(name))
+    condition = None
+    for col, values in (where or {}).items():
+        value_set = pa.array(list(values), type=dataset.schema.field(col).type)
+        keep = ds.field(col).isin(value_set)
+        condition = keep if condition is None else condition & keep
+    return dataset, condition
+
+
+def _parquet_dtypes(df, dtype):
+    # Text columns already come back as str (with None for missing values)
+    dtype = {col: t for col, t in (dtype or {}).items() if t != "str"}
+    return df.astype(dtype) if dtype else df
+
+
+class IcdPrefixTrie:
+    """
+    Prefix trie over groups of ICD code prefixes: match() returns the ids (positions
+    in `groups`) of every group with a prefix the code starts with, in one walk down
+    the code.
+    """
+
+    def __init__(self, groups):
+        self.root = {}
+        for group_id, prefixes in enumerate(groups.values()):
+            for prefix in prefixes:
+                node = self.root
+                for char in prefix:
+                    node = node.setdefault(char, {})
+                # The None key holds the groups whose prefix ends at this node
+                node.setdefault(None, set()).add(group_id)
+
+    def match(self, code):
+        node = self.root
+        found = set(node.get(None, ()))
+        for char in code:
+            node = node.get(char)
+            if node is None:
+                break
+            found |= node.get(None, set())
+        return found
+
+
+def icd_flags(df, groups):
+    """
+    hadm_id x group boolean frame: True where an admission has an icd_code starting
+    with any of the group's prefixes. Codes become a categorical, so each distinct
+    code is matched once against the trie; rows then only carry their category
+    number, and a single groupby emits every group's column. Admissions without a
+    match are absent.
+    """
+    trie = IcdPrefixTrie(groups)
+    codes = pd.Categorical(df["icd_code"])
+    pairs = [(category, group_id)
+             for category, code in enumerate(codes.categories)
+             for group_id in trie.match(code)]
+    matches = pd.DataFrame(pairs, columns=["category", "group"], dtype="int32")
+
+    rows = pd.DataFrame({"hadm_id": df["hadm_id"].to_numpy(), "category": codes.codes})
+    hits = rows[rows["category"].isin(matches["category"])].merge(matches, on="category")
+    table = hits.groupby(["hadm_id", "group"]).size().unstack(fill_value=0) > 0
+    table = table.reindex(columns=range(len(groups)), fill_value=False)
+    table.columns = list(groups)
+    return table.astype(bool)
+
+
+def feature_column(measure, window, stat):
+    # Whole-stay features keep the names the output has always used
+    if window == "stay":
+        return f"{measure}_{stat}"
+    return f"{measure}_{window}_{stat}"
+
+
+def _merge_partials(partials):
+    # Partial aggregates of consecutive chunks, oldest first: counts and sums add
+    # up, and on equal times the earlier chunk's first and the later chunk's last win
+    if len(partials) == 1:
+        return partials[0]
+    both = pd.concat(partials)
+    keys = ["hadm_id", "itemid"]
+    merged = both.groupby(level=keys).agg(
+        count=("count", "sum"), total=("total", "sum"),
+        min=("min", "min"), max=("max", "max"))
+    first = both.sort_values("first_time", kind="stable") \
+        .groupby(level=keys)[["first", "first_time"]].first()
+    last = both.sort_values("last_time", kind="stable") \
+        .groupby(level=keys)[["last", "last_time"]].last()
+    return merged.join(first).join(last)
+
+
+class WindowedAggregator:
+    """
+    Per admission and item mean/min/max/first/last of chunked events (hadm_id,
+    itemid, valuenum, charttime) over windows starting at admission. Each chunk is
+    sorted once and reduced to partial aggregates per window that merge with the
+    running ones, so a table is folded out of core instead of materialized.
+    """
+
+    MERGE_EVERY = 8
+
+    def __init__(self, admit_times, windows=FEATURE_WINDOWS):
+        # admit_times: admittime Timestamps indexed by hadm_id
+        self.admit_times = admit_times
+        self.windows = windows
+        self._partials = {window: [] for window in windows}
+
+    def add(self, chunk):
+        chunk = chunk.dropna(subset=["hadm_id", "valuenum", "charttime"])
+        events = pd.DataFrame({
+            "hadm_id": chunk["hadm_id"].to_numpy("int64"),
+            "itemid": chunk["itemid"].to_numpy("int64"),
+            "value": chunk["valuenum"].to_numpy("float64"),
+            "time": pd.to_datetime(chunk["charttime"], format="ISO8601").to_numpy(),
+        }).sort_values(["hadm_id", "itemid", "time"], kind="stable")
+        offset = events["time"] - events["hadm_id"].map(self.admit_times)
+
+        for window, length in self.windows.items():
+            part = events if length is None else \
+                events[(offset >= pd.Timedelta(0)) & (offset < length)]
+            partials = self._partials[window]
+            partials.append(part.groupby(["hadm_id", "itemid"], sort=False).agg(
+                count=("value", "size"), total=("value", "sum"),
+                min=("value", "min"), max=("value", "max"),
+                first=("value", "first"), first_time=("time", "first"),
+                last=("value", "last"), last_time=("time", "last")))
+            if len(partials) >= self.MERGE_EVERY:
+                self._partials[window] = [_merge_partials(partials)]
+
+    def result(self, names, stats=FEATURE_STATS):
+        """
+        hadm_id-indexed frame with a feature_column(names[itemid], window, stat)
+        column for every item, window and statistic seen.
+        """
+        frames = []
+        for window, partials in self._partials.items():
+            if not partials:
+                continue
+            agg = _merge_partials(partials)
+            agg["mean"] = agg["total"] / agg["count"]
+            wide = agg[stats].unstack("itemid")
+            wide.columns = [feature_column(names[item], window, stat)
+                            for stat, item in wide.columns]
+            frames.append(wide)
+        if not frames:
+            return pd.DataFrame(index=pd.Index([], name="hadm_id"))
+        return pd.concat(frames, axis=1)
+
+
+def aggregate_events(chunks, admit_times, names, windows=FEATURE_WINDOWS,
+                     stats=FEATURE_STATS):
+    """Windowed features of the event chunks, see WindowedAggregator"""
+    aggregator = WindowedAggregator(admit_times, windows)
+    for chunk in chunks:
+        aggregator.add(chunk)
+    return aggregator.result(names, stats)
+
+
 # ----------------------------------------
 # Configuration: your actual Windows paths
 # ----------------------------------------
@@ -27,86 +327,32 @@ ICU_DIR = r"C:\Users\reema\OneDrive\Desktop\thesis\heart-failure-guidelines\icu"
 OUTPUT = "heart_failure_cases.csv"
 TOTAL_CASES = 30
 AGE_QUOTAS = {"<60": 10, "60-75": 10, ">75": 10}
+# MIMIC table -> folder, for the tables the cohort build reads
+MIMIC_TABLES = {
+    "diagnoses_icd": HOSP_DIR, "patients": HOSP_DIR, "admissions": HOSP_DIR,
+    "chartevents": ICU_DIR, "labevents": HOSP_DIR, "prescriptions": HOSP_DIR,
+    "procedures_icd": HOSP_DIR,
+}
+# Stage outputs, reused by later runs while their inputs and this script's code
+# are unchanged
+STAGE_CACHE_DIR = ".hf_stage_cache"
+
+# HF admissions: ICD-9 "428.*" or ICD-10 "I50.*"
+HF_CODES = ["428.", "I50"]
 
-# 1) Load & filter for HF admissions by ICD-9 "428.*" or ICD-10 "I50.*"
-print("Loading diagnoses...")
-diag = load_csv(HOSP_DIR, "diagnoses_icd")
-hf_diag = diag[diag["icd_code"].str.startswith(("428.", "I50"))]
-hf_adm = hf_diag["hadm_id"].drop_duplicates()
-
-# 2) Pull demographics & bin ages
-print("Loading demographics...")
-pts = load_csv(HOSP_DIR, "patients")
-adm = load_csv(HOSP_DIR, "admissions")
-demo = adm[adm["hadm_id"].isin(
-    hf_adm)][["hadm_id", "subject_id", "admittime", "dischtime"]]
-demo = demo.merge(pts[["subject_id", "gender", "anchor_age", "anchor_year", "anchor_year_group"]],
-                  on="subject_id", how="left") \
-    .rename(columns={"anchor_age": "age"})
-demo["age_bin"] = demo["age"].apply(
-    lambda x: "<60" if x < 60 else ("60-75" if x <= 75 else ">75"))
-demo["los_days"] = (pd.to_datetime(demo["dischtime"]) -
-                    pd.to_datetime(demo["admittime"])).dt.days
-
-# 3) Stratified sample by age quotas
-print("Selecting diverse cases...")
-samples = []
-for bin_label, quota in AGE_QUOTAS.items():
-    ids = demo[demo["age_bin"] == bin_label]["hadm_id"].tolist()
-    if ids:
-        samples += random.sample(ids, min(quota, len(ids)))
-remaining = list(set(hf_adm) - set(samples))
-if len(samples) < TOTAL_CASES and remaining:
-    samples += random.sample(remaining, TOTAL_CASES - len(samples))
-cases = pd.DataFrame({"hadm_id": samples})
-
-# 4) Merge back demographic fields
-cases = cases.merge(demo.drop_duplicates("hadm_id"), on="hadm_id", how="left")
-
-# 5) Height & weight → BMI
-print("Loading vitals and measurements...")
-charte = load_csv(ICU_DIR, "chartevents")[
-    ["hadm_id", "itemid", "valuenum", "charttime"]]
-hw = charte[charte["itemid"].isin([226707, 226512])]  # height and weight
-hw = hw.groupby(["hadm_id", "itemid"])["valuenum"].mean().unstack()
-hw.columns = ["height_cm", "weight_kg"]
-cases = cases.merge(hw.reset_index(), on="hadm_id", how="left")
-cases["bmi"] = (cases["weight_kg"] / ((cases["height_cm"]/100)**2)).round(1)
-
-# 6) Vitals in the first hour
-vmap = {
+HEIGHT_WEIGHT_ITEMS = {226730: "height_cm", 226512: "weight_kg"}
+VITAL_ITEMS = {
     220045: "heart_rate", 220179: "systolic_bp", 220180: "diastolic_bp",
     220210: "respiratory_rate", 220277: "oxygen_saturation", 223761: "temperature"
 }
-v = charte[charte["itemid"].isin(vmap)].copy()
-v["measure"] = v["itemid"].map(vmap)
-v = v.groupby(["hadm_id", "measure"])["valuenum"].agg(
-    ['mean', 'min', 'max']).reset_index()
-v = v.pivot(index="hadm_id", columns="measure", values=["mean", "min", "max"])
-v.columns = [f"{col[1]}_{col[0]}" for col in v.columns]
-cases = cases.merge(v.reset_index(), on="hadm_id", how="left")
-
-# 7) Labs
-print("Loading lab results...")
-labs = load_csv(HOSP_DIR, "labevents")[
-    ["hadm_id", "itemid", "valuenum", "charttime"]]
-lmap = {
+LAB_ITEMS = {
     50384: "bnp", 50912: "creatinine", 50983: "potassium",
     50902: "sodium", 51221: "hemoglobin", 51222: "hematocrit",
     51248: "wbc", 51249: "platelet", 51250: "rdw", 51251: "mcv",
     51252: "mch", 51253: "mchc", 51254: "rbc", 51255: "hct"
 }
-lab = labs[labs["itemid"].isin(lmap)].copy()
-lab["lab"] = lab["itemid"].map(lmap)
-lab = lab.groupby(["hadm_id", "lab"])["valuenum"].agg(
-    ['mean', 'min', 'max']).reset_index()
-lab = lab.pivot(index="hadm_id", columns="lab", values=["mean", "min", "max"])
-lab.columns = [f"{col[1]}_{col[0]}" for col in lab.columns]
-cases = cases.merge(lab.reset_index(), on="hadm_id", how="left")
-
-# 8) Comorbidity flags and details
-print("Processing comorbidities...")
-flags = {
+
+COMORBIDITY_CODES = {
     # Expanded hypertension codes
     "hypertension": ["401.", "402.", "403.", "404.", "405."],
     "diabetes": ["250.", "E11.", "E10.", "E13."],  # Added ICD-10 codes
@@ -122,22 +368,8 @@ flags = {
     "copd": ["496.", "J44."]  # Added ICD-10 codes
 }
 
-# Print total number of diagnoses for debugging
-print(f"\nTotal number of diagnoses: {len(diag)}")
-print(f"Number of unique hadm_ids: {diag['hadm_id'].nunique()}")
-
-for col, codes in flags.items():
-    # Check for any matching codes
-    has = set(diag[diag["icd_code"].str.startswith(tuple(codes))]["hadm_id"])
-    cases[col] = cases["hadm_id"].isin(has)
-    # Print debugging information
-    print(f"\n{col}:")
-    print(f"Number of patients with {col}: {cases[col].sum()}")
-    print(f"ICD codes used: {codes}")
-
-# 9) Heart Failure Type Classification
-print("Classifying heart failure types...")
-hf_types = {
+# Heart Failure Type Classification: the last matching type wins
+HF_TYPE_CODES = {
     # Ischemic heart disease
     "Ischemic": ["410.", "411.", "412.", "413.", "414."],
     "Dilated": ["425.4"],  # Dilated cardiomyopathy
@@ -149,61 +381,22 @@ hf_types = {
     "Right Ventricular": ["425.2"]  # Right ventricular cardiomyopathy
 }
 
-cases["hf_type"] = "Other"
-for hf_type, codes in hf_types.items():
-    mask = diag[diag["hadm_id"].isin(cases["hadm_id"]) &
-                diag["icd_code"].str.startswith(tuple(codes))]["hadm_id"]
-    cases.loc[cases["hadm_id"].isin(mask), "hf_type"] = hf_type
-
-# 10) Medications
-print("Processing medications...")
-pres = load_csv(HOSP_DIR, "prescriptions")
-pres["drug"] = pres["drug"].str.lower()
-hfmed = pres[pres["drug"].str.contains(
+HF_MEDICATIONS = (
     "lisinopril|furosemide|metoprolol|spironolactone|carvedilol|bisoprolol|"
     "sacubitril|valsartan|digoxin|hydralazine|nitrate|diltiazem|verapamil|"
     "amiodarone|dofetilide|sotalol|warfarin|apixaban|rivaroxaban|dabigatran|"
     "aspirin|clopidogrel|ticagrelor|prasugrel|atorvastatin|rosuvastatin|"
-    "simvastatin|pravastatin|insulin|metformin|glipizide|glimepiride")]
-md = hfmed.groupby("hadm_id")["drug"] \
-    .unique().apply(lambda a: ", ".join(a)) \
-    .reset_index().rename(columns={"drug": "medications"})
-cases = cases.merge(md, on="hadm_id", how="left")
-
-# 11) Procedures and Devices
-print("Processing procedures and devices...")
-proc = load_csv(HOSP_DIR, "procedures_icd")
-device_codes = {
+    "simvastatin|pravastatin|insulin|metformin|glipizide|glimepiride")
+
+DEVICE_CODES = {
     "ICD": ["37.94", "37.95", "37.96", "37.97", "37.98"],  # ICD codes
     "Pacemaker": ["37.80", "37.81", "37.82", "37.83"],  # Pacemaker codes
     "CABG": ["36.1"],  # CABG codes
     "PCI": ["36.06", "36.07"]  # PCI codes
 }
 
-for device, codes in device_codes.items():
-    has = set(proc[proc["icd_code"].str.startswith(tuple(codes))]["hadm_id"])
-    cases[f"has_{device.lower()}"] = cases["hadm_id"].isin(has)
-
-# 12) Add derived fields
-print("Adding derived fields...")
-# NYHA Classification based on symptoms and vitals
-cases["nyha"] = pd.cut(
-    cases["oxygen_saturation_mean"],
-    bins=[0, 90, 95, 98, 100],
-    labels=["IV", "III", "II", "I"]
-)
-
-# Anemia status
-cases["anemia_status"] = pd.cut(
-    cases["hemoglobin_mean"],
-    bins=[0, 10, 12, 14, 100],
-    labels=["Severe", "Moderate", "Mild", "Normal"]
-)
-
-# 13) Clean and format final output
-print("Preparing final output...")
-# Define all possible columns
-all_columns = [
+# Output columns, in order
+OUTPUT_COLUMNS = [
     # Demographics
     "hadm_id", "subject_id", "age", "gender", "height_cm", "weight_kg", "bmi",
     "los_days", "anchor_year_group",
@@ -240,42 +433,376 @@ all_columns = [
     # Medications
     "medications"
 ]
+# Then the vitals and labs above over the shorter windows, and their first and
+# last values over the stay
+OUTPUT_COLUMNS += [
+    feature_column(measure, window, stat)
+    for measure in [*VITAL_ITEMS.values(), *LAB_ITEMS.values()]
+    if f"{measure}_mean" in OUTPUT_COLUMNS
+    for window in FEATURE_WINDOWS
+    for stat in FEATURE_STATS
+    if feature_column(measure, window, stat) not in OUTPUT_COLUMNS
+]
+
+
+# ----------------------------------------
+# Stages: module-level functions of their inputs' outputs (plus params), so they
+# can run in worker processes
+# ----------------------------------------
+def stage_diagnoses(hf_codes, columns, dtypes):
+    """Every diagnosis of the HF admissions"""
+    print("Loading diagnoses...")
+    diag = load_csv(HOSP_DIR, "diagnoses_icd", columns, dtypes)
+    hf_adm = diag.loc[diag["icd_code"].str.startswith(tuple(hf_codes)), "hadm_id"]
+
+    # Print total number of diagnoses for debugging
+    print(f"\nTotal number of diagnoses: {len(diag)}")
+    print(f"Number of unique hadm_ids: {diag['hadm_id'].nunique()}")
+    return diag[diag["hadm_id"].isin(hf_adm.unique())].reset_index(drop=True)
+
+
+def stage_patients():
+    print("Loading demographics...")
+    return load_csv(HOSP_DIR, "patients",
+                    ["subject_id", "gender", "anchor_age", "anchor_year", "anchor_year_group"])
+
+
+def stage_demographics(diagnoses, patients):
+    """Admission times, demographics and age bins of the HF admissions"""
+    demo = load_csv(HOSP_DIR, "admissions",
+                    ["hadm_id", "subject_id", "admittime", "dischtime"],
+                    where={"hadm_id": diagnoses["hadm_id"].unique()})
+    demo = demo.merge(patients, on="subject_id", how="left") \
+        .rename(columns={"anchor_age": "age"})
+    demo["age_bin"] = demo["age"].apply(
+        lambda x: "<60" if x < 60 else ("60-75" if x <= 75 else ">75"))
+    demo["los_days"] = (pd.to_datetime(demo["dischtime"]) -
+                        pd.to_datetime(demo["admittime"])).dt.days
+    return demo.drop_duplicates("hadm_id")
+
+
+def stage_sample(diagnoses, demographics, quotas, total):
+    """Stratified sample by age quotas, with the demographic fields"""
+    print("Selecting diverse cases...")
+    hf_adm = diagnoses["hadm_id"].drop_duplicates()
+    samples = []
+    for bin_label, quota in quotas.items():
+        ids = demographics[demographics["age_bin"] == bin_label]["hadm_id"].tolist()
+        if ids:
+            samples += random.sample(ids, min(quota, len(ids)))
+    remaining = list(set(hf_adm) - set(samples))
+    if len(samples) < total and remaining:
+        samples += random.sample(remaining, total - len(samples))
+    cases = pd.DataFrame({"hadm_id": samples})
+    return cases.merge(demographics, on="hadm_id", how="left")
+
+
+def _event_features(folder, table, demographics, items, columns, dtypes, windows, stats):
+    admit_times = pd.to_datetime(demographics.set_index("hadm_id")["admittime"])
+    events = iter_csv(folder, table, columns, dtypes,
+                      where={"itemid": list(items), "hadm_id": admit_times.index})
+    return aggregate_events(events, admit_times, items, windows, stats)
+
+
+def stage_vitals(demographics, items, columns, dtypes, windows, stats):
+    """Height, weight and vitals over the feature windows"""
+    print("Loading vitals and measurements...")
+    return _event_features(ICU_DIR, "chartevents", demographics, items,
+                           columns, dtypes, windows, stats)
+
+
+def stage_labs(demographics, items, columns, dtypes, windows, stats):
+    print("Loading lab results...")
+    return _event_features(HOSP_DIR, "labevents", demographics, items,
+                           columns, dtypes, windows, stats)
+
+
+def stage_comorbidities(diagnoses, flags, hf_types):
+    """Comorbidities and HF types in one pass over the diagnoses"""
+    print("Processing comorbidities...")
+    return icd_flags(diagnoses, {**flags, **hf_types})
+
+
+def stage_medications(diagnoses, pattern):
+    print("Processing medications...")
+    pres = load_csv(HOSP_DIR, "prescriptions", ["hadm_id", "drug"],
+                    {"hadm_id": "Int32", "drug": "str"},
+                    where={"hadm_id": diagnoses["hadm_id"].unique()})
+    pres["drug"] = pres["drug"].str.lower()
+    hfmed = pres[pres["drug"].str.contains(pattern, na=False)]
+    return hfmed.groupby("hadm_id")["drug"] \
+        .unique().apply(lambda a: ", ".join(a)).rename("medications")
+
+
+def stage_devices(diagnoses, device_codes, columns, dtypes):
+    print("Processing procedures and devices...")
+    proc = load_csv(HOSP_DIR, "procedures_icd", columns, dtypes,
+                    where={"hadm_id": diagnoses["hadm_id"].unique()})
+    devices = icd_flags(proc, device_codes)
+    devices.columns = [f"has_{device.lower()}" for device in device_codes]
+    return devices
+
+
+class Stage:
+    """
+    A named step of the cohort build: `function(**inputs, **params)`, where inputs
+    are the outputs of the stages it names. `tables` are the MIMIC tables it reads;
+    `cache=False` marks stages that must rerun every time (random sampling).
+    """
 
-# Store summary statistics before column renaming
-age_distribution = cases["age_bin"].value_counts()
-hf_types_distribution = cases["hf_type"].value_counts()
-nyha_distribution = cases["nyha"].value_counts()
-comorbidity_counts = {
-    "Hypertension": cases["hypertension"].sum(),
-    "Diabetes": cases["diabetes"].sum(),
-    "Dyslipidemia": cases["dyslipidemia"].sum(),
-    "Kidney Disease": cases["kidney_disease"].sum(),
-    "Obesity": cases["obesity"].sum(),
-    "Sleep Apnea": cases["sleep_apnea"].sum(),
-    "Anemia": cases["anemia"].sum(),
-    "Atrial Fibrillation": cases["atrial_fibrillation"].sum()
+    def __init__(self, function, inputs=(), tables=(), params=None, cache=True):
+        self.function = function
+        self.inputs = list(inputs)
+        self.tables = list(tables)
+        self.params = params or {}
+        self.cache = cache
+
+
+# How the vitals and labs stages read and aggregate their events
+EVENT_FEATURE_PARAMS = {"columns": EVENT_COLUMNS, "dtypes": EVENT_DTYPES,
+                        "windows": FEATURE_WINDOWS, "stats": FEATURE_STATS}
+
+STAGES = {
+    "diagnoses": Stage(stage_diagnoses, tables=["diagnoses_icd"],
+                       params={"hf_codes": HF_CODES, "columns": ICD_COLUMNS,
+                               "dtypes": ICD_DTYPES}),
+    "patients": Stage(stage_patients, tables=["patients"]),
+    "demographics": Stage(stage_demographics, ["diagnoses", "patients"],
+                          tables=["admissions"]),
+    "sample": Stage(stage_sample, ["diagnoses", "demographics"], cache=False,
+                    params={"quotas": AGE_QUOTAS, "total": TOTAL_CASES}),
+    "vitals": Stage(stage_vitals, ["demographics"], tables=["chartevents"],
+                    params={"items": {**HEIGHT_WEIGHT_ITEMS, **VITAL_ITEMS},
+                            **EVENT_FEATURE_PARAMS}),
+    "labs": Stage(stage_labs, ["demographics"], tables=["labevents"],
+                  params={"items": LAB_ITEMS, **EVENT_FEATURE_PARAMS}),
+    "comorbidities": Stage(stage_comorbidities, ["diagnoses"],
+                           params={"flags": COMORBIDITY_CODES, "hf_types": HF_TYPE_CODES}),
+    "medications": Stage(stage_medications, ["diagnoses"], tables=["prescriptions"],
+                         params={"pattern": HF_MEDICATIONS}),
+    "devices": Stage(stage_devices, ["diagnoses"], tables=["procedures_icd"],
+                     params={"device_codes": DEVICE_CODES, "columns": ICD_COLUMNS,
+                             "dtypes": ICD_DTYPES}),
 }
 
-# Add any missing columns with NaN values
-for col in all_columns:
-    if col not in cases.columns:
-        cases[col] = np.nan
-
-# Select and rename columns
-cases = cases[all_columns].copy()
-cases.columns = [col.replace("_", " ").title() for col in cases.columns]
-
-# 14) Export
-print("Saving results...")
-cases.to_csv(OUTPUT, index=False)
-
-# Print summary statistics using stored values
-print("\nAge distribution:")
-print(age_distribution)
-print("\nHeart failure types:")
-print(hf_types_distribution)
-print("\nNYHA classification:")
-print(nyha_distribution)
-print("\nComorbidities:")
-for condition, count in comorbidity_counts.items():
-    print(f"{condition}: {count} cases")
+
+def stage_order(stages):
+    """Stage names with every stage after its inputs; raises on cycles"""
+    order, visiting = [], set()
+
+    def visit(name):
+        if name in order:
+            return
+        if name in visiting:
+            raise ValueError(f"Stage dependency cycle through {name!r}")
+        if name not in stages:
+            raise ValueError(f"Unknown stage {name!r}")
+        visiting.add(name)
+        for dep in stages[name].inputs:
+            visit(dep)
+        visiting.discard(name)
+        order.append(name)
+
+    for name in stages:
+        visit(name)
+    return order
+
+
+def _code_fingerprint():
+    # Every function and class of this script, so editing a helper a stage calls
+    # (loaders, WindowedAggregator, icd_flags, ...) invalidates the cache too.
+    # Settings stages depend on are passed as params; the Parquet column types
+    # are read by the loaders directly.
+    module = sys.modules[__name__]
+    sources = [inspect.getsource(obj) for _, obj in sorted(vars(module).items())
+               if (inspect.isfunction(obj) or inspect.isclass(obj))
+               and obj.__module__ == __name__]
+    return "\n".join(sources) + repr(PARQUET_COLUMN_TYPES)
+
+
+def stage_keys(stages):
+    """
+    Cache key of every stage: this script's code, the stage's params, the MIMIC
+    files it reads and the keys of its inputs. None for stages that are not
+    cached, and for everything downstream of them.
+    """
+    code = _code_fingerprint()
+    keys = {}
+    for name in stage_order(stages):
+        stage = stages[name]
+        input_keys = [keys[dep] for dep in stage.inputs]
+        if not stage.cache or None in input_keys:
+            keys[name] = None
+            continue
+        key = hashlib.sha256()
+        for part in [code, name, repr(stage.params), *input_keys]:
+            key.update(repr(part).encode())
+        for table in stage.tables:
+            path = find_csv(MIMIC_TABLES[table], table)
+            info = os.stat(path)
+            key.update(repr((path, info.st_size, info.st_mtime)).encode())
+        keys[name] = key.hexdigest()[:16]
+    return keys
+
+
+def _cache_file(name, key):
+    return os.path.join(STAGE_CACHE_DIR, f"{name}-{key}.pkl")
+
+
+def _save_stage(name, key, output):
+    os.makedirs(STAGE_CACHE_DIR, exist_ok=True)
+    for old in glob.glob(os.path.join(STAGE_CACHE_DIR, f"{name}-*.pkl")):
+        os.remove(old)
+    path = _cache_file(name, key)
+    pd.to_pickle(output, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
+def run_stages(stages, workers=None, use_cache=True):
+    """
+    Runs the stages in a process pool, each as soon as its inputs are done, so
+    independent table loads overlap. Stages whose cache key has a saved output are
+    loaded instead of run. Returns {stage name: output}.
+    """
+    keys = stage_keys(stages)
+    results = {}
+    pending = dict(stages)
+    running = {}
+
+    with ProcessPoolExecutor(workers) as pool:
+        while pending or running:
+            ready = [name for name, stage in pending.items()
+                     if all(dep in results for dep in stage.inputs)]
+            loaded = False
+            for name in ready:
+                stage = pending.pop(name)
+                key = keys[name]
+                if use_cache and key and os.path.exists(_cache_file(name, key)):
+                    print(f"Using cached {name}")
+                    results[name] = pd.read_pickle(_cache_file(name, key))
+                    loaded = True
+                    continue
+                inputs = {dep: results[dep] for dep in stage.inputs}
+                running[pool.submit(stage.function, **inputs, **stage.params)] = name
+            if loaded:
+                continue  # cached outputs may have made more stages ready
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                results[name] = future.result()
+                if keys[name]:
+                    _save_stage(name, keys[name], results[name])
+    return results
+
+
+def build_cases(results):
+    """Joins the stage outputs onto the sampled cases"""
+    cases = results["sample"]
+
+    cases = cases.merge(results["vitals"].reset_index(), on="hadm_id", how="left")
+    for measure in HEIGHT_WEIGHT_ITEMS.values():
+        cases[measure] = cases.get(f"{measure}_mean", np.nan)
+    cases["bmi"] = (cases["weight_kg"] / ((cases["height_cm"]/100)**2)).round(1)
+    cases = cases.merge(results["labs"].reset_index(), on="hadm_id", how="left")
+
+    codes = results["comorbidities"].reindex(cases["hadm_id"], fill_value=False)
+    cases[list(COMORBIDITY_CODES)] = codes[list(COMORBIDITY_CODES)].to_numpy()
+    for col, icd_codes in COMORBIDITY_CODES.items():
+        # Print debugging information
+        print(f"\n{col}:")
+        print(f"Number of patients with {col}: {cases[col].sum()}")
+        print(f"ICD codes used: {icd_codes}")
+
+    print("Classifying heart failure types...")
+    types = codes[list(HF_TYPE_CODES)].iloc[:, ::-1]
+    cases["hf_type"] = np.where(types.any(axis=1), types.idxmax(axis=1), "Other")
+
+    cases = cases.merge(results["medications"].reset_index(), on="hadm_id", how="left")
+    devices = results["devices"].reindex(cases["hadm_id"], fill_value=False)
+    cases[list(devices.columns)] = devices.to_numpy()
+
+    # Add derived fields
+    print("Adding derived fields...")
+    # NYHA Classification based on symptoms and vitals
+    cases["nyha"] = pd.cut(
+        cases["oxygen_saturation_mean"],
+        bins=[0, 90, 95, 98, 100],
+        labels=["IV", "III", "II", "I"]
+    )
+
+    # Anemia status
+    cases["anemia_status"] = pd.cut(
+        cases["hemoglobin_mean"],
+        bins=[0, 10, 12, 14, 100],
+        labels=["Severe", "Moderate", "Mild", "Normal"]
+    )
+    return cases
+
+
+def write_cases(cases, output=OUTPUT):
+    """Writes the output columns and prints the summary statistics"""
+    print("Preparing final output...")
+    # Store summary statistics before column renaming
+    age_distribution = cases["age_bin"].value_counts()
+    hf_types_distribution = cases["hf_type"].value_counts()
+    nyha_distribution = cases["nyha"].value_counts()
+    comorbidity_counts = {
+        "Hypertension": cases["hypertension"].sum(),
+        "Diabetes": cases["diabetes"].sum(),
+        "Dyslipidemia": cases["dyslipidemia"].sum(),
+        "Kidney Disease": cases["kidney_disease"].sum(),
+        "Obesity": cases["obesity"].sum(),
+        "Sleep Apnea": cases["sleep_apnea"].sum(),
+        "Anemia": cases["anemia"].sum(),
+        "Atrial Fibrillation": cases["atrial_fibrillation"].sum()
+    }
+
+    # Add any missing columns with NaN values
+    for col in OUTPUT_COLUMNS:
+        if col not in cases.columns:
+            cases[col] = np.nan
+
+    # Select and rename columns
+    cases = cases[OUTPUT_COLUMNS].copy()
+    cases.columns = [col.replace("_", " ").title() for col in cases.columns]
+
+    print("Saving results...")
+    cases.to_csv(output, index=False)
+
+    # Print summary statistics using stored values
+    print("\nAge distribution:")
+    print(age_distribution)
+    print("\nHeart failure types:")
+    print(hf_types_distribution)
+    print("\nNYHA classification:")
+    print(nyha_distribution)
+    print("\nComorbidities:")
+    for condition, count in comorbidity_counts.items():
+        print(f"{condition}: {count} cases")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Extract a stratified sample of heart failure admissions from MIMIC-IV")
+    parser.add_argument("--build-cache", action="store_true",
+                        help="convert the MIMIC tables to Parquet first; later runs read "
+                             "the Parquet copies instead of parsing the CSVs")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="stages run in parallel (default: one per CPU); each "
+                             "running stage holds its own table subset in memory")
+    parser.add_argument("--no-stage-cache", action="store_true",
+                        help=f"rerun every stage instead of reusing {STAGE_CACHE_DIR}/")
+    args = parser.parse_args()
+
+    if args.build_cache:
+        for name, folder in MIMIC_TABLES.items():
+            print(f"Caching {name} as Parquet...")
+            build_parquet_cache(folder, name)
+
+    results = run_stages(STAGES, args.workers, not args.no_stage_cache)
+    write_cases(build_cases(results))
+
+
+if __name__ == "__main__":
+    main()
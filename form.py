@@ -1,451 +1,353 @@
 import streamlit as st
-import sqlite3
+import json
+from services.audit_log import get_audit_log
+from services.migrations import bulk_insert, migrate
+from services.patient_db import connection, transaction
+from services.patient_deletion import delete_patients
 
 
 def create_patient_table():
-    conn = sqlite3.connect("patients.db")
-    cursor = conn.cursor()
-
-    # Drop existing patient_consents table if it exists
-    cursor.execute("DROP TABLE IF EXISTS patient_consents;")
-
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS patients (
-            patient_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            patient_name TEXT,
-            age INTEGER,
-            sex TEXT,
-            height REAL,
-            weight REAL,
-            bmi REAL,
-            heart_rate INTEGER,
-            rhythm TEXT,
-            systolic_bp INTEGER,
-            diastolic_bp INTEGER,
-            respiratory_rate INTEGER,
-            oxygen_saturation REAL,
-            temperature REAL,
-            edema_locations TEXT,
-            edema_grade TEXT,
-            jvp TEXT,
-            hepatomegaly TEXT,
-            hepatomegaly_span REAL,
-            lung_findings TEXT,
-            heart_sounds TEXT,
-            murmurs TEXT,
-            murmur_other TEXT,
-            hf_type TEXT,
-            EF_type TEXT,
-            lvef REAL,
-            nyha TEXT,
-            bnp REAL,
-            symptom_triggers TEXT,
-            other_trigger_detail TEXT,
-            daily_impact TEXT,
-            alcohol BOOLEAN,
-            alcohol_frequency TEXT,
-            smoking BOOLEAN,
-            smoking_packs REAL,
-            smoking_duration INTEGER,
-            activity TEXT,
-            medications TEXT,
-            other_meds TEXT,
-            creatinine REAL,
-            potassium REAL,
-            sodium REAL,
-            anemia_status TEXT,
-            anemia_present BOOLEAN,
-            iron_supplement BOOLEAN,
-            ferritin_issue BOOLEAN,
-            walk_test INTEGER,
-            vo2_max REAL,
-            devices TEXT,
-            ecg TEXT,
-            echo TEXT,
-            echo_other TEXT,
-            ca_findings TEXT,
-            ca_other_details TEXT,
-            mri_findings TEXT,
-            mri_other_details TEXT,
-            holter_findings TEXT,
-            holter_other_details TEXT,
-            follow_plan TEXT
-        );
-    """)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS patient_symptoms (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            patient_id INTEGER,
-            symptom TEXT,
-            category TEXT,
-            present BOOLEAN,
-            severity INTEGER,
-            duration TEXT,
-            FOREIGN KEY (patient_id) REFERENCES patients(patient_id)
-        );
-    """)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS patient_comorbidities (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            patient_id INTEGER,
-            hypertension BOOLEAN,
-            diabetes BOOLEAN,
-            dyslipidemia BOOLEAN,
-            kidney_disease BOOLEAN,
-            obesity BOOLEAN,
-            sleep_apnea BOOLEAN,
-            family_history BOOLEAN,
-            FOREIGN KEY (patient_id) REFERENCES patients(patient_id)
-        );
-    """)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS comorbidity_details (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            patient_id INTEGER,
-            comorbidity_record_id INTEGER,
-            detail_key TEXT,
-            detail_value TEXT,
-            FOREIGN KEY (patient_id) REFERENCES patients(patient_id),
-            FOREIGN KEY (comorbidity_record_id) REFERENCES patient_comorbidities(id)
-        );
-    """)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS cv_events (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            patient_id INTEGER,
-            event_key TEXT,
-            event_present BOOLEAN,
-            FOREIGN KEY (patient_id) REFERENCES patients(patient_id)
-        );
-    """)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS patient_consents (
-            consent_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            patient_id INTEGER,
-            clinical_care_consent BOOLEAN,
-            quality_research_consent BOOLEAN,
-            ai_training_consent BOOLEAN,
-            consent_timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (patient_id) REFERENCES patients(patient_id)
-        );
-    """)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS consent_audit_log (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            patient_id INTEGER,
-            action TEXT NOT NULL,
-            purpose TEXT NOT NULL,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            ip_address TEXT,
-            user_agent TEXT,
-            FOREIGN KEY (patient_id) REFERENCES patients(patient_id)
-        );
-    """)
-    conn.commit()
-    conn.close()
-
-
-def save_consent(patient_id, clinical_care_consent, quality_research_consent, ai_training_consent):
-    conn = sqlite3.connect("patients.db")
-    cursor = conn.cursor()
-
-    # First, log the consent action
-    log_consent_action(patient_id, "CONSENT_GIVEN",
-                       "CLINICAL_CARE" if clinical_care_consent else "CONSENT_DENIED")
+    """Create the patient tables, or migrate them to the latest schema version"""
+    with connection() as conn:
+        migrate(conn)
+
+
+# Columns of the patients table in insert order (everything except patient_id)
+PATIENT_COLUMNS = (
+    "patient_name", "age", "sex", "height", "weight", "bmi",
+    "heart_rate", "rhythm", "systolic_bp", "diastolic_bp", "respiratory_rate",
+    "oxygen_saturation", "temperature", "edema_locations", "edema_grade", "jvp", "hepatomegaly", "hepatomegaly_span", "lung_findings", "heart_sounds", "murmurs", "murmur_other",
+    "hf_type", "EF_type", "lvef", "nyha", "bnp",
+    "symptom_triggers", "other_trigger_detail", "daily_impact",
+    "alcohol", "alcohol_frequency", "smoking", "smoking_packs", "smoking_duration", "activity",
+    "medications", "other_meds", "creatinine", "potassium", "sodium",
+    "anemia_status", "anemia_present", "iron_supplement", "ferritin_issue",
+    "walk_test", "vo2_max", "devices", "ecg", "echo", "echo_other",
+    "ca_findings", "ca_other_details", "mri_findings", "mri_other_details", "holter_findings", "holter_other_details",
+    "follow_plan"
+)
+
+INSERT_PATIENT_SQL = f"""
+    INSERT INTO patients ({", ".join(PATIENT_COLUMNS)})
+    VALUES ({", ".join("?" * len(PATIENT_COLUMNS))})
+"""
+
+# Comorbidity flag columns and the labels the forms use for them
+COMORBIDITY_FLAGS = (
+    ("hypertension", "Hypertension"),
+    ("diabetes", "Diabetes"),
+    ("dyslipidemia", "Dyslipidemia"),
+    ("kidney_disease", "Kidney Disease"),
+    ("obesity", "Obesity"),
+    ("sleep_apnea", "Sleep Apnea"),
+    ("family_history", "Family History of Heart Disease")
+)
+
+
+def _consent_rows(patient_id, clinical_care_consent, quality_research_consent, ai_training_consent):
+    """Audit log rows and the patient_consents row recorded for a consent form"""
+    audit_rows = [(patient_id, "CONSENT_GIVEN",
+                   "CLINICAL_CARE" if clinical_care_consent else "CONSENT_DENIED", None, None)]
     if quality_research_consent:
-        log_consent_action(patient_id, "CONSENT_GIVEN", "QUALITY_RESEARCH")
+        audit_rows.append(
+            (patient_id, "CONSENT_GIVEN", "QUALITY_RESEARCH", None, None))
     if ai_training_consent:
-        log_consent_action(patient_id, "CONSENT_GIVEN", "AI_TRAINING")
+        audit_rows.append(
+            (patient_id, "CONSENT_GIVEN", "AI_TRAINING", None, None))
 
-    # Then save the consent data
-    cursor.execute("""
+    consent_row = (patient_id, clinical_care_consent,
+                   quality_research_consent, ai_training_consent)
+    return audit_rows, consent_row
+
+
+def _insert_consent_rows(cursor, consent_rows):
+    cursor.executemany("""
         INSERT INTO patient_consents 
         (patient_id, clinical_care_consent, quality_research_consent, ai_training_consent)
         VALUES (?, ?, ?, ?)
-    """, (patient_id, clinical_care_consent, quality_research_consent, ai_training_consent))
-    conn.commit()
-    conn.close()
-
-
-def save_patient(
-    patient_name, age, sex, height, weight, bmi,
-    heart_rate, rhythm, systolic_bp, diastolic_bp, respiratory_rate,
-    oxygen_saturation, temperature, edema_locations, edema_grade, jvp, hepatomegaly, hepatomegaly_span, lung_findings, heart_sounds, murmurs, murmur_other,
-    hf_type, EF_type, lvef, nyha, bnp,
-    symptom_triggers_str, other_trigger_detail, daily_impact,
-    alcohol, alcohol_frequency, smoking, smoking_packs, smoking_duration, activity,
-    medications_str, other_meds, creatinine, potassium, sodium,
-    anemia_status, anemia_present, iron_supplement, ferritin_issue,
-    walk_test, vo2_max, devices_str, ecg, echo_str, echo_other,
-    ca_findings, ca_other_details, mri_findings, mri_other_details, holter_findings, holter_other_details,
-    follow_plan
-):
-    conn = sqlite3.connect("patients.db")
-    cursor = conn.cursor()
+    """, consent_rows)
 
-    cursor.execute("""
-        INSERT INTO patients (
-            patient_name, age, sex, height, weight, bmi,
-            heart_rate, rhythm, systolic_bp, diastolic_bp, respiratory_rate,
-            oxygen_saturation, temperature, edema_locations, edema_grade, jvp, hepatomegaly, hepatomegaly_span, lung_findings, heart_sounds, murmurs, murmur_other,
-            hf_type, EF_type, lvef, nyha, bnp,
-            symptom_triggers, other_trigger_detail, daily_impact,
-            alcohol, alcohol_frequency, smoking, smoking_packs, smoking_duration, activity,
-            medications, other_meds, creatinine, potassium, sodium,
-            anemia_status, anemia_present, iron_supplement, ferritin_issue,
-            walk_test, vo2_max, devices, ecg, echo, echo_other,
-            ca_findings, ca_other_details, mri_findings, mri_other_details, holter_findings, holter_other_details,
-            follow_plan
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
-        patient_name, age, sex, height, weight, bmi,
-        heart_rate, rhythm, systolic_bp, diastolic_bp, respiratory_rate,
-        oxygen_saturation, temperature, edema_locations, edema_grade, jvp, hepatomegaly, hepatomegaly_span, lung_findings, heart_sounds, murmurs, murmur_other,
-        hf_type, EF_type, lvef, nyha, bnp,
-        symptom_triggers_str, other_trigger_detail, daily_impact,
-        alcohol, alcohol_frequency, smoking, smoking_packs, smoking_duration, activity,
-        medications_str, other_meds, creatinine, potassium, sodium,
-        anemia_status, anemia_present, iron_supplement, ferritin_issue,
-        walk_test, vo2_max, devices_str, ecg, echo_str, echo_other,
-        ca_findings, ca_other_details, mri_findings, mri_other_details, holter_findings, holter_other_details,
-        follow_plan
-    ))
-
-    patient_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return patient_id
-
-
-def save_patient_data(patient_id, individual_symptoms, comorbidities_data, comorbidity_details_data, cv_events_data):
-    """
-    Inserts related data for a patient into:
-    - patient_symptoms
-    - patient_comorbidities
-    - comorbidity_details
-    - cv_events
-
-    Arguments:
-    - patient_id: The patient_id from the patients table.
-    - individual_symptoms: List of dicts with keys: symptom, category, severity, duration.
-    - comorbidities_data: Dict of boolean flags for comorbidities.
-    - comorbidity_details_data: List of dicts with keys: detail_key, detail_value.
-    - cv_events_data: Dict with keys (event name) and boolean values.
-    """
-    conn = sqlite3.connect("patients.db")
-    cursor = conn.cursor()
 
-    # Insert symptoms
-    for symptom_entry in individual_symptoms:
-        cursor.execute("""
-            INSERT INTO patient_symptoms (patient_id, symptom, category, present, severity, duration)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (
-            patient_id,
-            symptom_entry['symptom'],
-            symptom_entry['category'],
-            True,
-            symptom_entry['severity'],
-            symptom_entry['duration']
-        ))
-
-    # Insert comorbidities (main boolean flags)
+def _insert_comorbidities(cursor, patient_id, comorbidities_data):
+    """Insert the comorbidity flags row and return its id"""
     cursor.execute("""
         INSERT INTO patient_comorbidities (
             patient_id, hypertension, diabetes, dyslipidemia,
             kidney_disease, obesity, sleep_apnea, family_history
         ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
-        patient_id,
-        comorbidities_data.get("Hypertension", False),
-        comorbidities_data.get("Diabetes", False),
-        comorbidities_data.get("Dyslipidemia", False),
-        comorbidities_data.get("Kidney Disease", False),
-        comorbidities_data.get("Obesity", False),
-        comorbidities_data.get("Sleep Apnea", False),
-        comorbidities_data.get("Family History of Heart Disease", False)
-    ))
-    comorbidity_record_id = cursor.lastrowid
-
-    # Insert comorbidity details (e.g. BP control, eGFR range)
-    for detail in comorbidity_details_data:
-        cursor.execute("""
-            INSERT INTO comorbidity_details (patient_id, comorbidity_record_id, detail_key, detail_value)
-            VALUES (?, ?, ?, ?)
-        """, (
-            patient_id,
-            comorbidity_record_id,
-            detail['detail_key'],
-            detail['detail_value']
-        ))
-
-    # Insert cardiovascular events
-    for event_key, event_present in cv_events_data.items():
-        cursor.execute("""
-            INSERT INTO cv_events (patient_id, event_key, event_present)
-            VALUES (?, ?, ?)
-        """, (
-            patient_id,
-            event_key,
-            event_present
-        ))
+    """, (patient_id,) + tuple(comorbidities_data.get(label, False) for _, label in COMORBIDITY_FLAGS))
+    return cursor.lastrowid
 
-    conn.commit()
-    conn.close()
+
+def _insert_related_rows(cursor, symptom_rows, detail_rows, cv_event_rows):
+    cursor.executemany("""
+        INSERT INTO patient_symptoms (patient_id, symptom, category, present, severity, duration)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, symptom_rows)
+    cursor.executemany("""
+        INSERT INTO comorbidity_details (patient_id, comorbidity_record_id, detail_key, detail_value)
+        VALUES (?, ?, ?, ?)
+    """, detail_rows)
+    cursor.executemany("""
+        INSERT INTO cv_events (patient_id, event_key, event_present)
+        VALUES (?, ?, ?)
+    """, cv_event_rows)
+
+
+def _related_rows(patient_id, comorbidity_record_id, individual_symptoms, comorbidity_details_data, cv_events_data):
+    """Rows for patient_symptoms, comorbidity_details and cv_events"""
+    symptom_rows = [(patient_id, entry['symptom'], entry['category'], True,
+                     entry['severity'], entry['duration'])
+                    for entry in individual_symptoms]
+    detail_rows = [(patient_id, comorbidity_record_id, detail['detail_key'], detail['detail_value'])
+                   for detail in comorbidity_details_data]
+    cv_event_rows = [(patient_id, event_key, event_present)
+                     for event_key, event_present in cv_events_data.items()]
+    return symptom_rows, detail_rows, cv_event_rows
+
+
+def bulk_save_encounters(encounters, batch_size=500):
+    """
+    Saves many encounters, committing once per `batch_size` encounters. Each encounter
+    is a dict with:
+    - patient: Dict keyed by PATIENT_COLUMNS (missing columns are stored as NULL).
+    - consents: Optional (clinical_care, quality_research, ai_training) tuple.
+    - symptoms: Optional list of dicts with keys: symptom, category, severity, duration.
+    - comorbidities: Optional dict of boolean flags keyed by the COMORBIDITY_FLAGS labels.
+    - comorbidity_details: Optional list of dicts with keys: detail_key, detail_value.
+    - cv_events: Optional dict with keys (event name) and boolean values.
+
+    Related rows of a whole batch are written with one executemany per table, and
+    the batch's summary and full-text rows are refreshed once instead of by the
+    per-row triggers (see services/migrations.bulk_insert).
+    Returns the new patient ids, in order.
+    """
+    patient_ids = []
+    batch = []
+    for encounter in encounters:
+        batch.append(encounter)
+        if len(batch) >= batch_size:
+            patient_ids.extend(_save_encounter_batch(batch, bulk=True))
+            batch = []
+    if batch:
+        patient_ids.extend(_save_encounter_batch(batch, bulk=True))
+    return patient_ids
+
+
+def _save_encounter_batch(encounters, bulk=False):
+    audit_rows = []
+    with transaction() as conn:
+        if bulk:
+            with bulk_insert(conn) as patient_ids:
+                _insert_encounters(conn.cursor(), encounters, patient_ids, audit_rows)
+        else:
+            patient_ids = []
+            _insert_encounters(conn.cursor(), encounters, patient_ids, audit_rows)
+
+    get_audit_log().log_many(audit_rows)
+    return patient_ids
+
+
+def _insert_encounters(cursor, encounters, patient_ids, audit_rows):
+    """Insert the encounters, appending the new patient ids and their consent audit rows"""
+    consent_rows = []
+    symptom_rows, detail_rows, cv_event_rows = [], [], []
+
+    for encounter in encounters:
+        patient = encounter['patient']
+        cursor.execute(INSERT_PATIENT_SQL, tuple(
+            patient.get(column) for column in PATIENT_COLUMNS))
+        patient_id = cursor.lastrowid
+        patient_ids.append(patient_id)
+
+        if encounter.get('consents') is not None:
+            audit, consent = _consent_rows(
+                patient_id, *encounter['consents'])
+            audit_rows.extend(audit)
+            consent_rows.append(consent)
+
+        comorbidity_record_id = _insert_comorbidities(
+            cursor, patient_id, encounter.get('comorbidities', {}))
+        symptoms, details, cv_events = _related_rows(
+            patient_id, comorbidity_record_id,
+            encounter.get('symptoms', []),
+            encounter.get('comorbidity_details', []),
+            encounter.get('cv_events', {}))
+        symptom_rows.extend(symptoms)
+        detail_rows.extend(details)
+        cv_event_rows.extend(cv_events)
+
+    _insert_consent_rows(cursor, consent_rows)
+    _insert_related_rows(cursor, symptom_rows, detail_rows, cv_event_rows)
+
+
+def save_encounter(patient, consents=None, individual_symptoms=(), comorbidities_data=None,
+                   comorbidity_details_data=(), cv_events_data=None):
+    """
+    Saves a new patient with their consents, symptoms, comorbidities and CV events
+    in one transaction, so a failure never leaves a half-written patient.
+    `patient` is a dict keyed by PATIENT_COLUMNS. Returns the new patient_id.
+    """
+    return _save_encounter_batch([{
+        'patient': patient,
+        'consents': consents,
+        'symptoms': individual_symptoms,
+        'comorbidities': comorbidities_data or {},
+        'comorbidity_details': comorbidity_details_data,
+        'cv_events': cv_events_data or {}
+    }])[0]
 
 
 def check_consent(patient_id, purpose):
     """Check if a patient has given consent for a specific purpose"""
-    conn = sqlite3.connect("patients.db")
-    cursor = conn.cursor()
+    with connection() as conn:
+        cursor = conn.cursor()
 
-    cursor.execute("""
-        SELECT consent_given, withdrawal_date 
-        FROM patient_consents 
-        WHERE patient_id = ? AND purpose = ?
-        ORDER BY consent_date DESC LIMIT 1
-    """, (patient_id, purpose))
+        cursor.execute("""
+            SELECT consent_given, withdrawal_date 
+            FROM patient_consents 
+            WHERE patient_id = ? AND purpose = ?
+            ORDER BY consent_timestamp DESC, consent_id DESC LIMIT 1
+        """, (patient_id, purpose))
 
-    result = cursor.fetchone()
-    conn.close()
+        result = cursor.fetchone()
 
-    if not result:
-        return False
+        if not result:
+            return False
 
-    consent_given, withdrawal_date = result
-    return consent_given and withdrawal_date is None
+        consent_given, withdrawal_date = result
+        return consent_given and withdrawal_date is None
 
 
 def record_consent(patient_id, purpose, consent_given, consent_text, consent_version):
     """Record a new consent decision"""
-    conn = sqlite3.connect("patients.db")
-    cursor = conn.cursor()
+    with transaction() as conn:
+        cursor = conn.cursor()
 
-    cursor.execute("""
-        INSERT INTO patient_consents 
-        (patient_id, purpose, consent_given, consent_text, consent_version)
-        VALUES (?, ?, ?, ?, ?)
-    """, (patient_id, purpose, consent_given, consent_text, consent_version))
-
-    conn.commit()
-    conn.close()
+        cursor.execute("""
+            INSERT INTO patient_consents 
+            (patient_id, purpose, consent_given, consent_text, consent_version)
+            VALUES (?, ?, ?, ?, ?)
+        """, (patient_id, purpose, consent_given, consent_text, consent_version))
 
 
 def withdraw_consent(patient_id, purpose):
     """Withdraw consent for a specific purpose"""
-    conn = sqlite3.connect("patients.db")
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        UPDATE patient_consents 
-        SET withdrawal_date = CURRENT_TIMESTAMP
-        WHERE patient_id = ? AND purpose = ? AND withdrawal_date IS NULL
-    """, (patient_id, purpose))
+    with transaction() as conn:
+        cursor = conn.cursor()
 
-    conn.commit()
-    conn.close()
+        cursor.execute("""
+            UPDATE patient_consents 
+            SET withdrawal_date = CURRENT_TIMESTAMP
+            WHERE patient_id = ? AND purpose = ? AND withdrawal_date IS NULL
+        """, (patient_id, purpose))
 
 
 def log_consent_action(patient_id, action, purpose, ip_address=None, user_agent=None):
-    """Log consent-related actions for audit purposes"""
-    conn = sqlite3.connect("patients.db")
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        INSERT INTO consent_audit_log 
-        (patient_id, action, purpose, ip_address, user_agent)
-        VALUES (?, ?, ?, ?, ?)
-    """, (patient_id, action, purpose, ip_address, user_agent))
-
-    conn.commit()
-    conn.close()
+    """
+    Log consent-related actions for audit purposes. The event is queued and written
+    in the background (see services/audit_log.py), so this never waits for a commit.
+    """
+    get_audit_log().log(patient_id, action, purpose, ip_address, user_agent)
 
 
 def get_patient_data(patient_id):
     """Get patient data with decryption"""
-    conn = sqlite3.connect("patients.db")
-    cursor = conn.cursor()
+    with connection() as conn:
+        cursor = conn.cursor()
 
-    # Get patient data
-    cursor.execute("""
-        SELECT * FROM patients WHERE patient_id = ?
-    """, (patient_id,))
+        # Get patient data
+        cursor.execute("""
+            SELECT * FROM patients WHERE patient_id = ?
+        """, (patient_id,))
 
-    columns = [description[0] for description in cursor.description]
-    patient_data = dict(zip(columns, cursor.fetchone()))
+        columns = [description[0] for description in cursor.description]
+        patient_data = dict(zip(columns, cursor.fetchone()))
 
-    conn.close()
-    return patient_data
+        return patient_data
 
 
 def get_patient_symptoms(patient_id):
     """Get patient symptoms with decryption"""
-    conn = sqlite3.connect("patients.db")
-    cursor = conn.cursor()
+    with connection() as conn:
+        cursor = conn.cursor()
 
-    cursor.execute("""
-        SELECT * FROM patient_symptoms WHERE patient_id = ?
-    """, (patient_id,))
+        cursor.execute("""
+            SELECT * FROM patient_symptoms WHERE patient_id = ?
+        """, (patient_id,))
 
-    columns = [description[0] for description in cursor.description]
-    symptoms = []
-    for row in cursor.fetchall():
-        symptom_data = dict(zip(columns, row))
-        symptoms.append(symptom_data)
+        columns = [description[0] for description in cursor.description]
+        symptoms = []
+        for row in cursor.fetchall():
+            symptom_data = dict(zip(columns, row))
+            symptoms.append(symptom_data)
 
-    conn.close()
-    return symptoms
+        return symptoms
 
 
 def get_patient_consents(patient_id):
     """Get patient consents with decryption"""
-    conn = sqlite3.connect("patients.db")
-    cursor = conn.cursor()
+    with connection() as conn:
+        cursor = conn.cursor()
 
-    cursor.execute("""
-        SELECT * FROM patient_consents WHERE patient_id = ?
-    """, (patient_id,))
+        cursor.execute("""
+            SELECT * FROM patient_consents WHERE patient_id = ?
+        """, (patient_id,))
+
+        columns = [description[0] for description in cursor.description]
+        consents = []
+        for row in cursor.fetchall():
+            consent_data = dict(zip(columns, row))
+            consents.append(consent_data)
+
+        return consents
+
+
+def get_patient_summary(patient_id):
+    """
+    Get the precomputed summary row of a patient (kept current by triggers):
+    dict with patient_name, age, sex, hf_type, symptoms and comorbidities, or None
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT patient_name, age, sex, hf_type, symptoms, comorbidities
+              FROM patient_summary
+             WHERE patient_id = ?
+        """, (patient_id,))
+        row = cursor.fetchone()
+
+    if not row:
+        return None
+
+    return {
+        "patient_name": row[0],
+        "age": row[1],
+        "sex": row[2],
+        "hf_type": row[3],
+        "symptoms": json.loads(row[4]),
+        "comorbidities": json.loads(row[5])
+    }
+
+
+def get_patient_hf_type(patient_id):
+    """Get the patient's heart failure type, or None"""
+    summary = get_patient_summary(patient_id)
+    return summary["hf_type"] if summary and summary["hf_type"] else None
 
-    columns = [description[0] for description in cursor.description]
-    consents = []
-    for row in cursor.fetchall():
-        consent_data = dict(zip(columns, row))
-        consents.append(consent_data)
 
-    conn.close()
-    return consents
+def get_visual_summary_data(patient_id):
+    """Get (symptoms, comorbidity labels) shown in the visual summary"""
+    summary = get_patient_summary(patient_id)
+    if not summary:
+        return [], []
+    return summary["symptoms"], summary["comorbidities"]
 
 
 def withdraw_consent_and_delete_data(patient_id):
     """Withdraw consent and delete all patient data"""
-    conn = sqlite3.connect("patients.db")
-    cursor = conn.cursor()
-
-    try:
-        # Log the withdrawal action
-        log_consent_action(patient_id, "CONSENT_WITHDRAWN", "CLINICAL_CARE")
-
-        # Delete from all related tables
-        cursor.execute(
-            "DELETE FROM patient_symptoms WHERE patient_id = ?", (patient_id,))
-        cursor.execute(
-            "DELETE FROM patient_comorbidities WHERE patient_id = ?", (patient_id,))
-        cursor.execute(
-            "DELETE FROM comorbidity_details WHERE patient_id = ?", (patient_id,))
-        cursor.execute(
-            "DELETE FROM cv_events WHERE patient_id = ?", (patient_id,))
-        cursor.execute(
-            "DELETE FROM patient_consents WHERE patient_id = ?", (patient_id,))
-        cursor.execute(
-            "DELETE FROM patients WHERE patient_id = ?", (patient_id,))
-
-        conn.commit()
-        return True
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
+    delete_patients([patient_id], "CONSENT_WITHDRAWN", "CLINICAL_CARE")
+    return True
 
 
 # Create the merged table when the module loads
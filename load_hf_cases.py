@@ -0,0 +1,179 @@
+import argparse
+import csv
+import time
+
+from configuration.config import DATABASE_PATH, DATABASE_IMPORT_BATCH_SIZE
+from services.patient_db import set_database_path
+
+# -------------------- Column mapping --------------------
+# heart_failure_cases.csv (written by extract_hf_cases.py) -> patients.db schema
+
+# patients column -> CSV column, converted with float
+PATIENT_FLOAT_COLUMNS = {
+    "height": "Height Cm",
+    "weight": "Weight Kg",
+    "bmi": "Bmi",
+    "oxygen_saturation": "Oxygen Saturation Mean",
+    "bnp": "Bnp Mean",
+    "creatinine": "Creatinine Mean",
+    "potassium": "Potassium Mean",
+    "sodium": "Sodium Mean",
+}
+
+# patients column -> CSV column, rounded to int
+PATIENT_INT_COLUMNS = {
+    "age": "Age",
+    "heart_rate": "Heart Rate Mean",
+    "systolic_bp": "Systolic Bp Mean",
+    "diastolic_bp": "Diastolic Bp Mean",
+    "respiratory_rate": "Respiratory Rate Mean",
+}
+
+# Comorbidity label used by the forms -> CSV column
+COMORBIDITY_COLUMNS = {
+    "Hypertension": "Hypertension",
+    "Diabetes": "Diabetes",
+    "Dyslipidemia": "Dyslipidemia",
+    "Kidney Disease": "Kidney Disease",
+    "Obesity": "Obesity",
+    "Sleep Apnea": "Sleep Apnea",
+}
+
+# Flags without a column of their own, kept as a comorbidity detail
+OTHER_COMORBIDITY_COLUMNS = ["Atrial Fibrillation", "Coronary Artery Disease",
+                             "Peripheral Vascular", "Copd"]
+
+DEVICE_COLUMNS = {"ICD": "Has Icd", "Pacemaker": "Has Pacemaker"}
+
+SEX = {"M": "Male", "F": "Female"}
+
+
+def _value(row, column):
+    value = row.get(column)
+    return value if value not in (None, "") else None
+
+
+def _float(row, column):
+    value = _value(row, column)
+    return float(value) if value is not None else None
+
+
+def _int(row, column):
+    value = _float(row, column)
+    return int(round(value)) if value is not None else None
+
+
+def _flag(row, column):
+    return _value(row, column) == "True"
+
+
+def case_to_encounter(row, copy=0):
+    """
+    Maps one CSV row onto an encounter for form.bulk_save_encounters. `copy` > 0
+    marks duplicated rows when seeding a database with more cases than the file has.
+    """
+    name = f"MIMIC {row['Subject Id']} / {row['Hadm Id']}"
+    if copy:
+        name += f" #{copy}"
+
+    patient = {"patient_name": name, "sex": SEX.get(
+        _value(row, "Gender"), _value(row, "Gender"))}
+    for column, csv_column in PATIENT_FLOAT_COLUMNS.items():
+        patient[column] = _float(row, csv_column)
+    for column, csv_column in PATIENT_INT_COLUMNS.items():
+        patient[column] = _int(row, csv_column)
+
+    # MIMIC charts temperature in Fahrenheit, the form records Celsius
+    temperature = _float(row, "Temperature Mean")
+    if temperature is not None:
+        patient["temperature"] = round((temperature - 32) * 5 / 9, 1)
+
+    patient["hf_type"] = _value(row, "Hf Type")
+    patient["nyha"] = _value(row, "Nyha")
+    patient["anemia_present"] = _flag(row, "Anemia")
+    patient["medications"] = _value(row, "Medications")
+    devices = [device for device, column in DEVICE_COLUMNS.items()
+               if _flag(row, column)]
+    patient["devices"] = ",".join(devices) if devices else None
+
+    comorbidities = {label: _flag(row, column)
+                     for label, column in COMORBIDITY_COLUMNS.items()}
+
+    other = [column for column in OTHER_COMORBIDITY_COLUMNS if _flag(row, column)]
+    comorbidity_details = []
+    if other:
+        comorbidity_details.append(
+            {"detail_key": "Other Comorbidities", "detail_value": ", ".join(other)})
+
+    cv_events = {
+        # Every case is a heart failure admission
+        "Hospitalization for HF": True,
+        "PCI / CABG": _flag(row, "Has Pci") or _flag(row, "Has Cabg"),
+        "Stroke": _flag(row, "Stroke"),
+    }
+
+    return {
+        "patient": patient,
+        "comorbidities": comorbidities,
+        "comorbidity_details": comorbidity_details,
+        "cv_events": cv_events,
+    }
+
+
+def iter_encounters(csv_paths, repeat=1):
+    """Streams encounters from the CSV files row by row, `repeat` times over."""
+    for copy in range(repeat):
+        for csv_path in csv_paths:
+            with open(csv_path, newline="", encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    yield case_to_encounter(row, copy)
+
+
+def load_cases(csv_paths, batch_size=DATABASE_IMPORT_BATCH_SIZE, repeat=1):
+    """
+    Imports the cases into the current patients database, one transaction per
+    `batch_size` rows, printing progress. Returns (rows imported, seconds taken).
+    """
+    from form import bulk_save_encounters
+
+    start = time.time()
+    imported = 0
+    batch = []
+
+    def flush():
+        nonlocal imported
+        imported += len(bulk_save_encounters(batch, batch_size))
+        elapsed = time.time() - start
+        print(f"  {imported} rows ({imported / elapsed:.0f} rows/s)")
+
+    for encounter in iter_encounters(csv_paths, repeat):
+        batch.append(encounter)
+        if len(batch) >= batch_size:
+            flush()
+            batch = []
+    if batch:
+        flush()
+
+    return imported, time.time() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Import heart_failure_cases.csv into the patients database")
+    parser.add_argument("csv_paths", nargs="*", default=["heart_failure_cases.csv"],
+                        help="CSV files written by extract_hf_cases.py")
+    parser.add_argument("--db", default=DATABASE_PATH,
+                        help="database to import into, e.g. a staging copy")
+    parser.add_argument("--batch-size", type=int, default=DATABASE_IMPORT_BATCH_SIZE,
+                        help="rows per transaction")
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="import every row this many times, to seed load tests")
+    args = parser.parse_args()
+
+    # Point the pool at the target before form.py creates/migrates the tables on import
+    set_database_path(args.db)
+
+    print(f"Importing {', '.join(args.csv_paths)} into {args.db}...")
+    imported, elapsed = load_cases(args.csv_paths, args.batch_size, args.repeat)
+    print(f"✅ Imported {imported} rows in {elapsed:.2f}s "
+          f"({imported / elapsed:.0f} rows/s)")
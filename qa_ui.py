@@ -1,7 +1,7 @@
 import streamlit as st
-import sqlite3
-from form import save_patient, save_patient_data, save_consent, withdraw_consent_and_delete_data, log_consent_action
+from form import PATIENT_COLUMNS, save_encounter, withdraw_consent_and_delete_data, log_consent_action, get_patient_hf_type, get_visual_summary_data
 from services.chatbot_service import chat_interface
+from services.patient_search import list_hf_types, search_patients
 from visual_summary_utilities import show_visual_summary
 from datetime import datetime
 
@@ -218,36 +218,24 @@ if mode == "Patient":
         # -------------------- Submit --------------------
         if st.button("Submit Patient Form"):
             try:
-                # Step 1: Save patient core info
-                patient_id = save_patient(
-                    patient_name, age, sex, height, weight, bmi,
-                    heart_rate, rhythm, systolic_bp, diastolic_bp, respiratory_rate,
-                    oxygen_saturation, temperature, None, None, None, None, None, None, None, None, None,
-                    hf_type, None, None, None, None,
-                    symptom_triggers_str if symptom_triggers_str else None,
-                    other_trigger_detail, impact,
-                    alcohol, alcohol_frequency,
-                    smoking, smoking_packs, smoking_duration, activity,
-                    medications_str, other_meds,
-                    None, None, None,  # Labs (creatinine, potassium, sodium)
-                    # Anemia related (anemia_status, anemia_present, iron_supplement, ferritin_issue)
-                    None, None, None, None,
-                    # Functional assessment (walk_test, vo2_max, devices_str)
-                    None, None, None,
-                    # Diagnostics (ecg, echo_str, echo_other)
-                    None, None, None,
-                    # Additional diagnostics (ca_findings, ca_other_details, mri_findings, mri_other_details)
-                    None, None, None, None,
-                    # More diagnostics (holter_findings, holter_other_details)
-                    None, None,
-                    None  # Follow-up plan
-                )
-
-                # Step 2: Save consent data
-                save_consent(patient_id, clinical_care_consent,
-                             quality_research_consent, ai_training_consent)
+                # Step 1: Patient core info
+                patient = {
+                    "patient_name": patient_name, "age": age, "sex": sex,
+                    "height": height, "weight": weight, "bmi": bmi,
+                    "heart_rate": heart_rate, "rhythm": rhythm,
+                    "systolic_bp": systolic_bp, "diastolic_bp": diastolic_bp,
+                    "respiratory_rate": respiratory_rate,
+                    "oxygen_saturation": oxygen_saturation, "temperature": temperature,
+                    "hf_type": hf_type,
+                    "symptom_triggers": symptom_triggers_str if symptom_triggers_str else None,
+                    "other_trigger_detail": other_trigger_detail, "daily_impact": impact,
+                    "alcohol": alcohol, "alcohol_frequency": alcohol_frequency,
+                    "smoking": smoking, "smoking_packs": smoking_packs,
+                    "smoking_duration": smoking_duration, "activity": activity,
+                    "medications": medications_str, "other_meds": other_meds
+                }
 
-                # Step 3: Save comorbidities (flags)
+                # Step 2: Comorbidities (flags)
                 patient_comorbidities_data = {
                     "Hypertension": hypertension,
                     "Diabetes": diabetes,
@@ -258,7 +246,7 @@ if mode == "Patient":
                     "Family History of Heart Disease": family_history
                 }
 
-                # Step 4: Save comorbidity details
+                # Step 3: Comorbidity details
                 patient_comorbidity_details = []
                 if diabetes_type:
                     patient_comorbidity_details.append(
@@ -270,9 +258,11 @@ if mode == "Patient":
                     patient_comorbidity_details.append(
                         {"detail_key": "BMI Classification", "detail_value": bmi_category})
 
-                # Step 5: Insert into related tables
-                save_patient_data(
-                    patient_id,
+                # Step 4: Save everything in one transaction
+                patient_id = save_encounter(
+                    patient,
+                    (clinical_care_consent, quality_research_consent,
+                     ai_training_consent),
                     patient_individual_symptoms,
                     patient_comorbidities_data,
                     patient_comorbidity_details,
@@ -872,8 +862,8 @@ elif mode == "Doctor":
 
             if st.button("Submit Patient Form"):
                 try:
-                    # Step 1: Save patient core info
-                    patient_id = save_patient(
+                    # Step 1: Patient core info, in PATIENT_COLUMNS order
+                    patient = dict(zip(PATIENT_COLUMNS, (
                         patient_name, age, sex, height, weight, bmi,
                         heart_rate, rhythm, systolic_bp, diastolic_bp, respiratory_rate,
                         oxygen_saturation, temperature, edema_locations_str, edema_grade, jvp,
@@ -895,13 +885,9 @@ elif mode == "Doctor":
                         mri_findings_str, mri_other_details,
                         holter_findings_str, holter_other_details,
                         follow_plan
-                    )
-
-                    # Step 2: Save consent data
-                    save_consent(patient_id, clinical_care_consent,
-                                 quality_research_consent, ai_training_consent)
+                    )))
 
-                    # Step 3: Prepare data for related tables
+                    # Step 2: Prepare data for related tables
                     # Symptoms (already structured as individual_symptoms)
                     # Example:
                     # individual_symptoms = [{"symptom": "Dyspnea", "severity": 4, "duration": "Chronic", "category": "Cardiopulmonary"}, ...]
@@ -975,9 +961,11 @@ elif mode == "Doctor":
                         "Cardiogenic shock": cv_event_shock
                     }
 
-                    # Step 4: Insert related data
-                    save_patient_data(
-                        patient_id,
+                    # Step 3: Save everything in one transaction
+                    patient_id = save_encounter(
+                        patient,
+                        (clinical_care_consent, quality_research_consent,
+                         ai_training_consent),
                         individual_symptoms,
                         comorbidities_data,
                         comorbidity_details_data,
@@ -1103,53 +1091,8 @@ elif mode == "Doctor":
                 if st.session_state.get('show_visual_summary') and st.session_state.get('hf_type_structural'):
                     try:
                         # Get patient's symptoms and comorbidities
-                        conn = sqlite3.connect("patients.db")
-                        cursor = conn.cursor()
-
-                        # Get symptoms
-                        cursor.execute("""
-                            SELECT DISTINCT symptom FROM patient_symptoms 
-                            WHERE patient_id = ?
-                        """, (st.session_state['patient_id'],))
-                        symptoms = [row[0] for row in cursor.fetchall()]
-
-                        # Get comorbidities
-                        cursor.execute("""
-                            SELECT hypertension,
-                                   diabetes,
-                                   dyslipidemia,
-                                   kidney_disease,
-                                   obesity,
-                                   sleep_apnea,
-                                   family_history
-                              FROM patient_comorbidities
-                             WHERE patient_id = ?
-                        """, (st.session_state['patient_id'],))
-                        row = cursor.fetchone()
-
-                        # column-names mapped to human-readable labels
-                        label_map = [
-                            ("Hypertension",
-                             row[0] if row else False),
-                            ("Diabetes",
-                             row[1] if row else False),
-                            ("Dyslipidemia",
-                             row[2] if row else False),
-                            ("Kidney Disease",
-                             row[3] if row else False),
-                            ("Obesity",
-                             row[4] if row else False),
-                            ("Sleep Apnea",
-                             row[5] if row else False),
-                            ("Family History of Heart Disease",
-                             row[6] if row else False),
-                        ]
-
-                        # build a simple list of only the True ones
-                        comorbidities = [label for label,
-                                         present in label_map if present]
-
-                        conn.close()
+                        symptoms, comorbidities = get_visual_summary_data(
+                            st.session_state['patient_id'])
 
                         show_visual_summary(
                             hf_types=[st.session_state['hf_type_structural']
@@ -1159,51 +1102,64 @@ elif mode == "Doctor":
                         )
                     except Exception as e:
                         st.error(f"Error loading patient data: {str(e)}")
-                        conn.close()
                 elif st.session_state.get('show_visual_summary'):
                     st.info(
                         "No heart failure type information available for this patient.")
 
     elif doctor_action == "Choose Existing Patient":
-        # Connect to database
-        conn = sqlite3.connect("patients.db")
-        cursor = conn.cursor()
-
-        # Get all patients
-        cursor.execute(
-            "SELECT patient_id, patient_name, age, sex FROM patients ORDER BY patient_id DESC")
-        patients = cursor.fetchall()
-        conn.close()
+        # -------------------- Patient Search --------------------
+        search_cols = st.columns(4)
+        name_prefix = search_cols[0].text_input("Search by name")
+        sex_filter = search_cols[1].selectbox(
+            "Sex", [None, "Male", "Female", "Other"], key="search_sex",
+            format_func=lambda value: value or "Any")
+        hf_type_filter = search_cols[2].selectbox(
+            "HF type", [None] + list_hf_types(), key="search_hf_type",
+            format_func=lambda value: value or "Any")
+        age_range = search_cols[3].slider(
+            "Age", 0, 120, (0, 120), key="search_age")
+
+        # Start again from the first page whenever the filters change
+        search_filters = (name_prefix, sex_filter, hf_type_filter, age_range)
+        if st.session_state.get('patient_search_filters') != search_filters:
+            st.session_state['patient_search_filters'] = search_filters
+            st.session_state['patient_page_keys'] = [None]
+        page_keys = st.session_state['patient_page_keys']
+
+        # Only the current page is fetched and rendered
+        patients, next_after_id = search_patients(
+            name_prefix, sex_filter, hf_type_filter,
+            min_age=age_range[0] if age_range[0] > 0 else None,
+            max_age=age_range[1] if age_range[1] < 120 else None,
+            after_id=page_keys[-1])
+
+        prev_col, page_col, next_col = st.columns([1, 2, 1])
+        if prev_col.button("◀ Previous", disabled=len(page_keys) == 1):
+            page_keys.pop()
+            st.rerun()
+        page_col.write(f"Page {len(page_keys)}")
+        if next_col.button("Next ▶", disabled=next_after_id is None):
+            page_keys.append(next_after_id)
+            st.rerun()
 
         if not patients:
-            st.warning("No existing patients found in the database.")
+            st.warning("No existing patients match the search.")
         else:
-            # Create a list of patient options with formatted display
-            patient_options = [
-                f"ID: {p[0]} - {p[1]} (Age: {p[2]}, Sex: {p[3]})" for p in patients]
-
-            # Show patient selection dropdown
-            selected_patient = st.selectbox(
-                "Select a patient:", patient_options)
-
-            if selected_patient:
-                # Extract patient ID from selection
-                patient_id = int(selected_patient.split(" - ")
-                                 [0].split(": ")[1])
-
+            # Show patient selection dropdown; options are the patient ids themselves
+            patients_by_id = {p[0]: p for p in patients}
+            patient_id = st.selectbox(
+                "Select a patient:", list(patients_by_id),
+                format_func=lambda pid: "ID: {} - {} (Age: {}, Sex: {})".format(
+                    *patients_by_id[pid][:4]))
+
+            if patient_id:
                 # Store patient ID in session state
                 st.session_state['patient_id'] = patient_id
 
                 # Get patient's heart failure type for visual summary
-                conn = sqlite3.connect("patients.db")
-                cursor = conn.cursor()
-                cursor.execute(
-                    "SELECT hf_type FROM patients WHERE patient_id = ?", (patient_id,))
-                hf_type_result = cursor.fetchone()
-                conn.close()
-
-                # Store hf_type in session state, default to None if not found
-                hf_type = hf_type_result[0] if hf_type_result and hf_type_result[0] else None
+                hf_type = get_patient_hf_type(patient_id)
+
+                # Store hf_type in session state (None if not found)
                 st.session_state['hf_type_structural'] = hf_type
 
                 # Initialize show_visual_summary if not already set
@@ -1230,49 +1186,8 @@ elif mode == "Doctor":
                         if st.session_state.get('hf_type_structural'):
                             try:
                                 # Get patient's symptoms and comorbidities
-                                conn = sqlite3.connect("patients.db")
-                                cursor = conn.cursor()
-
-                                # Get symptoms
-                                cursor.execute("""
-                                    SELECT DISTINCT symptom FROM patient_symptoms 
-                                    WHERE patient_id = ?
-                                """, (patient_id,))
-                                symptoms = [row[0]
-                                            for row in cursor.fetchall()]
-
-                                # Get comorbidities
-                                cursor.execute("""
-                                    SELECT hypertension,
-                                           diabetes,
-                                           dyslipidemia,
-                                           kidney_disease,
-                                           obesity,
-                                           sleep_apnea,
-                                           family_history
-                                      FROM patient_comorbidities
-                                     WHERE patient_id = ?
-                                """, (patient_id,))
-                                row = cursor.fetchone()
-
-                                # column-names mapped to human-readable labels
-                                label_map = [
-                                    ("Hypertension", row[0] if row else False),
-                                    ("Diabetes", row[1] if row else False),
-                                    ("Dyslipidemia", row[2] if row else False),
-                                    ("Kidney Disease",
-                                     row[3] if row else False),
-                                    ("Obesity", row[4] if row else False),
-                                    ("Sleep Apnea", row[5] if row else False),
-                                    ("Family History of Heart Disease",
-                                     row[6] if row else False),
-                                ]
-
-                                # build a simple list of only the True ones
-                                comorbidities = [label for label,
-                                                 present in label_map if present]
-
-                                conn.close()
+                                symptoms, comorbidities = get_visual_summary_data(
+                                    patient_id)
 
                                 # Convert hf_type to list format
                                 hf_type = st.session_state['hf_type_structural']
@@ -1285,7 +1200,6 @@ elif mode == "Doctor":
                             except Exception as e:
                                 st.error(
                                     f"Error loading patient data: {str(e)}")
-                                conn.close()
                         else:
                             st.info(
                                 "No heart failure type information available for this patient.")
@@ -0,0 +1,128 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+
+import numpy as np
+
+from services.embedding_cache import normalize_text
+
+
+def _plain(value):
+    # Snapshots are read-only mappings, which json cannot serialize directly
+    return dict(value) if isinstance(value, Mapping) else str(value)
+
+
+def patient_fingerprint(patient_data):
+    """Hash of everything known about a patient; any change to their rows changes it."""
+    raw = json.dumps(patient_data, sort_keys=True, default=_plain)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """
+    In-memory cache of chatbot answers.
+
+    Answers are grouped by (patient id, patient-data fingerprint, mode, retrieved chunk
+    ids). Inside a group, a question hits either on its normalized text or when its
+    embedding is within `similarity_threshold` cosine similarity of a cached question.
+    Entries expire after `ttl_seconds` (expired ones are swept on every store), and the
+    least recently used entries are dropped beyond `max_entries`. When a patient's
+    fingerprint changes, all their entries go.
+    """
+
+    def __init__(self, max_entries, ttl_seconds, similarity_threshold):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+
+        # (group, normalized question) -> (answer, unit question vector, expiry time)
+        self._entries = OrderedDict()
+        self._groups = {}
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+
+    def _group(self, patient_id, patient_data, mode, chunk_ids):
+        patient_id = str(patient_id)
+        fingerprint = patient_fingerprint(patient_data)
+        if self._fingerprints.get(patient_id) != fingerprint:
+            # The patient's rows changed since their answers were cached
+            self._drop_patient(patient_id)
+            self._fingerprints[patient_id] = fingerprint
+        return (patient_id, fingerprint, mode, tuple(chunk_ids))
+
+    def _drop(self, key):
+        self._entries.pop(key, None)
+        keys = self._groups.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._groups[key[0]]
+
+    def _drop_patient(self, patient_id):
+        for group in [g for g in self._groups if g[0] == patient_id]:
+            for key in list(self._groups.get(group, ())):
+                self._drop(key)
+        self._fingerprints.pop(patient_id, None)
+
+    @staticmethod
+    def _unit(vector):
+        if vector is None:
+            return None
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, patient_id, patient_data, mode, question, chunk_ids, question_vector=None):
+        """Returns a cached answer for this question, or None."""
+        now = time.time()
+        with self._lock:
+            group = self._group(patient_id, patient_data, mode, chunk_ids)
+            key = (group, normalize_text(question).lower())
+
+            if key not in self._entries and question_vector is not None:
+                # Fall back to the most similar cached question in the group
+                vector = self._unit(question_vector)
+                best_score = self.similarity_threshold
+                for candidate in self._groups.get(group, ()):
+                    candidate_vector = self._entries[candidate][1]
+                    if candidate_vector is None:
+                        continue
+                    score = float(np.dot(vector, candidate_vector))
+                    if score >= best_score:
+                        key, best_score = candidate, score
+
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[2] < now:
+                self._drop(key)
+                return None
+
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def store(self, patient_id, patient_data, mode, question, chunk_ids, answer, question_vector=None):
+        """Caches an answer, evicting expired and least recently used entries."""
+        with self._lock:
+            now = time.time()
+            for expired in [key for key, entry in self._entries.items() if entry[2] < now]:
+                self._drop(expired)
+
+            group = self._group(patient_id, patient_data, mode, chunk_ids)
+            key = (group, normalize_text(question).lower())
+
+            self._entries[key] = (answer, self._unit(question_vector),
+                                  now + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            self._groups.setdefault(group, set()).add(key)
+
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate_patient(self, patient_id):
+        """Drops every cached answer for a patient."""
+        with self._lock:
+            self._drop_patient(str(patient_id))
@@ -0,0 +1,180 @@
+import asyncio
+import time
+
+from configuration.config import CHATBOT_MODEL_NAME
+from services.chatbot_service import ChatbotBase
+from services.patient_snapshot import load_patient_snapshot
+from services.resources import create_async_llm_client, get_answer_cache, get_collection, get_embedder, get_embedding_cache
+
+
+class AsyncChatbotService(ChatbotBase):
+    """
+    asyncio variant of ChatbotService that serves many sessions from one event loop.
+
+    Guidelines are retrieved for the same patient context as ChatbotService, so a
+    turn loads the snapshot, embeds the context and question in one batch and then
+    searches. The snapshot query, the embedder and Milvus are blocking, so they run
+    in worker threads while other sessions' turns proceed on the loop. Groq is called
+    through AsyncGroq, which uses a pooled httpx.AsyncClient that is shared by every
+    request on the loop.
+
+    Run this module to put several concurrent sessions through one service.
+    """
+
+    def __init__(self, max_connections=100):
+        self.collection = get_collection()
+        self.embedder = get_embedder()
+        self.embedding_cache = get_embedding_cache()
+        self.answer_cache = get_answer_cache()
+        self.client = create_async_llm_client(max_connections)
+
+    async def get_patient_data(self, patient_id):
+        """Retrieve all patient data without blocking the event loop"""
+        return await asyncio.to_thread(load_patient_snapshot, patient_id)
+
+    async def search_context(self, context_query, user_query, top_k=5):
+        """
+        Embed the context and question in one batch and search on the context,
+        without blocking the event loop. Returns (search_results, question_vector).
+        """
+        context_vector, question_vector = await asyncio.to_thread(
+            self.embed_queries, context_query, user_query)
+        search_results = (await asyncio.to_thread(
+            self.search_guidelines_vectors, [context_vector], top_k))[0]
+        return search_results, question_vector
+
+    async def prepare(self, patient_id, user_query, mode):
+        """
+        Load the patient, search guidelines on the patient context and build the prompt.
+        Returns (patient_data, search_results, question_vector, messages), or an
+        error message string.
+        """
+        patient_data = await self.get_patient_data(patient_id)
+        if not patient_data:
+            # Possibly erased by another process: drop anything still cached for them
+            self.answer_cache.invalidate_patient(patient_id)
+            return "Patient not found. Please check the patient ID."
+
+        if mode == "Doctor":
+            context_query = self.build_doc_context(patient_data, user_query)
+        else:
+            context_query = self.build_patient_context(
+                patient_data, user_query)
+
+        search_results, question_vector = await self.search_context(
+            context_query, user_query)
+
+        if mode == "Doctor":
+            user_message = self.build_doc_message(context_query, search_results)
+        else:
+            user_message = self.build_patient_message(
+                context_query, search_results)
+
+        messages = [
+            {"role": "system", "content": self.system_message},
+            {"role": "user", "content": user_message}
+        ]
+        return patient_data, search_results, question_vector, messages
+
+    def lookup_cached_answer(self, patient_id, patient_data, mode, user_query, question_vector, search_results):
+        """Return the cached answer for this turn, or None"""
+        chunk_ids = [hit.id for hit in search_results]
+        return self.answer_cache.lookup(
+            patient_id, patient_data, mode, user_query, chunk_ids, question_vector)
+
+    async def generate_response(self, patient_id, user_query, mode="Patient"):
+        """Generate a response based on patient data and guidelines"""
+        prepared = await self.prepare(patient_id, user_query, mode)
+        if isinstance(prepared, str):
+            return prepared
+        patient_data, search_results, question_vector, messages = prepared
+
+        cached_answer = self.lookup_cached_answer(
+            patient_id, patient_data, mode, user_query, question_vector, search_results)
+        if cached_answer is not None:
+            return cached_answer
+
+        try:
+            chat_completion = await self.client.chat.completions.create(
+                messages=messages,
+                model=CHATBOT_MODEL_NAME
+            )
+            answer = chat_completion.choices[0].message.content
+        except Exception as e:
+            return f"Error generating response: {str(e)}"
+
+        self.answer_cache.store(patient_id, patient_data, mode, user_query,
+                                [hit.id for hit in search_results], answer, question_vector)
+        return answer
+
+    async def stream_response(self, patient_id, user_query, mode="Patient"):
+        """Async generator yielding answer tokens as they arrive from Groq"""
+        prepared = await self.prepare(patient_id, user_query, mode)
+        if isinstance(prepared, str):
+            yield prepared
+            return
+        patient_data, search_results, question_vector, messages = prepared
+
+        cached_answer = self.lookup_cached_answer(
+            patient_id, patient_data, mode, user_query, question_vector, search_results)
+        if cached_answer is not None:
+            yield cached_answer
+            return
+
+        pieces = []
+        try:
+            chat_stream = await self.client.chat.completions.create(
+                messages=messages,
+                model=CHATBOT_MODEL_NAME,
+                stream=True
+            )
+            async for chunk in chat_stream:
+                piece = chunk.choices[0].delta.content if chunk.choices else None
+                if piece:
+                    pieces.append(piece)
+                    yield piece
+        except Exception as e:
+            yield f"Error generating response: {str(e)}"
+            return
+
+        self.answer_cache.store(patient_id, patient_data, mode, user_query,
+                                [hit.id for hit in search_results], "".join(pieces), question_vector)
+
+    async def close(self):
+        """Close the pooled HTTP connections of the LLM client"""
+        await self.client.close()
+
+
+async def ask_concurrently(patient_id, user_query, mode="Patient", sessions=1):
+    """Answer the same question in `sessions` concurrent turns; returns (answers, seconds)"""
+    service = AsyncChatbotService(max_connections=sessions)
+    try:
+        start = time.perf_counter()
+        answers = await asyncio.gather(*[
+            service.generate_response(patient_id, user_query, mode)
+            for _ in range(sessions)])
+        return answers, time.perf_counter() - start
+    finally:
+        await service.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from services.patient_db import set_database_path
+    from configuration.config import DATABASE_PATH
+
+    parser = argparse.ArgumentParser(
+        description="Ask the chatbot about a patient from concurrent async sessions")
+    parser.add_argument("patient_id", type=int)
+    parser.add_argument("question")
+    parser.add_argument("--mode", choices=["Patient", "Doctor"], default="Patient")
+    parser.add_argument("--sessions", type=int, default=1)
+    parser.add_argument("--db", default=DATABASE_PATH)
+    args = parser.parse_args()
+
+    set_database_path(args.db)
+    answers, seconds = asyncio.run(ask_concurrently(
+        args.patient_id, args.question, args.mode, args.sessions))
+    print(answers[0])
+    print(f"{args.sessions} sessions answered in {seconds:.2f} s")
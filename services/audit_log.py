@@ -0,0 +1,293 @@
+import atexit
+import base64
+import json
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+from configuration.config import AUDIT_LOG_QUEUE_SIZE, AUDIT_LOG_BATCH_SIZE, AUDIT_LOG_FLUSH_INTERVAL, AUDIT_LOG_SPILL_PATH
+from services.patient_db import transaction
+
+INSERT_AUDIT_SQL = """
+    INSERT INTO consent_audit_log
+    (patient_id, action, purpose, timestamp, ip_address, user_agent)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+
+# SQLite result codes worth retrying: another connection holds the lock
+_TRANSIENT_ERRORS = {sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED}
+
+
+def _is_transient(error):
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    code = getattr(error, "sqlite_errorcode", None)
+    if code is not None:
+        return code & 0xFF in _TRANSIENT_ERRORS
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+
+# Python types sqlite3 can bind as a column value
+_BINDABLE = (type(None), int, float, str, bytes)
+
+
+def validate_event(patient_id, action, purpose, ip_address=None, user_agent=None):
+    """Raises ValueError for an event consent_audit_log would reject"""
+    event = {"patient_id": patient_id, "action": action, "purpose": purpose,
+             "ip_address": ip_address, "user_agent": user_agent}
+    for name, value in event.items():
+        if not isinstance(value, _BINDABLE):
+            raise ValueError(f"Audit event {name} cannot be stored: {value!r}")
+    for name in ("action", "purpose"):
+        if event[name] is None:
+            raise ValueError(f"Audit event {name} is required")
+
+
+class AuditLogError(Exception):
+    """Audit events could not be written to the database; they are kept for replay."""
+
+
+def _encode_value(value):
+    # bytes are the one bindable type JSON cannot hold
+    return {"base64": base64.b64encode(value).decode("ascii")} if isinstance(value, bytes) else value
+
+
+def _decode_value(value):
+    return base64.b64decode(value["base64"]) if isinstance(value, dict) else value
+
+
+def utc_timestamp():
+    """Current time in the format of SQLite's CURRENT_TIMESTAMP"""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class AuditLogWriter:
+    """
+    Background writer for consent_audit_log.
+
+    log() only enqueues the event (stamped with the time it happened), so callers
+    never wait for a commit. A daemon thread drains the queue and writes up to
+    `batch_size` events per transaction. The queue is bounded: when the writer falls
+    behind, log() blocks until there is room instead of dropping events. Events
+    are validated before they are queued. A batch failing on a locked database is
+    retried; any other error is retried row by row, so one event the database
+    rejects does not hold up the rest.
+
+    Events the database still rejects (disk full, read-only file, ...) are never
+    dropped: they are appended to the `spill_path` JSON-lines file (fsynced) and
+    replayed with exponential backoff, at startup and on flush(). flush() raises
+    AuditLogError while any event remains unwritten. close() (registered with
+    atexit) drains the queue before the process exits.
+    """
+
+    RETRY_SECONDS = 1.0
+    MAX_REPLAY_SECONDS = 60.0
+
+    def __init__(self, max_queue=10000, batch_size=500, flush_interval=0.2, spill_path=None):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+
+        # Events the database rejected, in memory and (when possible) in spill_path
+        self._failed = self._read_spill()
+        self._last_error = None
+        self._replay_delay = self.RETRY_SECONDS
+        self._next_replay = 0.0
+        self._failed_lock = threading.Lock()
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="audit-log-writer", daemon=True)
+        self._thread.start()
+
+    def log(self, patient_id, action, purpose, ip_address=None, user_agent=None):
+        """Queue one audit event; blocks only while the queue is full."""
+        validate_event(patient_id, action, purpose, ip_address, user_agent)
+        self._queue.put((patient_id, action, purpose, utc_timestamp(),
+                         ip_address, user_agent))
+
+    def log_many(self, events):
+        """Queue (patient_id, action, purpose, ip_address, user_agent) events."""
+        events = list(events)
+        for event in events:
+            validate_event(*event)
+        timestamp = utc_timestamp()
+        for patient_id, action, purpose, ip_address, user_agent in events:
+            self._queue.put((patient_id, action, purpose, timestamp,
+                             ip_address, user_agent))
+
+    def _next_batch(self):
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _insert(self, rows):
+        # Keep retrying while the database is busy; other errors go to the caller
+        while True:
+            try:
+                with transaction() as conn:
+                    conn.executemany(INSERT_AUDIT_SQL, rows)
+                return
+            except Exception as e:
+                if not _is_transient(e):
+                    raise
+                print(f"Audit log write failed ({e}), retrying...",
+                      file=sys.stderr)
+                time.sleep(self.RETRY_SECONDS)
+
+    def _insert_each(self, events):
+        """Insert the events, row by row if the batch is rejected; returns (failed, error)"""
+        try:
+            self._insert(events)
+            return [], None
+        except Exception as e:
+            if len(events) == 1:
+                return list(events), e
+            print(f"Audit log batch rejected ({e}), writing it row by row",
+                  file=sys.stderr)
+
+        failed, error = [], None
+        for event in events:
+            try:
+                self._insert([event])
+            except Exception as e:
+                failed.append(event)
+                error = e
+        return failed, error
+
+    # -------------------- Spill file --------------------
+
+    def _read_spill(self):
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return []
+        events = []
+        with open(self.spill_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    events.append(tuple(_decode_value(value)
+                                        for value in json.loads(line)))
+                except ValueError:
+                    # Only a write cut short by a crash leaves a partial line
+                    if line.strip():
+                        print(f"Audit log spill file has an unreadable line: {line!r}",
+                              file=sys.stderr)
+        return events
+
+    def _write_spill(self, events, replace=False):
+        """Append events to spill_path durably, or atomically replace its contents"""
+        if not self.spill_path:
+            return
+        path = self.spill_path + ".tmp" if replace else self.spill_path
+        try:
+            with open(path, "w" if replace else "a", encoding="utf-8") as f:
+                for event in events:
+                    f.write(json.dumps([_encode_value(value) for value in event]) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            if replace:
+                os.replace(path, self.spill_path)
+        except OSError as e:
+            print(f"Audit log spill file {self.spill_path} not writable ({e}); "
+                  f"{len(self._failed)} events held in memory", file=sys.stderr)
+
+    def _keep(self, events, error):
+        """Hold on to events the database rejected until a replay writes them"""
+        with self._failed_lock:
+            self._failed.extend(events)
+            self._last_error = error
+            self._next_replay = time.time() + self._replay_delay
+            print(f"Audit log could not write {len(events)} events ({error}); "
+                  f"kept for replay", file=sys.stderr)
+            self._write_spill(events)
+
+    def _replay(self):
+        """Try to write the kept events again; returns how many are still unwritten"""
+        with self._failed_lock:
+            if not self._failed:
+                return 0
+
+            failed, error = self._insert_each(self._failed)
+            if failed:
+                self._last_error = error
+                self._replay_delay = min(self._replay_delay * 2, self.MAX_REPLAY_SECONDS)
+                self._next_replay = time.time() + self._replay_delay
+                # Also restores anything an earlier append could not save
+                self._write_spill(failed, replace=True)
+            else:
+                self._replay_delay = self.RETRY_SECONDS
+                if self.spill_path and os.path.exists(self.spill_path):
+                    os.remove(self.spill_path)
+            self._failed = failed
+            return len(failed)
+
+    def _write(self, batch):
+        failed, error = self._insert_each(batch)
+        if failed:
+            self._keep(failed, error)
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._write(batch)
+                for _ in batch:
+                    self._queue.task_done()
+            if self._failed and time.time() >= self._next_replay:
+                self._replay()
+
+    def flush(self):
+        """
+        Block until every event queued so far is committed. Raises AuditLogError if
+        some events could not be written (they stay kept for replay).
+        """
+        self._queue.join()
+        unwritten = self._replay()
+        if unwritten:
+            raise AuditLogError(
+                f"{unwritten} audit events not written ({self._last_error}); "
+                f"kept in {self.spill_path or 'memory'} for replay")
+
+    def close(self, timeout=30):
+        """Write out the remaining events and stop the writer thread."""
+        self._stopping.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            print(f"Audit log writer did not finish; {self._queue.qsize()} events "
+                  f"still queued", file=sys.stderr)
+        unwritten = self._replay()
+        if unwritten:
+            where = (f"kept in {self.spill_path} and replayed on next start"
+                     if self.spill_path else "lost: no spill file configured")
+            print(f"Audit log: {unwritten} events not written ({self._last_error}); "
+                  f"{where}", file=sys.stderr)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_audit_log():
+    """Process-wide audit log writer, started on first use and drained at exit."""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = AuditLogWriter(
+                    AUDIT_LOG_QUEUE_SIZE, AUDIT_LOG_BATCH_SIZE, AUDIT_LOG_FLUSH_INTERVAL,
+                    AUDIT_LOG_SPILL_PATH)
+                atexit.register(_writer.close)
+    return _writer
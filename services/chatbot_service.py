@@ -1,108 +1,39 @@
 import streamlit as st
-import sqlite3
-from pymilvus import connections, Collection
-from sentence_transformers import SentenceTransformer
-from configuration.config import EMBEDDING_MODEL, MILVUS_HOST, MILVUS_PORT, COLLECTION_NAME, CHATBOT_MODEL_NAME
-import httpx
+from configuration.config import CHATBOT_MODEL_NAME
+from services.patient_snapshot import load_patient_snapshot, snapshot_scope
+from services.resources import get_answer_cache, get_collection, get_embedder, get_embedding_cache, get_llm_client
 
 
-class ChatbotService:
-    def __init__(self):
-        # Initialize Milvus connection
-        connections.connect(host=MILVUS_HOST, port=MILVUS_PORT)
-        self.collection = Collection(COLLECTION_NAME)
-        self.collection.load()
-
-        # Initialize embedding model
-        self.embedder = SentenceTransformer(EMBEDDING_MODEL)
+class ChatbotBase:
+    """Guideline retrieval and prompt construction shared by the sync and async chatbot services."""
 
-        # Initialize SQLite connection
-        self.conn = sqlite3.connect("patients.db")
-        self.cursor = self.conn.cursor()
-
-        # Initialize Groq client with httpx client
-        try:
-            from groq import Groq
-            self.client = Groq(
-                api_key="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",
-                http_client=httpx.Client(verify=False)
-            )
-        except Exception as e:
-            st.error(f"Failed to initialize Groq client: {str(e)}")
-            self.client = None
-
-        self.system_message = """You are a medical AI assistant specialized in heart failure.
+    system_message = """You are a medical AI assistant specialized in heart failure.
         Respond only with a clear final answer based strictly on the ESC guidelines and the patient information provided.
         Do not include any internal thoughts, reasoning steps, or explanations of your thought process.
         Cite the ESC guideline sources briefly if relevant. Do not preface or summarize your reasoning."""
 
-    def get_patient_data(self, patient_id):
-        """Retrieve all patient data from normalized tables and return as a structured dictionary."""
-        patient_data = {}
-
-        # -------------------- Patients Table --------------------
-        self.cursor.execute(
-            "SELECT * FROM patients WHERE patient_id = ?", (patient_id,))
-        patient_info = self.cursor.fetchone()
-        if not patient_info:
-            return None  # Patient not found
-
-        patient_columns = [desc[0] for desc in self.cursor.description]
-        patient_data.update(dict(zip(patient_columns, patient_info)))
-
-        # -------------------- Symptoms --------------------
-        self.cursor.execute(
-            "SELECT symptom, category, severity, duration FROM patient_symptoms WHERE patient_id = ?", (patient_id,))
-        symptoms = self.cursor.fetchall()
-        patient_data["symptoms"] = [
-            {"symptom": row[0], "category": row[1],
-                "severity": row[2], "duration": row[3]}
-            for row in symptoms
-        ]
-
-        # -------------------- Comorbidities --------------------
-        self.cursor.execute(
-            "SELECT * FROM patient_comorbidities WHERE patient_id = ?", (patient_id,))
-        comorbidities_row = self.cursor.fetchone()
-        if comorbidities_row:
-            comorbidity_columns = [desc[0] for desc in self.cursor.description]
-            comorbidities_dict = dict(
-                zip(comorbidity_columns, comorbidities_row))
-            # Remove internal ID
-            comorbidities_dict.pop("comorbidity_record_id", None)
-            comorbidities_dict.pop("patient_id")  # Already captured
-            patient_data["comorbidities"] = comorbidities_dict
-
-            # -------------------- Comorbidity Details --------------------
-            # comorbidity_record_id
-            comorbidity_record_id = comorbidities_row[0]
-            self.cursor.execute(
-                "SELECT detail_key, detail_value FROM comorbidity_details WHERE comorbidity_record_id = ?", (comorbidity_record_id,))
-            comorbidity_details = self.cursor.fetchall()
-            patient_data["comorbidity_details"] = [
-                {"detail_key": row[0], "detail_value": row[1]} for row in comorbidity_details
-            ]
-        else:
-            patient_data["comorbidities"] = {}
-            patient_data["comorbidity_details"] = []
-
-        # -------------------- Cardiovascular Events --------------------
-        self.cursor.execute(
-            "SELECT event_key, event_present FROM cv_events WHERE patient_id = ?", (patient_id,))
-        cv_events = self.cursor.fetchall()
-        patient_data["cv_events"] = [
-            {"event_key": row[0], "event_present": bool(row[1])} for row in cv_events
-        ]
+    def search_guidelines(self, query, top_k=5):
+        """Search Milvus database for relevant guidelines"""
+        # The query may carry patient data, so it bypasses the embedding cache
+        query_embedding = self.embedder.encode([query])[0]
+        return self.search_guidelines_vectors([query_embedding], top_k)[0]
 
-        if 'activity' in patient_data:
-            patient_data['physical_activity'] = patient_data['activity']
+    def embed_queries(self, context_query, user_query):
+        """
+        Embed the retrieval context and the bare question in one model batch.
+        Returns (context_vector, question_vector). Only the question goes through
+        the on-disk embedding cache: the context carries patient data.
+        """
+        vectors = self.embedding_cache.encode(
+            [context_query, user_query], self.embedder.encode, store=[False, True])
+        return vectors[0], vectors[1]
 
-        return patient_data
+    def search_guidelines_vectors(self, vectors, top_k=5):
+        """Search Milvus for several query vectors at once and return one hit list per vector"""
+        if len(vectors) == 0:
+            return []
 
-    def search_guidelines(self, query, top_k=5):
-        """Search Milvus database for relevant guidelines"""
-        # Generate embedding for the query
-        query_embedding = self.embedder.encode(query).tolist()
+        query_embeddings = [vector.tolist() for vector in vectors]
 
         # Search parameters
         search_params = {
@@ -110,32 +41,19 @@ class ChatbotService:
             "params": {"nprobe": 10}
         }
 
-        # Perform the search
+        # Perform one search with every query vector
         results = self.collection.search(
-            data=[query_embedding],
+            data=query_embeddings,
             anns_field="embedding",
             param=search_params,
             limit=top_k,
             output_fields=["text"]
         )
 
-        return results[0]
-
-    def generate_patient_response(self, patient_id, user_query):
-        """Generate a response based on patient data and guidelines"""
-        if not self.client:
-            return "Error: Chatbot service is not properly initialized. Please try again later."
-
-        # Get patient data
-        patient_data = self.get_patient_data(patient_id)
-        if not patient_data:
-            return "Patient not found. Please check the patient ID."
-
-       # Get patient data
-        patient_data = self.get_patient_data(patient_id)
-        if not patient_data:
-            return "Patient not found. Please check the patient ID."
+        return list(results)
 
+    def build_patient_context(self, patient_data, user_query):
+        """Build the patient-facing retrieval context from patient data and the question"""
         # -------------------- Symptoms --------------------
         if patient_data.get("symptoms"):
             symptoms_formatted = "\n".join([
@@ -214,9 +132,10 @@ class ChatbotService:
         Question: {user_query}
         """
 
-        # Search for relevant guidelines
-        search_results = self.search_guidelines(context_query)
+        return context_query
 
+    def build_patient_message(self, context_query, search_results):
+        """Build the patient-facing prompt from the context and retrieved guidelines"""
         # Format the guidelines for the AI model
         guidelines_text = "\n\n".join([f"Guideline {i+1}: {hit.entity.get('text')}"
                                        for i, hit in enumerate(search_results)])
@@ -242,32 +161,10 @@ class ChatbotService:
     Do not include citations, jargon, or your internal reasoning.
  """
 
-        try:
-            # Get response from Groq
-            messages = [
-                {"role": "system", "content": self.system_message},
-                {"role": "user", "content": user_message}
-            ]
-
-            chat_completion = self.client.chat.completions.create(
-                messages=messages,
-                model=CHATBOT_MODEL_NAME
-            )
-
-            return chat_completion.choices[0].message.content
-        except Exception as e:
-            return f"Error generating response: {str(e)}"
-
-    def generate_doc_response(self, patient_id, user_query):
-        """Generate a response based on patient data and guidelines"""
-        if not self.client:
-            return "Error: Chatbot service is not properly initialized. Please try again later."
-
-        # Get patient data
-        patient_data = self.get_patient_data(patient_id)
-        if not patient_data:
-            return "Patient not found. Please check the patient ID."
+        return user_message
 
+    def build_doc_context(self, patient_data, user_query):
+        """Build the doctor-facing retrieval context from patient data and the question"""
         # -------------------- Symptoms --------------------
         if patient_data.get("symptoms"):
             symptoms_formatted = "\n".join([
@@ -374,9 +271,10 @@ class ChatbotService:
         Question: {user_query}
         """
 
-        # Search for relevant guidelines
-        search_results = self.search_guidelines(context_query)
+        return context_query
 
+    def build_doc_message(self, context_query, search_results):
+        """Build the doctor-facing prompt from the context and retrieved guidelines"""
         # Format the guidelines for the AI model
         guidelines_text = "\n\n".join([f"Guideline {i+1}: {hit.entity.get('text')}"
                                        for i, hit in enumerate(search_results)])
@@ -431,71 +329,213 @@ class ChatbotService:
         - Do **not** include your reasoning or internal thought process—deliver only the final, guideline-based plan.  
 """
 
+        return user_message
+
+
+class ChatbotService(ChatbotBase):
+    def __init__(self):
+        # Milvus connection, embedding model and LLM client are shared by the
+        # whole process, so constructing the service on every rerun is cheap
+        self.collection = get_collection()
+        self.embedder = get_embedder()
+        self.embedding_cache = get_embedding_cache()
+        self.answer_cache = get_answer_cache()
+
+        # Initialize Groq client
         try:
-            # Get response from Groq
-            messages = [
-                {"role": "system", "content": self.system_message},
-                {"role": "user", "content": user_message}
-            ]
+            self.client = get_llm_client()
+        except Exception as e:
+            st.error(f"Failed to initialize Groq client: {str(e)}")
+            self.client = None
+
+    def get_patient_data(self, patient_id):
+        """Retrieve all patient data from normalized tables and return as a structured dictionary."""
+        return load_patient_snapshot(patient_id)
+
+    def generate_patient_response(self, patient_id, user_query, stream=False):
+        """
+        Generate a response based on patient data and guidelines.
+        With stream=True the answer is returned as an iterator of text pieces
+        (cached answers and error messages are still returned as plain strings).
+        """
+        if not self.client:
+            return "Error: Chatbot service is not properly initialized. Please try again later."
+
+        # Get patient data
+        patient_data = self.get_patient_data(patient_id)
+        if not patient_data:
+            # Possibly erased by another process: drop anything still cached for them
+            self.answer_cache.invalidate_patient(patient_id)
+            return "Patient not found. Please check the patient ID."
+
+        context_query = self.build_patient_context(patient_data, user_query)
+        context_vector, question_vector = self.embed_queries(
+            context_query, user_query)
+
+        # Search for relevant guidelines
+        search_results = self.search_guidelines_vectors([context_vector])[0]
+
+        user_message = self.build_patient_message(context_query, search_results)
+
+        return self.complete("Patient", patient_id, patient_data, user_query, question_vector,
+                             search_results, user_message, stream)
+
+    def generate_doc_response(self, patient_id, user_query, stream=False):
+        """
+        Generate a response based on patient data and guidelines.
+        With stream=True the answer is returned as an iterator of text pieces
+        (cached answers and error messages are still returned as plain strings).
+        """
+        if not self.client:
+            return "Error: Chatbot service is not properly initialized. Please try again later."
+
+        # Get patient data
+        patient_data = self.get_patient_data(patient_id)
+        if not patient_data:
+            # Possibly erased by another process: drop anything still cached for them
+            self.answer_cache.invalidate_patient(patient_id)
+            return "Patient not found. Please check the patient ID."
+
+        context_query = self.build_doc_context(patient_data, user_query)
+        context_vector, question_vector = self.embed_queries(
+            context_query, user_query)
+
+        # Search for relevant guidelines
+        search_results = self.search_guidelines_vectors([context_vector])[0]
+
+        user_message = self.build_doc_message(context_query, search_results)
+
+        return self.complete("Doctor", patient_id, patient_data, user_query, question_vector,
+                             search_results, user_message, stream)
 
+    def complete(self, mode, patient_id, patient_data, user_query, question_vector, search_results, user_message, stream=False):
+        """Answer from the answer cache when possible, otherwise ask Groq and cache the reply"""
+        chunk_ids = [hit.id for hit in search_results]
+
+        cached_answer = self.answer_cache.lookup(
+            patient_id, patient_data, mode, user_query, chunk_ids, question_vector)
+        if cached_answer is not None:
+            return cached_answer
+
+        # Get response from Groq
+        messages = [
+            {"role": "system", "content": self.system_message},
+            {"role": "user", "content": user_message}
+        ]
+
+        def cache_answer(answer):
+            self.answer_cache.store(patient_id, patient_data, mode, user_query,
+                                    chunk_ids, answer, question_vector)
+
+        if stream:
+            return self.stream_completion(messages, cache_answer)
+
+        try:
             chat_completion = self.client.chat.completions.create(
                 messages=messages,
                 model=CHATBOT_MODEL_NAME
             )
 
-            return chat_completion.choices[0].message.content
+            answer = chat_completion.choices[0].message.content
         except Exception as e:
             return f"Error generating response: {str(e)}"
 
+        cache_answer(answer)
+        return answer
+
+    def stream_completion(self, messages, on_complete=None):
+        """Yield answer tokens from Groq as they arrive; the full text goes to on_complete"""
+        pieces = []
+        try:
+            chat_stream = self.client.chat.completions.create(
+                messages=messages,
+                model=CHATBOT_MODEL_NAME,
+                stream=True
+            )
+
+            for chunk in chat_stream:
+                piece = chunk.choices[0].delta.content if chunk.choices else None
+                if piece:
+                    pieces.append(piece)
+                    yield piece
+        except Exception as e:
+            yield f"Error generating response: {str(e)}"
+            return
+
+        if on_complete is not None:
+            on_complete("".join(pieces))
+
     def close(self):
-        """Close database connections"""
-        self.conn.close()
-        connections.disconnect("default")
+        """Nothing to release: connections are borrowed from the shared pools per call"""
+        pass
 
 # Streamlit UI for the chatbot
 
 
-def chat_interface(patient_id, mode):
-    st.title("Heart Failure Guidelines Chatbot")
-
-    # Initialize chatbot service
-    chatbot = ChatbotService()
-
-    # Display patient info
-    patient_data = chatbot.get_patient_data(patient_id)
-    if patient_data:
-        st.subheader(f"Patient: {patient_data.get('patient_name')}")
-        st.write(f"Age: {patient_data.get('age')}")
-        st.write(f"HF Type: {patient_data.get('hf_type')}")
-        st.write(f"Current Medications: {patient_data.get('medications')}")
-
-    # Initialize chat history in session state if it doesn't exist
-    if 'chat_history' not in st.session_state:
-        st.session_state.chat_history = []
-
-    # Chat interface
-    user_query = st.text_input(
-        "Ask a question about heart failure guidelines:",
-        key=f"chat_input_{patient_id}_{mode}"
-    )
-
-    # Process the query when Enter is pressed
-    if user_query:
-        if mode == "Doctor":
-            response = chatbot.generate_doc_response(patient_id, user_query)
-        else:
-            response = chatbot.generate_patient_response(
-                patient_id, user_query)
+def render_streamed_response(placeholder, response):
+    """Render a streamed (or plain string) response into a placeholder and return the full text"""
+    if isinstance(response, str):
+        placeholder.markdown(response)
+        return response
 
-        # Add the exchange to chat history
-        st.session_state.chat_history.append(
-            {"user": user_query, "assistant": response})
+    text = ""
+    for piece in response:
+        text += piece
+        placeholder.markdown(text + "▌")
+    placeholder.markdown(text)
+    return text
 
-        # Display chat history
-        for exchange in st.session_state.chat_history:
-            st.write("You:", exchange["user"])
-            st.write("Assistant:", exchange["assistant"])
+
+def chat_interface(patient_id, mode):
+    # One snapshot query per rerun, shared by the header and the answer
+    with snapshot_scope():
+        st.title("Heart Failure Guidelines Chatbot")
+
+        # Initialize chatbot service
+        chatbot = ChatbotService()
+
+        # Display patient info
+        patient_data = chatbot.get_patient_data(patient_id)
+        if patient_data:
+            st.subheader(f"Patient: {patient_data.get('patient_name')}")
+            st.write(f"Age: {patient_data.get('age')}")
+            st.write(f"HF Type: {patient_data.get('hf_type')}")
+            st.write(f"Current Medications: {patient_data.get('medications')}")
+
+        # Initialize chat history in session state if it doesn't exist
+        if 'chat_history' not in st.session_state:
+            st.session_state.chat_history = []
+
+        # Chat interface
+        user_query = st.text_input(
+            "Ask a question about heart failure guidelines:",
+            key=f"chat_input_{patient_id}_{mode}"
+        )
+
+        # Process the query when Enter is pressed
+        if user_query:
+            # Display chat history
+            for exchange in st.session_state.chat_history:
+                st.write("You:", exchange["user"])
+                st.write("Assistant:", exchange["assistant"])
+                st.write("---")
+
+            # Stream the new answer into the page as it is generated
+            st.write("You:", user_query)
+            st.write("Assistant:")
+            answer_placeholder = st.empty()
+            if mode == "Doctor":
+                response = chatbot.generate_doc_response(
+                    patient_id, user_query, stream=True)
+            else:
+                response = chatbot.generate_patient_response(
+                    patient_id, user_query, stream=True)
+            response = render_streamed_response(answer_placeholder, response)
             st.write("---")
 
-    # Close connections when done
-    chatbot.close()
+            # Add the exchange to chat history
+            st.session_state.chat_history.append(
+                {"user": user_query, "assistant": response})
+
+        # Close connections when done
+        chatbot.close()
@@ -1,6 +1,7 @@
 from services.milvus_service import MilvusService
 
-milvus_service = MilvusService()
+# Created on first query rather than at import time
+milvus_service = None
 
 
 class DBService:
@@ -15,4 +16,7 @@ class DBService:
         Returns:
             List of matches with text and scores
         """
+        global milvus_service
+        if milvus_service is None:
+            milvus_service = MilvusService()
         return milvus_service.search(query, top_k)
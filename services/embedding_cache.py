@@ -0,0 +1,249 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+import zlib
+
+import numpy as np
+
+
+def normalize_text(text):
+    """Normalizes text before hashing so whitespace-only differences share an entry."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def _checksum(vector):
+    return zlib.crc32(np.ascontiguousarray(vector, dtype=np.float32).tobytes())
+
+
+class EmbeddingCache:
+    """
+    Persistent cache of sentence embeddings keyed by (model name, normalized text).
+
+    Vectors are stored as rows of a memory-mapped float32 file. A small SQLite
+    index maps each key to its row ("slot") with a checksum of the vector, and
+    records when it was last used, so that once `max_entries` rows exist the least
+    recently used slots are reused. Lookups only read the index; a vector whose
+    slot was recycled while it was being read fails its checksum and is a miss.
+    """
+
+    GROW_ROWS = 4096
+    # Hits refresh last_used at most this often, so most lookups never write
+    TOUCH_INTERVAL = 60.0
+
+    def __init__(self, path, model_name, dim, max_entries):
+        self.model_name = model_name
+        self.dim = dim
+        self.max_entries = max_entries
+
+        # One directory per model, e.g. .embedding_cache/sentence-transformers_all-MiniLM-L6-v2
+        cache_dir = os.path.join(path, re.sub(r"[^\w.-]", "_", model_name))
+        os.makedirs(cache_dir, exist_ok=True)
+        self._vectors_path = os.path.join(cache_dir, "vectors.f32")
+        self._vectors = None
+        self._lock = threading.Lock()
+
+        self._index = sqlite3.connect(
+            os.path.join(cache_dir, "index.sqlite"), timeout=30,
+            isolation_level=None, check_same_thread=False)
+        self._index.execute("PRAGMA journal_mode=WAL")
+        # The cache can always be rebuilt, so commits need not wait for an fsync
+        self._index.execute("PRAGMA synchronous=NORMAL")
+        self._index.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                slot INTEGER NOT NULL UNIQUE,
+                last_used REAL NOT NULL,
+                checksum INTEGER
+            )
+        """)
+        self._index.execute(
+            "CREATE INDEX IF NOT EXISTS idx_entries_last_used ON entries(last_used)")
+        self._add_checksums()
+
+    def _add_checksums(self):
+        """Adds the checksum column to caches created before it existed."""
+        columns = {row[1] for row in self._index.execute("PRAGMA table_info(entries)")}
+        if "checksum" in columns:
+            return
+        self._index.execute("BEGIN IMMEDIATE")
+        try:
+            columns = {row[1] for row in self._index.execute("PRAGMA table_info(entries)")}
+            if "checksum" not in columns:
+                self._index.execute("ALTER TABLE entries ADD COLUMN checksum INTEGER")
+                rows = self._index.execute("SELECT key, slot FROM entries").fetchall()
+                if rows:
+                    vectors = self._mapped_rows(max(slot for _, slot in rows) + 1)
+                    self._index.executemany(
+                        "UPDATE entries SET checksum = ? WHERE key = ?",
+                        [(_checksum(vectors[slot]), key) for key, slot in rows])
+            self._index.execute("COMMIT")
+        except Exception:
+            self._index.execute("ROLLBACK")
+            raise
+
+    def _key(self, text):
+        raw = f"{self.model_name}\n{normalize_text(text)}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _mapped_rows(self, min_rows):
+        """Returns the vector file mapped with at least `min_rows` rows, growing it if needed."""
+        if self._vectors is not None and len(self._vectors) >= min_rows:
+            return self._vectors
+
+        row_bytes = self.dim * 4
+        size = os.path.getsize(self._vectors_path) if os.path.exists(
+            self._vectors_path) else 0
+        rows = size // row_bytes
+        if rows < min_rows:
+            rows = max(min_rows, min(rows + self.GROW_ROWS, self.max_entries))
+            with open(self._vectors_path, "ab") as f:
+                f.truncate(rows * row_bytes)
+
+        self._vectors = np.memmap(
+            self._vectors_path, dtype=np.float32, mode="r+", shape=(rows, self.dim))
+        return self._vectors
+
+    def get_many(self, texts):
+        """Returns a list with the cached vector for each text, or None on a miss."""
+        keys = [self._key(text) for text in texts]
+        found = {}
+        now = time.time()
+        stale = []
+
+        with self._lock:
+            # A read transaction: it takes no lock other processes wait on
+            self._index.execute("BEGIN")
+            try:
+                unique_keys = list(dict.fromkeys(keys))
+                for i in range(0, len(unique_keys), 500):
+                    batch = unique_keys[i:i + 500]
+                    placeholders = ", ".join("?" * len(batch))
+                    rows = self._index.execute(
+                        f"SELECT key, slot, last_used, checksum FROM entries WHERE key IN ({placeholders})",
+                        batch).fetchall()
+                    if rows:
+                        vectors = self._mapped_rows(
+                            max(row[1] for row in rows) + 1)
+                        for key, slot, last_used, checksum in rows:
+                            vector = np.array(vectors[slot])
+                            # Recycled or half-written by another process: a miss
+                            if _checksum(vector) != checksum:
+                                continue
+                            found[key] = vector
+                            if last_used < now - self.TOUCH_INTERVAL:
+                                stale.append(key)
+                self._index.execute("COMMIT")
+            except Exception:
+                self._index.execute("ROLLBACK")
+                raise
+
+            if stale:
+                self._index.execute("BEGIN IMMEDIATE")
+                try:
+                    self._index.executemany(
+                        "UPDATE entries SET last_used = ? WHERE key = ?",
+                        [(now, key) for key in stale])
+                    self._index.execute("COMMIT")
+                except Exception:
+                    self._index.execute("ROLLBACK")
+                    raise
+
+        return [found.get(key) for key in keys]
+
+    def put_many(self, texts, vectors):
+        """Stores vectors for texts, evicting the least recently used entries when full."""
+        pending = {}
+        for text, vector in zip(texts, vectors):
+            pending[self._key(text)] = vector
+        if not pending:
+            return
+
+        with self._lock:
+            self._index.execute("BEGIN IMMEDIATE")
+            try:
+                present = set()
+                keys = list(pending)
+                for i in range(0, len(keys), 500):
+                    batch = keys[i:i + 500]
+                    placeholders = ", ".join("?" * len(batch))
+                    present.update(row[0] for row in self._index.execute(
+                        f"SELECT key FROM entries WHERE key IN ({placeholders})", batch))
+                new_keys = [key for key in pending if key not in present]
+
+                # Hand out free slots first, then recycle the oldest ones
+                count = self._index.execute(
+                    "SELECT COUNT(*) FROM entries").fetchone()[0]
+                free = min(len(new_keys), max(self.max_entries - count, 0))
+                slots = list(range(count, count + free))
+                evict = len(new_keys) - free
+                if evict:
+                    oldest = self._index.execute(
+                        "SELECT key, slot FROM entries ORDER BY last_used LIMIT ?", (evict,)).fetchall()
+                    self._index.executemany(
+                        "DELETE FROM entries WHERE key = ?", [(key,) for key, _ in oldest])
+                    slots += [slot for _, slot in oldest]
+
+                new_keys = new_keys[:len(slots)]
+                if new_keys:
+                    stored = self._mapped_rows(max(slots) + 1)
+                    for key, slot in zip(new_keys, slots):
+                        stored[slot] = pending[key]
+                    stored.flush()
+
+                    now = time.time()
+                    self._index.executemany(
+                        "INSERT INTO entries (key, slot, last_used, checksum) VALUES (?, ?, ?, ?)",
+                        [(key, slot, now, _checksum(stored[slot]))
+                         for key, slot in zip(new_keys, slots)])
+                self._index.execute("COMMIT")
+            except Exception:
+                self._index.execute("ROLLBACK")
+                raise
+
+    def encode(self, texts, encode_fn, store=None):
+        """
+        Returns an (n, dim) float32 array of embeddings for texts. Only texts that
+        are not cached are passed (once each) to `encode_fn`, whose results are stored.
+
+        `store` is an optional list of flags, one per text. Texts flagged False (e.g.
+        ones carrying patient data) are never looked up or written to disk, but are
+        encoded in the same `encode_fn` batch as the misses.
+        """
+        if store is None:
+            store = [True] * len(texts)
+        result = [None] * len(texts)
+        cacheable = [i for i, keep in enumerate(store) if keep]
+        if cacheable:
+            for i, vector in zip(cacheable, self.get_many([texts[i] for i in cacheable])):
+                result[i] = vector
+
+        misses = {}
+        for i, vector in enumerate(result):
+            if vector is None:
+                misses.setdefault((bool(store[i]), normalize_text(texts[i])), texts[i])
+
+        if misses:
+            vectors = np.asarray(encode_fn(list(misses.values())), dtype=np.float32)
+            computed = dict(zip(misses, vectors))
+            new_keys = [key for key in misses if key[0]]
+            if new_keys:
+                self.put_many([misses[key] for key in new_keys],
+                              np.stack([computed[key] for key in new_keys]))
+            for i, vector in enumerate(result):
+                if vector is None:
+                    result[i] = computed[(bool(store[i]), normalize_text(texts[i]))]
+
+        output = np.empty((len(texts), self.dim), dtype=np.float32)
+        for i, vector in enumerate(result):
+            output[i] = vector
+        return output
+
+    def close(self):
+        """Closes the index and unmaps the vector file."""
+        with self._lock:
+            self._index.close()
+            self._vectors = None
@@ -0,0 +1,649 @@
+import sqlite3
+import time
+from contextlib import contextmanager
+
+# -------------------- Schema migrations --------------------
+# Each migration takes a cursor and moves the patients database one version forward.
+# The version a database is at is kept in `PRAGMA user_version`, so every migration
+# runs exactly once per database. Never edit a migration that has shipped; add a new
+# one at the end of MIGRATIONS instead.
+
+
+def _initial_schema(cursor):
+    """Base tables (no-op on databases created before versioning)"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS patients (
+            patient_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_name TEXT,
+            age INTEGER,
+            sex TEXT,
+            height REAL,
+            weight REAL,
+            bmi REAL,
+            heart_rate INTEGER,
+            rhythm TEXT,
+            systolic_bp INTEGER,
+            diastolic_bp INTEGER,
+            respiratory_rate INTEGER,
+            oxygen_saturation REAL,
+            temperature REAL,
+            edema_locations TEXT,
+            edema_grade TEXT,
+            jvp TEXT,
+            hepatomegaly TEXT,
+            hepatomegaly_span REAL,
+            lung_findings TEXT,
+            heart_sounds TEXT,
+            murmurs TEXT,
+            murmur_other TEXT,
+            hf_type TEXT,
+            EF_type TEXT,
+            lvef REAL,
+            nyha TEXT,
+            bnp REAL,
+            symptom_triggers TEXT,
+            other_trigger_detail TEXT,
+            daily_impact TEXT,
+            alcohol BOOLEAN,
+            alcohol_frequency TEXT,
+            smoking BOOLEAN,
+            smoking_packs REAL,
+            smoking_duration INTEGER,
+            activity TEXT,
+            medications TEXT,
+            other_meds TEXT,
+            creatinine REAL,
+            potassium REAL,
+            sodium REAL,
+            anemia_status TEXT,
+            anemia_present BOOLEAN,
+            iron_supplement BOOLEAN,
+            ferritin_issue BOOLEAN,
+            walk_test INTEGER,
+            vo2_max REAL,
+            devices TEXT,
+            ecg TEXT,
+            echo TEXT,
+            echo_other TEXT,
+            ca_findings TEXT,
+            ca_other_details TEXT,
+            mri_findings TEXT,
+            mri_other_details TEXT,
+            holter_findings TEXT,
+            holter_other_details TEXT,
+            follow_plan TEXT
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS patient_symptoms (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id INTEGER,
+            symptom TEXT,
+            category TEXT,
+            present BOOLEAN,
+            severity INTEGER,
+            duration TEXT,
+            FOREIGN KEY (patient_id) REFERENCES patients(patient_id)
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS patient_comorbidities (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id INTEGER,
+            hypertension BOOLEAN,
+            diabetes BOOLEAN,
+            dyslipidemia BOOLEAN,
+            kidney_disease BOOLEAN,
+            obesity BOOLEAN,
+            sleep_apnea BOOLEAN,
+            family_history BOOLEAN,
+            FOREIGN KEY (patient_id) REFERENCES patients(patient_id)
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS comorbidity_details (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id INTEGER,
+            comorbidity_record_id INTEGER,
+            detail_key TEXT,
+            detail_value TEXT,
+            FOREIGN KEY (patient_id) REFERENCES patients(patient_id),
+            FOREIGN KEY (comorbidity_record_id) REFERENCES patient_comorbidities(id)
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS cv_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id INTEGER,
+            event_key TEXT,
+            event_present BOOLEAN,
+            FOREIGN KEY (patient_id) REFERENCES patients(patient_id)
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS patient_consents (
+            consent_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id INTEGER,
+            clinical_care_consent BOOLEAN,
+            quality_research_consent BOOLEAN,
+            ai_training_consent BOOLEAN,
+            consent_timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (patient_id) REFERENCES patients(patient_id)
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS consent_audit_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id INTEGER,
+            action TEXT NOT NULL,
+            purpose TEXT NOT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            ip_address TEXT,
+            user_agent TEXT,
+            FOREIGN KEY (patient_id) REFERENCES patients(patient_id)
+        );
+    """)
+
+
+def _patient_indexes(cursor):
+    """Indexes on the foreign keys used by every per-patient lookup and delete"""
+    # Covering: the patient snapshot query reads these columns straight from the index
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_patient_symptoms_patient
+            ON patient_symptoms (patient_id, symptom, category, severity, duration)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_patient_comorbidities_patient
+            ON patient_comorbidities (patient_id)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_comorbidity_details_record
+            ON comorbidity_details (comorbidity_record_id, detail_key, detail_value)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_comorbidity_details_patient
+            ON comorbidity_details (patient_id)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_cv_events_patient
+            ON cv_events (patient_id, event_key, event_present)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_patient_consents_patient
+            ON patient_consents (patient_id)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_consent_audit_log_patient
+            ON consent_audit_log (patient_id)
+    """)
+
+
+def _consent_purposes(cursor):
+    """
+    Per-purpose consent columns used by check_consent, record_consent and
+    withdraw_consent. These used to be missing from patient_consents, which was
+    dropped and re-created on every start instead of being migrated.
+    """
+    existing = {row[1] for row in cursor.execute(
+        "PRAGMA table_info(patient_consents)")}
+    for column, column_type in [("purpose", "TEXT"),
+                                ("consent_given", "BOOLEAN"),
+                                ("consent_text", "TEXT"),
+                                ("consent_version", "TEXT"),
+                                ("withdrawal_date", "DATETIME")]:
+        if column not in existing:
+            cursor.execute(
+                f"ALTER TABLE patient_consents ADD COLUMN {column} {column_type}")
+
+    cursor.execute("DROP INDEX IF EXISTS idx_patient_consents_patient")
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_patient_consents_purpose
+            ON patient_consents (patient_id, purpose, consent_timestamp)
+    """)
+
+
+def _refresh_summary_sql(patient_id):
+    """Trigger body statements recomputing one patient's patient_summary row"""
+    return f"""
+        DELETE FROM patient_summary WHERE patient_id = {patient_id};
+        INSERT INTO patient_summary
+            SELECT * FROM patient_summary_source WHERE patient_id = {patient_id};
+    """
+
+
+def _create_summary_triggers(cursor):
+    """Triggers recomputing patient_summary rows when their source rows change"""
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS patients_summary_insert
+        AFTER INSERT ON patients BEGIN {_refresh_summary_sql("NEW.patient_id")} END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS patients_summary_update
+        AFTER UPDATE OF patient_id, patient_name, age, sex, hf_type ON patients BEGIN
+            DELETE FROM patient_summary WHERE patient_id = OLD.patient_id;
+            {_refresh_summary_sql("NEW.patient_id")}
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS patients_summary_delete
+        AFTER DELETE ON patients BEGIN
+            DELETE FROM patient_summary WHERE patient_id = OLD.patient_id;
+        END
+    """)
+
+    for table in ("patient_symptoms", "patient_comorbidities"):
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_summary_insert
+            AFTER INSERT ON {table} BEGIN {_refresh_summary_sql("NEW.patient_id")} END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_summary_update
+            AFTER UPDATE ON {table} BEGIN
+                {_refresh_summary_sql("OLD.patient_id")}
+                {_refresh_summary_sql("NEW.patient_id")}
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_summary_delete
+            AFTER DELETE ON {table} BEGIN {_refresh_summary_sql("OLD.patient_id")} END
+        """)
+
+
+def _patient_summary(cursor):
+    """
+    patient_summary: one precomputed row per patient with what the patient picker and
+    the visual summary show. Triggers on the source tables keep it current, so the UI
+    reads a single primary-key row instead of re-aggregating on every rerun.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS patient_summary (
+            patient_id INTEGER PRIMARY KEY,
+            patient_name TEXT,
+            age INTEGER,
+            sex TEXT,
+            hf_type TEXT,
+            symptoms TEXT NOT NULL DEFAULT '[]',
+            comorbidities TEXT NOT NULL DEFAULT '[]'
+        );
+    """)
+
+    # How a summary row is computed. symptoms and comorbidities are JSON arrays; the
+    # comorbidity labels come from the patient's first comorbidity record, in the
+    # order the visual summary lists them.
+    cursor.execute("""
+        CREATE VIEW IF NOT EXISTS patient_summary_source AS
+        WITH labels (position, flag, label) AS (
+            VALUES (1, 'hypertension', 'Hypertension'),
+                   (2, 'diabetes', 'Diabetes'),
+                   (3, 'dyslipidemia', 'Dyslipidemia'),
+                   (4, 'kidney_disease', 'Kidney Disease'),
+                   (5, 'obesity', 'Obesity'),
+                   (6, 'sleep_apnea', 'Sleep Apnea'),
+                   (7, 'family_history', 'Family History of Heart Disease')
+        )
+        SELECT p.patient_id, p.patient_name, p.age, p.sex, p.hf_type,
+               (SELECT json_group_array(symptom)
+                  FROM (SELECT DISTINCT symptom FROM patient_symptoms
+                         WHERE patient_id = p.patient_id)) AS symptoms,
+               (SELECT json_group_array(label)
+                  FROM (SELECT l.label
+                          FROM labels l, patient_comorbidities c
+                         WHERE c.id = (SELECT id FROM patient_comorbidities
+                                        WHERE patient_id = p.patient_id ORDER BY id LIMIT 1)
+                           AND CASE l.flag
+                                   WHEN 'hypertension' THEN c.hypertension
+                                   WHEN 'diabetes' THEN c.diabetes
+                                   WHEN 'dyslipidemia' THEN c.dyslipidemia
+                                   WHEN 'kidney_disease' THEN c.kidney_disease
+                                   WHEN 'obesity' THEN c.obesity
+                                   WHEN 'sleep_apnea' THEN c.sleep_apnea
+                                   WHEN 'family_history' THEN c.family_history
+                               END
+                         ORDER BY l.position)) AS comorbidities
+          FROM patients p
+    """)
+
+    _create_summary_triggers(cursor)
+
+    # Backfill existing patients
+    cursor.execute("DELETE FROM patient_summary")
+    cursor.execute(
+        "INSERT INTO patient_summary SELECT * FROM patient_summary_source")
+
+
+def _patient_search_indexes(cursor):
+    """Indexes behind the keyset-paginated patient search"""
+    # LIKE 'prefix%' can only use an index with the same (case-insensitive) collation
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_patient_summary_name
+            ON patient_summary (patient_name COLLATE NOCASE)
+    """)
+    # Filter + keyset in one range scan: WHERE x = ? AND patient_id < ? ORDER BY patient_id DESC
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_patient_summary_hf_type
+            ON patient_summary (hf_type, patient_id)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_patient_summary_sex
+            ON patient_summary (sex, patient_id)
+    """)
+
+
+# Free-text patients columns indexed for full-text search
+NOTE_COLUMNS = ("follow_plan", "echo_other", "mri_other_details", "holter_other_details",
+                "other_meds", "medications", "murmur_other", "devices")
+
+
+def _patient_notes_fts(cursor):
+    """
+    patient_notes_fts: FTS5 index over the free-text patients columns. It is an
+    external-content table (the text stays in patients only), kept in sync by
+    triggers, with prefix indexes so partial words like "sacub" stay fast.
+    """
+    columns = ", ".join(NOTE_COLUMNS)
+    new_values = ", ".join(f"NEW.{column}" for column in NOTE_COLUMNS)
+    old_values = ", ".join(f"OLD.{column}" for column in NOTE_COLUMNS)
+
+    cursor.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS patient_notes_fts USING fts5(
+            {columns},
+            content='patients', content_rowid='patient_id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+    """)
+
+    insert = f"""
+        INSERT INTO patient_notes_fts (rowid, {columns})
+        VALUES (NEW.patient_id, {new_values});
+    """
+    # External-content rows are removed by re-supplying their old values
+    delete = f"""
+        INSERT INTO patient_notes_fts (patient_notes_fts, rowid, {columns})
+        VALUES ('delete', OLD.patient_id, {old_values});
+    """
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS patients_notes_insert
+        AFTER INSERT ON patients BEGIN {insert} END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS patients_notes_update
+        AFTER UPDATE OF patient_id, {columns} ON patients BEGIN {delete} {insert} END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS patients_notes_delete
+        AFTER DELETE ON patients BEGIN {delete} END
+    """)
+
+    # Index existing patients
+    cursor.execute(
+        "INSERT INTO patient_notes_fts (patient_notes_fts) VALUES ('rebuild')")
+
+
+def _append_only_audit_log(cursor):
+    """consent_audit_log rows can be added but never changed or removed"""
+    for operation in ("UPDATE", "DELETE"):
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS consent_audit_log_no_{operation.lower()}
+            BEFORE {operation} ON consent_audit_log BEGIN
+                SELECT RAISE(ABORT, 'consent_audit_log is append-only');
+            END
+        """)
+
+
+# Child tables rebuilt with ON DELETE CASCADE: name -> CREATE TABLE statement
+CASCADING_TABLES = {
+    "patient_symptoms": """
+        CREATE TABLE patient_symptoms (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id INTEGER,
+            symptom TEXT,
+            category TEXT,
+            present BOOLEAN,
+            severity INTEGER,
+            duration TEXT,
+            FOREIGN KEY (patient_id) REFERENCES patients(patient_id) ON DELETE CASCADE
+        );
+    """,
+    "patient_comorbidities": """
+        CREATE TABLE patient_comorbidities (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id INTEGER,
+            hypertension BOOLEAN,
+            diabetes BOOLEAN,
+            dyslipidemia BOOLEAN,
+            kidney_disease BOOLEAN,
+            obesity BOOLEAN,
+            sleep_apnea BOOLEAN,
+            family_history BOOLEAN,
+            FOREIGN KEY (patient_id) REFERENCES patients(patient_id) ON DELETE CASCADE
+        );
+    """,
+    "comorbidity_details": """
+        CREATE TABLE comorbidity_details (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id INTEGER,
+            comorbidity_record_id INTEGER,
+            detail_key TEXT,
+            detail_value TEXT,
+            FOREIGN KEY (patient_id) REFERENCES patients(patient_id) ON DELETE CASCADE,
+            FOREIGN KEY (comorbidity_record_id) REFERENCES patient_comorbidities(id) ON DELETE CASCADE
+        );
+    """,
+    "cv_events": """
+        CREATE TABLE cv_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id INTEGER,
+            event_key TEXT,
+            event_present BOOLEAN,
+            FOREIGN KEY (patient_id) REFERENCES patients(patient_id) ON DELETE CASCADE
+        );
+    """,
+    "patient_consents": """
+        CREATE TABLE patient_consents (
+            consent_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id INTEGER,
+            clinical_care_consent BOOLEAN,
+            quality_research_consent BOOLEAN,
+            ai_training_consent BOOLEAN,
+            consent_timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            purpose TEXT,
+            consent_given BOOLEAN,
+            consent_text TEXT,
+            consent_version TEXT,
+            withdrawal_date DATETIME,
+            FOREIGN KEY (patient_id) REFERENCES patients(patient_id) ON DELETE CASCADE
+        );
+    """,
+    # The audit trail has to outlive the patients it mentions, so no foreign key
+    "consent_audit_log": """
+        CREATE TABLE consent_audit_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id INTEGER,
+            action TEXT NOT NULL,
+            purpose TEXT NOT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            ip_address TEXT,
+            user_agent TEXT
+        );
+    """,
+}
+
+
+def _cascading_deletes(cursor):
+    """
+    Rebuild the child tables so deleting a patient deletes their rows too
+    (SQLite cannot add ON DELETE CASCADE to an existing table). Each table is
+    renamed aside, re-created and copied, keeping ids and AUTOINCREMENT counters.
+    Rows of patients that no longer exist are not copied.
+    """
+    # Rename without rewriting the views, triggers and foreign keys that mention
+    # the table, so they bind to the re-created table instead of the old copy
+    cursor.execute("PRAGMA legacy_alter_table = ON")
+    try:
+        for table, create_sql in CASCADING_TABLES.items():
+            columns = ", ".join(row[1] for row in cursor.execute(
+                f"PRAGMA table_info({table})"))
+            cursor.execute(f"ALTER TABLE {table} RENAME TO {table}_old")
+            cursor.execute(create_sql)
+
+            if table == "consent_audit_log":
+                keep = ""
+            elif table == "comorbidity_details":
+                keep = """WHERE patient_id IN (SELECT patient_id FROM patients)
+                            AND (comorbidity_record_id IS NULL
+                                 OR comorbidity_record_id IN (SELECT id FROM patient_comorbidities))"""
+            else:
+                keep = "WHERE patient_id IN (SELECT patient_id FROM patients)"
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {table}_old {keep}")
+            cursor.execute(f"""
+                UPDATE sqlite_sequence
+                   SET seq = (SELECT seq FROM sqlite_sequence WHERE name = '{table}_old')
+                 WHERE name = '{table}'
+            """)
+            cursor.execute(f"DELETE FROM sqlite_sequence WHERE name = '{table}_old'")
+            # Also drops the old table's indexes and triggers
+            cursor.execute(f"DROP TABLE {table}_old")
+    finally:
+        cursor.execute("PRAGMA legacy_alter_table = OFF")
+
+    for table in CASCADING_TABLES:
+        violations = cursor.execute(f"PRAGMA foreign_key_check({table})").fetchall()
+        if violations:
+            raise sqlite3.IntegrityError(
+                f"{table} has {len(violations)} dangling references, e.g. {violations[0]}")
+
+    _patient_indexes(cursor)
+    cursor.execute("DROP INDEX IF EXISTS idx_patient_consents_patient")
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_patient_consents_purpose
+            ON patient_consents (patient_id, purpose, consent_timestamp)
+    """)
+    _create_summary_triggers(cursor)
+    _append_only_audit_log(cursor)
+
+
+MIGRATIONS = [
+    _initial_schema,
+    _patient_indexes,
+    _consent_purposes,
+    _patient_summary,
+    _patient_search_indexes,
+    _patient_notes_fts,
+    _append_only_audit_log,
+    _cascading_deletes,
+]
+
+
+# -------------------- Bulk inserts --------------------
+# Per-row insert triggers that bulk loads replace with one set-based refresh
+SUMMARY_INSERT_TRIGGERS = ("patients_summary_insert", "patient_symptoms_summary_insert",
+                           "patient_comorbidities_summary_insert")
+NOTES_INSERT_TRIGGER = "patients_notes_insert"
+
+
+def refresh_new_patients(cursor, patient_ids, summary=True, notes=True):
+    """Write the patient_summary and patient_notes_fts rows of newly inserted patients"""
+    columns = ", ".join(NOTE_COLUMNS)
+    for i in range(0, len(patient_ids), 500):
+        batch = patient_ids[i:i + 500]
+        placeholders = ", ".join("?" * len(batch))
+        if summary:
+            cursor.execute(
+                f"DELETE FROM patient_summary WHERE patient_id IN ({placeholders})", batch)
+            cursor.execute(f"""
+                INSERT INTO patient_summary
+                SELECT * FROM patient_summary_source WHERE patient_id IN ({placeholders})
+            """, batch)
+        if notes:
+            cursor.execute(f"""
+                INSERT INTO patient_notes_fts (rowid, {columns})
+                SELECT patient_id, {columns} FROM patients WHERE patient_id IN ({placeholders})
+            """, batch)
+
+
+@contextmanager
+def bulk_insert(conn):
+    """
+    Context manager for inserting many new patients in one transaction. The summary
+    and full-text insert triggers, which otherwise recompute a patient's summary for
+    every child row, are dropped for its duration. Yields a list the caller appends
+    the new patient ids to; their derived rows are written once, set-based, on exit
+    and the triggers are re-created. DDL is transactional in SQLite, so other
+    connections never see the triggers missing. The caller commits.
+    """
+    cursor = conn.cursor()
+    # DDL does not open a transaction implicitly, so open one before dropping anything
+    if not conn.in_transaction:
+        cursor.execute("BEGIN IMMEDIATE")
+
+    names = SUMMARY_INSERT_TRIGGERS + (NOTES_INSERT_TRIGGER,)
+    triggers = dict(cursor.execute(f"""
+        SELECT name, sql FROM sqlite_master
+         WHERE type = 'trigger' AND name IN ({", ".join("?" * len(names))})
+    """, names).fetchall())
+    for name in triggers:
+        cursor.execute(f"DROP TRIGGER {name}")
+
+    patient_ids = []
+    yield patient_ids
+
+    refresh_new_patients(cursor, patient_ids,
+                         summary=any(name in triggers for name in SUMMARY_INSERT_TRIGGERS),
+                         notes=NOTES_INSERT_TRIGGER in triggers)
+    for sql in triggers.values():
+        cursor.execute(sql)
+
+
+def schema_version(conn):
+    """Current schema version of the database behind `conn`"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn, verbose=False):
+    """
+    Bring the database up to the latest version. Each pending migration runs in its
+    own transaction together with the version bump, so a failed migration leaves the
+    database at the previous version. Returns the resulting version.
+    """
+    if schema_version(conn) >= len(MIGRATIONS):
+        return schema_version(conn)
+
+    # Table rebuilds need foreign keys off, which can only be changed outside a
+    # transaction; migrations that rebuild tables check the references themselves
+    foreign_keys = conn.execute("PRAGMA foreign_keys").fetchone()[0]
+    conn.execute("PRAGMA foreign_keys = OFF")
+    try:
+        for version, migration in enumerate(MIGRATIONS, start=1):
+            # IMMEDIATE takes the write lock up front, so concurrent processes migrate one
+            # at a time and the version check below sees the other's work
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if schema_version(conn) >= version:
+                    conn.rollback()
+                    continue
+
+                start = time.time()
+                migration(conn.cursor())
+                conn.execute(f"PRAGMA user_version = {version}")
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+            if verbose:
+                print(f"Applied migration {version} ({migration.__name__}) "
+                      f"in {time.time() - start:.2f}s")
+    finally:
+        conn.execute(f"PRAGMA foreign_keys = {foreign_keys}")
+
+    # Refresh planner statistics for the new indexes
+    conn.execute("PRAGMA optimize")
+    return schema_version(conn)
+
+
+if __name__ == "__main__":
+    from services.patient_db import connection
+
+    with connection() as conn:
+        print(f"Schema version: {migrate(conn, verbose=True)}")
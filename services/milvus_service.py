@@ -1,50 +1,60 @@
-from pymilvus import connections, Collection
-from sentence_transformers import SentenceTransformer
-
-from configuration.config import EMBEDDING_MODEL, MILVUS_HOST, MILVUS_PORT, COLLECTION_NAME, METRIC_TYPE
+from configuration.config import METRIC_TYPE
+from services.resources import get_collection, get_embedder, get_embedding_cache
 
 
 class MilvusService:
     def __init__(self):
-        """Initialize Milvus connection and load the embedding model."""
-        # Connect to Milvus
-        connections.connect(host=MILVUS_HOST, port=MILVUS_PORT)
-
-        # Initialize the embedding model
-        self.embedder = SentenceTransformer(EMBEDDING_MODEL)
-
-        # Get collection
-        self.collection = Collection(name=COLLECTION_NAME)
+        """Attach to the process-wide Milvus collection and embedding model."""
+        self.embedder = get_embedder()
+        self.embedding_cache = get_embedding_cache()
 
-        # Load collection to memory
-        self.collection.load()
+        # Loaded collection (connects on first use)
+        self.collection = get_collection()
 
-    def search(self, query, top_k=5):
+    def search(self, query, top_k=5, store=True):
         """
         Search for similar embeddings in Milvus.
 
         Args:
             query: The query text to search for
             top_k: Number of top results to return
+            store: Whether the query's embedding may be kept in the on-disk cache
 
         Returns:
             List of matches with metadata
         """
-        # Generate embedding for query
-        query_embedding = self.embedder.encode(query).tolist()
+        return self.search_many([query], top_k, [store])[0]
+
+    def search_many(self, queries, top_k=5, store=None):
+        """
+        Search for several queries with one embedding batch and one Milvus request.
+
+        Args:
+            queries: List of query texts, e.g. the patient context plus sub-questions
+            top_k: Number of top results to return per query
+            store: Optional flags, one per query; pass False for queries carrying
+                patient data so their embeddings are not written to the disk cache
+
+        Returns:
+            One list of matches with metadata per query, in the same order as `queries`
+        """
+        if not queries:
+            return []
+
+        # Generate embeddings for all uncached queries in one batch
+        query_embeddings = self.embedding_cache.encode(
+            queries, self.embedder.encode, store).tolist()
 
         # Search in Milvus
         search_params = {"metric_type": METRIC_TYPE, "params": {
             "itopk_size": 16, "search_width": 16, "team_size": 8}}
         results = self.collection.search(
-            data=[query_embedding], anns_field="embedding", param=search_params, limit=top_k, output_fields=["text"])
+            data=query_embeddings, anns_field="embedding", param=search_params, limit=top_k, output_fields=["text"])
 
         # Format results
         matches = []
-        if results and len(results) > 0:
-            hits = results[0]  # Get hits from the first (and only) query
-            for hit in hits:
-                matches.append({"id": hit.id, "score": hit.score, "metadata": {
-                               "text": hit.entity.get("text")}})
+        for hits in results:
+            matches.append([{"id": hit.id, "score": hit.score, "metadata": {
+                "text": hit.entity.get("text")}} for hit in hits])
 
         return matches
@@ -0,0 +1,150 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from configuration.config import DATABASE_PATH, DATABASE_POOL_SIZE, SQLITE_CACHE_SIZE_KB, SQLITE_MMAP_SIZE
+
+
+class ConnectionPool:
+    """
+    Pool of SQLite connections to the patients database.
+
+    Connections are opened lazily (at most `max_size`), configured once with WAL
+    journaling, foreign keys and tuned pragmas, and lent to one thread at a time.
+    A thread that asks again while it already holds a connection gets the same one
+    back, so nested helpers share a connection and a transaction. Each connection
+    keeps its own prepared-statement cache, so repeated queries are not re-compiled.
+    """
+
+    def __init__(self, path, max_size=8, cache_size_kb=16384, mmap_size=268435456):
+        self.path = path
+        self.max_size = max_size
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+
+        self._idle = queue.LifoQueue()
+        self._all = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30,
+                               check_same_thread=False, cached_statements=256)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # Safe with WAL: a crash can lose the last commits but never corrupts the file
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{self.cache_size_kb}")
+        conn.execute(f"PRAGMA mmap_size={self.mmap_size}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA busy_timeout=30000")
+        # Enforce references so deleting a patient cascades to their rows
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    def acquire(self, timeout=30):
+        """Check out a connection, opening a new one while the pool is below max_size."""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if len(self._all) < self.max_size:
+                conn = self._connect()
+                self._all.append(conn)
+                return conn
+
+        return self._idle.get(timeout=timeout)
+
+    def release(self, conn):
+        """Return a connection to the pool, discarding any unfinished transaction."""
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """Context manager lending this thread's connection (re-entrant)."""
+        held = getattr(self._local, "conn", None)
+        if held is not None:
+            self._local.depth += 1
+            try:
+                yield held
+            finally:
+                self._local.depth -= 1
+            return
+
+        conn = self.acquire()
+        self._local.conn = conn
+        self._local.depth = 1
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self._local.depth = 0
+            self.release(conn)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Context manager for a write transaction, committed when the outermost
+        transaction block exits and rolled back if it raises.
+        """
+        with self.connection() as conn:
+            if getattr(self._local, "in_transaction", False):
+                yield conn
+                return
+
+            self._local.in_transaction = True
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                self._local.in_transaction = False
+
+    def close_all(self):
+        """Close every connection opened by the pool."""
+        with self._lock:
+            for conn in self._all:
+                conn.close()
+            self._all = []
+            self._idle = queue.LifoQueue()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Process-wide connection pool for the configured patients database."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DATABASE_PATH, DATABASE_POOL_SIZE,
+                                       SQLITE_CACHE_SIZE_KB, SQLITE_MMAP_SIZE)
+    return _pool
+
+
+def set_database_path(path):
+    """Point the process-wide pool at another database file, e.g. a staging copy."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close_all()
+        _pool = ConnectionPool(path, DATABASE_POOL_SIZE,
+                               SQLITE_CACHE_SIZE_KB, SQLITE_MMAP_SIZE)
+
+
+def connection():
+    """Shortcut for get_pool().connection()"""
+    return get_pool().connection()
+
+
+def transaction():
+    """Shortcut for get_pool().transaction()"""
+    return get_pool().transaction()
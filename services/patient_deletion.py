@@ -0,0 +1,91 @@
+import json
+import sys
+import threading
+import time
+
+from services.audit_log import INSERT_AUDIT_SQL, AuditLogError, get_audit_log, utc_timestamp, validate_event
+from services.patient_db import transaction
+from services.patient_snapshot import invalidate_patient_snapshot
+
+# Callbacks taking a patient id, run after a patient is erased so in-memory
+# per-patient state (cached answers and their question vectors, ...) goes too
+_purge_hooks = []
+_purge_hooks_lock = threading.Lock()
+
+
+def register_purge_hook(hook):
+    """Run `hook(patient_id)` for every patient erased from now on."""
+    with _purge_hooks_lock:
+        _purge_hooks.append(hook)
+
+
+def delete_patients(patient_ids, action="CONSENT_WITHDRAWN", purpose="CLINICAL_CARE"):
+    """
+    Erase patients and everything recorded about them in one transaction.
+
+    A single set-based DELETE on patients; symptoms, comorbidities and their
+    details, cv events and consents follow through ON DELETE CASCADE (through their
+    patient_id indexes), and triggers drop the summary and full-text rows. The
+    consent audit log is kept, and gets one `action` event per erased patient in
+    the same transaction, so no erasure commits without its audit record. Events
+    still queued in the background audit writer are flushed first, so the erasure
+    is logged after everything recorded about the patient before it.
+    Afterwards the patients' snapshots and any registered caches are purged.
+
+    Returns a dict with the number of patients deleted and the seconds taken.
+    """
+    patient_ids = list(dict.fromkeys(patient_ids))
+    validate_event(None, action, purpose)
+    start = time.time()
+
+    try:
+        get_audit_log().flush()
+    except AuditLogError as e:
+        # Already kept in the spill file and replayed later; not a reason to refuse erasure
+        print(f"Erasing patients with audit events pending replay: {e}", file=sys.stderr)
+
+    with transaction() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT patient_id FROM patients WHERE patient_id IN (SELECT value FROM json_each(?))",
+            (json.dumps(patient_ids),))
+        deleted = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "DELETE FROM patients WHERE patient_id IN (SELECT value FROM json_each(?))",
+            (json.dumps(deleted),))
+        timestamp = utc_timestamp()
+        cursor.executemany(INSERT_AUDIT_SQL, [
+            (patient_id, action, purpose, timestamp, None, None)
+            for patient_id in deleted])
+    deleted_seconds = time.time() - start
+
+    with _purge_hooks_lock:
+        hooks = list(_purge_hooks)
+    for patient_id in deleted:
+        invalidate_patient_snapshot(patient_id)
+        for hook in hooks:
+            hook(patient_id)
+
+    return {
+        "patients": len(deleted),
+        "delete_seconds": deleted_seconds,
+        "seconds": time.time() - start,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from services.patient_db import set_database_path
+    from configuration.config import DATABASE_PATH
+
+    parser = argparse.ArgumentParser(
+        description="Erase patients and all their data")
+    parser.add_argument("patient_ids", nargs="+", type=int)
+    parser.add_argument("--db", default=DATABASE_PATH)
+    args = parser.parse_args()
+
+    set_database_path(args.db)
+    stats = delete_patients(args.patient_ids)
+    print(f"Deleted {stats['patients']} patients in {stats['seconds'] * 1000:.1f} ms "
+          f"(transaction {stats['delete_seconds'] * 1000:.1f} ms)")
@@ -0,0 +1,109 @@
+from services.patient_db import connection
+
+PAGE_SIZE = 25
+
+
+def _like_prefix(text):
+    """LIKE pattern matching values that start with `text` (wildcards escaped)"""
+    escaped = text.replace("\\", "\\\\").replace(
+        "%", "\\%").replace("_", "\\_")
+    return escaped + "%"
+
+
+def search_patients(name_prefix=None, sex=None, hf_type=None, min_age=None, max_age=None,
+                    after_id=None, page_size=PAGE_SIZE):
+    """
+    One page of patients matching the filters, newest first. Pages are keyed on
+    patient_id rather than OFFSET: pass the `next_after_id` of a page as `after_id`
+    to get the next one, so every page costs the same however deep it is.
+
+    Returns (rows, next_after_id) where rows are (patient_id, patient_name, age,
+    sex, hf_type) tuples and next_after_id is None on the last page.
+    """
+    conditions = []
+    params = []
+    if name_prefix:
+        # Case-insensitive, served by idx_patient_summary_name
+        conditions.append("patient_name LIKE ? ESCAPE '\\'")
+        params.append(_like_prefix(name_prefix.strip()))
+    if sex:
+        conditions.append("sex = ?")
+        params.append(sex)
+    if hf_type:
+        conditions.append("hf_type = ?")
+        params.append(hf_type)
+    if min_age is not None:
+        conditions.append("age >= ?")
+        params.append(min_age)
+    if max_age is not None:
+        conditions.append("age <= ?")
+        params.append(max_age)
+    if after_id is not None:
+        conditions.append("patient_id < ?")
+        params.append(after_id)
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    with connection() as conn:
+        cursor = conn.cursor()
+        # One extra row tells whether there is a next page
+        cursor.execute(f"""
+            SELECT patient_id, patient_name, age, sex, hf_type
+              FROM patient_summary
+              {where}
+             ORDER BY patient_id DESC
+             LIMIT ?
+        """, params + [page_size + 1])
+        rows = cursor.fetchall()
+
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        return rows, rows[-1][0]
+    return rows, None
+
+
+def list_hf_types():
+    """Distinct heart failure types recorded, for the search filters"""
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT DISTINCT hf_type FROM patient_summary
+             WHERE hf_type IS NOT NULL ORDER BY hf_type
+        """)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def notes_match_query(text, columns=None):
+    """
+    FTS5 MATCH expression for free text: every word must appear (as a word or word
+    prefix), optionally only in the given columns. Words are quoted, so FTS
+    operators and punctuation typed by the user cannot break the query.
+    """
+    terms = " ".join('"{}"*'.format(word.replace('"', '""'))
+                     for word in text.split())
+    if not terms:
+        return None
+    if columns:
+        return f"{{{' '.join(columns)}}} : ({terms})"
+    return terms
+
+
+def search_patient_notes(text, columns=None, limit=50):
+    """
+    Patients whose free-text fields (plan, medications, devices, imaging and
+    Holter notes, ...) match all words of `text`, best match first.
+    Returns a list of (patient_id, score) with higher scores ranking better.
+    """
+    query = notes_match_query(text, columns)
+    if query is None:
+        return []
+
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT rowid, -rank
+              FROM patient_notes_fts
+             WHERE patient_notes_fts MATCH ?
+             ORDER BY rank
+             LIMIT ?
+        """, (query, limit))
+        return cursor.fetchall()
@@ -0,0 +1,122 @@
+import contextvars
+import json
+from contextlib import contextmanager
+from types import MappingProxyType
+
+from services.patient_db import connection
+
+# One round-trip for everything the chatbot needs about a patient: the patients row
+# itself plus the related rows, aggregated into one JSON column by SQLite's JSON1.
+# The related rows come back in the order of the per-patient indexes.
+SNAPSHOT_SQL = """
+    SELECT p.*,
+           json_object(
+               'symptoms', (
+                   SELECT json_group_array(json_object(
+                              'symptom', symptom, 'category', category,
+                              'severity', severity, 'duration', duration))
+                     FROM patient_symptoms
+                    WHERE patient_id = p.patient_id),
+               'comorbidities', (
+                   SELECT json_object(
+                              'hypertension', hypertension, 'diabetes', diabetes,
+                              'dyslipidemia', dyslipidemia, 'kidney_disease', kidney_disease,
+                              'obesity', obesity, 'sleep_apnea', sleep_apnea,
+                              'family_history', family_history)
+                     FROM patient_comorbidities
+                    WHERE patient_id = p.patient_id ORDER BY id LIMIT 1),
+               'comorbidity_details', (
+                   SELECT json_group_array(json_object(
+                              'detail_key', detail_key, 'detail_value', detail_value))
+                     FROM comorbidity_details
+                    WHERE comorbidity_record_id = (
+                          SELECT id FROM patient_comorbidities
+                           WHERE patient_id = p.patient_id ORDER BY id LIMIT 1)),
+               'cv_events', (
+                   SELECT json_group_array(json_object(
+                              'event_key', event_key,
+                              'event_present', json(CASE WHEN event_present THEN 'true' ELSE 'false' END)))
+                     FROM cv_events
+                    WHERE patient_id = p.patient_id)
+           ) AS snapshot_related
+      FROM patients p
+     WHERE p.patient_id = ?
+"""
+
+
+def _frozen_object(pairs):
+    # json object_hook: read-only mappings, with arrays turned into tuples
+    return MappingProxyType({key: tuple(value) if isinstance(value, list) else value
+                             for key, value in pairs.items()})
+
+
+def fetch_patient_snapshot(cursor, patient_id):
+    """
+    Retrieve all patient data in a single query. Returns a read-only mapping with
+    the patients columns plus symptoms, comorbidities, comorbidity_details and
+    cv_events, or None when the patient does not exist.
+    """
+    cursor.execute(SNAPSHOT_SQL, (patient_id,))
+    row = cursor.fetchone()
+    if not row:
+        return None  # Patient not found
+
+    columns = [desc[0] for desc in cursor.description[:-1]]
+    patient_data = dict(zip(columns, row))
+    patient_data.update(json.loads(row[-1], object_hook=_frozen_object))
+    if patient_data["comorbidities"] is None:
+        patient_data["comorbidities"] = MappingProxyType({})
+
+    if 'activity' in patient_data:
+        patient_data['physical_activity'] = patient_data['activity']
+
+    return MappingProxyType(patient_data)
+
+
+# Snapshots memoized for the current request (see snapshot_scope); None outside one
+_request_snapshots = contextvars.ContextVar("request_snapshots", default=None)
+
+
+@contextmanager
+def snapshot_scope():
+    """
+    Memoize patient snapshots for one request (a Streamlit rerun or a chat turn), so
+    its several lookups share one query. Nothing outlives the scope, so a patient
+    edited or erased by another process is never served from memory. Nested scopes
+    share the outermost memo.
+    """
+    if _request_snapshots.get() is not None:
+        yield
+        return
+
+    token = _request_snapshots.set({})
+    try:
+        yield
+    finally:
+        _request_snapshots.reset(token)
+
+
+def load_patient_snapshot(patient_id):
+    """fetch_patient_snapshot on a pooled connection, memoized inside a snapshot_scope"""
+    memo = _request_snapshots.get()
+    key = str(patient_id)
+    if memo is not None and key in memo:
+        return memo[key]
+
+    with connection() as conn:
+        snapshot = fetch_patient_snapshot(conn.cursor(), patient_id)
+
+    if memo is not None:
+        memo[key] = snapshot
+    return snapshot
+
+
+def invalidate_patient_snapshot(patient_id=None):
+    """Forget the current request's snapshot of a patient (or all) after a write"""
+    memo = _request_snapshots.get()
+    if memo is None:
+        return
+    if patient_id is None:
+        memo.clear()
+    else:
+        memo.pop(str(patient_id), None)
@@ -0,0 +1,101 @@
+import threading
+
+import httpx
+from pymilvus import connections, Collection
+from sentence_transformers import SentenceTransformer
+
+from configuration.config import EMBEDDING_MODEL, MILVUS_HOST, MILVUS_PORT, COLLECTION_NAME, VECTOR_DIM, EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_MAX_ENTRIES, ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_SIMILARITY, CHATBOT_MODEL, CHATBOT_API_KEY, CHATBOT_BASE_URL
+from services.answer_cache import AnswerCache
+from services.embedding_cache import EmbeddingCache
+from services.patient_deletion import register_purge_hook
+
+# Process-wide registry of expensive resources. Streamlit re-runs the script on every
+# interaction but keeps imported modules, so everything created here is shared by all
+# reruns and sessions of the process instead of being rebuilt each time.
+_resources = {}
+_lock = threading.Lock()
+
+def _get_or_create(name, factory):
+    """Returns the resource registered under `name`, creating it once on first use."""
+    resource = _resources.get(name)
+    if resource is None:
+        with _lock:
+            resource = _resources.get(name)
+            if resource is None:
+                resource = factory()
+                _resources[name] = resource
+    return resource
+
+
+def get_embedder():
+    """Shared SentenceTransformer used for all query embeddings."""
+    return _get_or_create("embedder", lambda: SentenceTransformer(EMBEDDING_MODEL))
+
+
+def get_embedding_cache():
+    """
+    Shared on-disk embedding cache for the configured model. Only text without
+    patient data may be stored in it: erasure cannot purge vectors.f32.
+    """
+    return _get_or_create("embedding_cache", lambda: EmbeddingCache(
+        EMBEDDING_CACHE_DIR, EMBEDDING_MODEL, VECTOR_DIM, EMBEDDING_CACHE_MAX_ENTRIES))
+
+
+def get_answer_cache():
+    """Shared cache of chatbot answers, so repeated questions skip the LLM call."""
+    def create():
+        cache = AnswerCache(ANSWER_CACHE_MAX_ENTRIES,
+                            ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_SIMILARITY)
+        # Erased patients' answers and question vectors must not outlive them
+        register_purge_hook(cache.invalidate_patient)
+        return cache
+
+    return _get_or_create("answer_cache", create)
+
+
+def get_collection():
+    """Shared, loaded handle on the guidelines collection (connects to Milvus once)."""
+    def connect():
+        connections.connect(host=MILVUS_HOST, port=MILVUS_PORT)
+        collection = Collection(COLLECTION_NAME)
+        collection.load()
+        return collection
+
+    return _get_or_create("collection", connect)
+
+
+def _api_key():
+    """The Groq API key from the environment variable named in config.yaml."""
+    if not CHATBOT_API_KEY:
+        raise RuntimeError(
+            f"Set the {CHATBOT_MODEL['api_key_env']} environment variable to the Groq API key")
+    return CHATBOT_API_KEY
+
+
+def get_llm_client():
+    """Shared Groq client; its HTTP connection pool is reused across requests."""
+    def connect():
+        from groq import Groq
+        return Groq(
+            api_key=_api_key(),
+            base_url=CHATBOT_BASE_URL,
+            http_client=httpx.Client(verify=False)
+        )
+
+    return _get_or_create("llm_client", connect)
+
+
+def create_async_llm_client(max_connections=100):
+    """
+    New AsyncGroq client on a pooled httpx.AsyncClient. Async clients are bound to
+    the event loop they are used on, so they are not kept in the registry.
+    """
+    from groq import AsyncGroq
+    return AsyncGroq(
+        api_key=_api_key(),
+        base_url=CHATBOT_BASE_URL,
+        http_client=httpx.AsyncClient(
+            verify=False,
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_connections))
+    )
@@ -1,9 +1,15 @@
-from utils import extract_text_from_pdf, extract_tables_from_pdf, clean_text
-from configuration.config import EMBEDDING_MODEL, MILVUS_HOST, MILVUS_PORT, COLLECTION_NAME, METRIC_TYPE, VECTOR_DIM, INDEX_TYPE
+from utils import extract_pdf_content, iter_page_content, bounded, clean_text
+from configuration.config import EMBEDDING_MODEL, MILVUS_HOST, MILVUS_PORT, COLLECTION_NAME, METRIC_TYPE, VECTOR_DIM, INDEX_TYPE, ENCODE_BATCH_SIZE, INSERT_BATCH_SIZE, INGEST_WORKERS, STREAM_QUEUE_SIZE, EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_MAX_ENTRIES
+from services.embedding_cache import EmbeddingCache
 from nltk.tokenize import sent_tokenize
 from pymilvus import connections, FieldSchema, CollectionSchema, DataType, Collection, utility
 from sentence_transformers import SentenceTransformer
 from tqdm import tqdm
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import hashlib
+import json
 import sys
 import os
 
@@ -14,8 +20,10 @@ if project_root not in sys.path:
 
 
 # Create collection if it doesn't exist
-def create_collection():
+def create_collection(drop_existing=True):
     if utility.has_collection(COLLECTION_NAME):
+        if not drop_existing:
+            return Collection(name=COLLECTION_NAME)
         utility.drop_collection(COLLECTION_NAME)
 
     fields = [
@@ -36,117 +44,344 @@ def create_collection():
     return collection
 
 
-# Embed and store in Milvus
-def store_embeddings(sections, collection):
-    """Embeds and stores extracted sections in Milvus"""
-    collection.load()
+# Chunk ids are derived from content so unchanged chunks keep their id across revisions
+def chunk_id(prefix, text):
+    """Returns a stable id for a chunk, e.g. chunk-<sha1 of text>."""
+    return f"{prefix}-{hashlib.sha1(text.encode('utf-8')).hexdigest()}"
+
+
+def fetch_existing_ids(collection, prefix):
+    """Returns the set of ids already stored in Milvus for the given prefix."""
+    existing = set()
+    iterator = collection.query_iterator(
+        batch_size=1000, expr=f'id like "{prefix}-%"', output_fields=["id"])
+    while True:
+        batch = iterator.next()
+        if not batch:
+            iterator.close()
+            break
+        existing.update(row["id"] for row in batch)
+    return existing
+
+
+def unique_rows(ids, texts, embed_texts):
+    """
+    Keeps the first chunk of every id. Ids are content hashes, so repeated
+    sections or tables (headers, footers, duplicate tables) would otherwise be
+    inserted under the same primary key twice.
+    """
+    rows = dict.fromkeys(ids)
+    for row in zip(ids, texts, embed_texts):
+        if rows[row[0]] is None:
+            rows[row[0]] = row
+    return [list(col) for col in zip(*rows.values())] or [[], [], []]
+
+
+def sync_entities(collection, prefix, ids, texts, embed_texts, pool=None):
+    """
+    Incrementally brings the `prefix` rows in Milvus in line with the given chunks.
+    Only chunks whose id is not stored yet are embedded and inserted; rows whose
+    id is no longer produced are deleted afterwards. The collection is never
+    dropped or released, so searches keep working while this runs.
+    """
+    existing = fetch_existing_ids(collection, prefix)
+
+    new_rows = {}
+    for row in zip(ids, texts, embed_texts):
+        if row[0] not in existing and row[0] not in new_rows:
+            new_rows[row[0]] = row
+    new_ids, new_texts, new_embed_texts = (
+        [list(col) for col in zip(*new_rows.values())] or [[], [], []])
+
+    if new_ids:
+        embed_and_insert(collection, new_ids, new_texts,
+                         new_embed_texts, pool)
+
+    # Delete stale rows only once their replacements are searchable
+    stale_ids = delete_ids(collection, existing - set(ids))
+
+    return len(new_ids), len(stale_ids)
+
+
+def delete_ids(collection, ids):
+    """Deletes the given ids from Milvus in batches and returns them sorted."""
+    ids = sorted(ids)
+    for i in range(0, len(ids), 1000):
+        collection.delete(f"id in {json.dumps(ids[i:i + 1000])}")
+    if ids:
+        collection.flush()
+    return ids
+
+
+# Embed a list of texts in large batches
+def encode_texts(texts, pool=None, batch_size=ENCODE_BATCH_SIZE):
+    """
+    Encodes texts in batches of `batch_size`, spread over a multi-process pool if given.
+    Texts found in the embedding cache skip the model entirely.
+    """
+    def encode_misses(misses):
+        if pool is not None:
+            return embedder.encode_multi_process(misses, pool, batch_size=batch_size)
+        return embedder.encode(misses, batch_size=batch_size, show_progress_bar=False)
+
+    return embedding_cache.encode(texts, encode_misses)
+
+
+def truncate_text(text):
+    """Truncates text to fit the Milvus VARCHAR limit."""
+    if len(text) > 65000:  # Leave some margin from 65535
+        text = text[:65000]
+    return text
+
+
+def insert_batches(collection, ids, texts, embeddings):
+    """Inserts rows into Milvus in INSERT_BATCH_SIZE batches"""
+    for i in range(0, len(ids), INSERT_BATCH_SIZE):
+        j = i + INSERT_BATCH_SIZE
+        collection.insert([ids[i:j], texts[i:j], embeddings[i:j].tolist()])
+
+
+def encode_window(pool=None):
+    """Number of chunks encoded per call: one batch per encoding process."""
+    workers = len(pool["processes"]) if pool is not None else 1
+    return ENCODE_BATCH_SIZE * workers
+
+
+def embed_and_insert_batches(collection, batches, pool=None):
+    """
+    Embeds and stores an iterable of (ids, texts, embed_texts) batches.
+    Each batch is inserted on a background thread while the next one is encoded,
+    so Milvus round-trips overlap with the matrix math.
+    """
+    count = 0
+    with ThreadPoolExecutor(max_workers=1) as inserter:
+        pending = None
+        for ids, texts, embed_texts in tqdm(batches, unit="batch"):
+            embeddings = encode_texts(embed_texts, pool)
+
+            # Wait for the previous batch before queuing the next one
+            if pending is not None:
+                pending.result()
+            pending = inserter.submit(
+                insert_batches, collection, ids, texts, embeddings)
+            count += len(ids)
+
+        if pending is not None:
+            pending.result()
 
-    entities = []
-    ids = []
+    # Flush to ensure data is committed
+    collection.flush()
+    return count
 
-    for i, section in tqdm(enumerate(sections), total=len(sections)):
-        section_id = f"chunk-{i}"
-        embedding = embedder.encode(section).tolist()
 
-        # Clean and truncate text if needed (Milvus has VARCHAR limits)
-        clean_section = clean_text(section)
-        if len(clean_section) > 65000:  # Leave some margin from 65535
-            clean_section = clean_section[:65000]
+def embed_and_insert(collection, ids, texts, embed_texts, pool=None):
+    """Embeds `embed_texts` window by window and stores them with `ids` and `texts`."""
+    window = encode_window(pool)
+    batches = ((ids[start:start + window], texts[start:start + window], embed_texts[start:start + window])
+               for start in range(0, len(ids), window))
+    return embed_and_insert_batches(collection, batches, pool)
 
-        ids.append(section_id)
-        entities.append([section_id, clean_section, embedding])
 
-    # Insert in batches if needed
-    batch_size = 50
-    for i in range(0, len(entities), batch_size):
-        batch = entities[i:i + batch_size]
+# Embed and store in Milvus
+def store_embeddings(sections, collection, pool=None, incremental=False):
+    """Embeds and stores extracted sections in Milvus"""
+    collection.load()
 
-        ids_batch = [item[0] for item in batch]
-        texts_batch = [item[1] for item in batch]
-        embeddings_batch = [item[2] for item in batch]
+    ids = [chunk_id("chunk", section) for section in sections]
+    # Clean and truncate text if needed (Milvus has VARCHAR limits)
+    texts = [truncate_text(clean_text(section)) for section in sections]
 
-        collection.insert([ids_batch, texts_batch, embeddings_batch])
+    if incremental:
+        added, removed = sync_entities(
+            collection, "chunk", ids, texts, sections, pool)
+        print(f"✅ Sections: {added} added, {removed} removed")
+        return
 
-    # Flush to ensure data is committed
-    collection.flush()
-    print(f"✅ Inserted {len(entities)} sections into Milvus")
+    ids, texts, sections = unique_rows(ids, texts, sections)
+    embed_and_insert(collection, ids, texts, sections, pool)
+    print(f"✅ Inserted {len(ids)} sections into Milvus")
 
 
 # Chunk long text into manageable pieces
 def chunk_text(text, max_chunk_size=200):
-    sentences = sent_tokenize(text)
-    chunks = []
+    return list(pack_sentences(sent_tokenize(text), max_chunk_size))
+
+
+def pack_sentences(sentences, max_chunk_size=200):
+    """Greedily packs consecutive sentences into chunks of at most max_chunk_size characters."""
     current_chunk = ""
     for sentence in sentences:
         if len(current_chunk) + len(sentence) <= max_chunk_size:
             current_chunk += " " + sentence
         else:
-            chunks.append(current_chunk.strip())
+            yield current_chunk.strip()
             current_chunk = sentence
     if current_chunk:
-        chunks.append(current_chunk.strip())
-    return chunks
-
-
-def process_and_store_tables(tables, collection):
-    """Convert extracted tables to text, embed them, and store in Milvus."""
+        yield current_chunk.strip()
+
+
+def iter_sentences(blocks):
+    """Yields the sentences of a stream of cleaned text blocks, joining sentences that span blocks."""
+    pending = ""
+    for block in blocks:
+        pending = f"{pending} {block}".strip()
+        sentences = sent_tokenize(pending)
+        # The last sentence may continue in the next block
+        pending = sentences.pop() if sentences else ""
+        yield from sentences
+    if pending:
+        yield from sent_tokenize(pending)
+
+
+def iter_batches(rows, size):
+    """Groups (id, text, embed_text) rows into (ids, texts, embed_texts) batches of `size`."""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield tuple(list(col) for col in zip(*batch))
+            batch = []
+    if batch:
+        yield tuple(list(col) for col in zip(*batch))
+
+
+def iter_pdf_rows(pdf_paths, workers=1, max_chunk_size=200):
+    """
+    Streams (id, text, embed_text) rows for the tables and text chunks of the PDFs.
+    Pages feed text blocks, blocks are cleaned and split into sentences, and
+    sentences are packed into chunks, without materializing the whole document.
+    """
+    pages = bounded(iter_page_content(pdf_paths, workers=workers),
+                    maxsize=STREAM_QUEUE_SIZE)
+    tables = deque()
+
+    def text_blocks():
+        for page_tables, page_blocks in pages:
+            tables.extend(page_tables)
+            for block in page_blocks:
+                yield clean_text(block)
+
+    def table_rows():
+        while tables:
+            table_text = clean_text(tables.popleft())
+            yield chunk_id("table", table_text), truncate_text(table_text), table_text
+
+    for section in pack_sentences(iter_sentences(text_blocks()), max_chunk_size):
+        yield from table_rows()
+        yield chunk_id("chunk", section), truncate_text(clean_text(section)), section
+    yield from table_rows()
+
+
+def stream_and_store(pdf_paths, collection, pool=None, workers=1, incremental=False):
+    """
+    Streaming ingestion of one or more PDFs. Parsing, chunking and embedding run as
+    stages connected by bounded queues, so memory stays flat and the first batches
+    reach Milvus while later pages are still being parsed.
+    In incremental mode, stored chunks are skipped and stale ones deleted at the end.
+    """
     collection.load()
 
-    table_entities = []
-    table_ids = []
+    existing = set()
+    if incremental:
+        existing = fetch_existing_ids(
+            collection, "table") | fetch_existing_ids(collection, "chunk")
+    seen = set()
 
-    for idx, table_text in enumerate(tables):
-        table_id = f"table-{idx}"
-        clean_table_text = clean_text(table_text)
+    def new_rows():
+        for row in iter_pdf_rows(pdf_paths, workers):
+            if row[0] in seen:
+                continue
+            seen.add(row[0])
+            if row[0] not in existing:
+                yield row
 
-        # Embed table text
-        embedding = embedder.encode(clean_table_text).tolist()
+    batches = bounded(iter_batches(new_rows(), encode_window(pool)),
+                      maxsize=STREAM_QUEUE_SIZE)
+    added = embed_and_insert_batches(collection, batches, pool)
+    removed = delete_ids(collection, existing - seen)
+    print(f"✅ Streamed {added} new chunks into Milvus, removed {len(removed)}")
 
-        # Handle VARCHAR length limit
-        if len(clean_table_text) > 65000:
-            clean_table_text = clean_table_text[:65000]
 
-        table_ids.append(table_id)
-        table_entities.append([table_id, clean_table_text, embedding])
+def process_and_store_tables(tables, collection, pool=None, incremental=False):
+    """Convert extracted tables to text, embed them, and store in Milvus."""
+    collection.load()
 
-    # Insert in batches
-    batch_size = 50
-    for i in range(0, len(table_entities), batch_size):
-        batch = table_entities[i:i + batch_size]
-        ids_batch = [item[0] for item in batch]
-        texts_batch = [item[1] for item in batch]
-        embeddings_batch = [item[2] for item in batch]
+    clean_tables = [clean_text(table_text) for table_text in tables]
+    ids = [chunk_id("table", table_text) for table_text in clean_tables]
+    # Handle VARCHAR length limit
+    texts = [truncate_text(table_text) for table_text in clean_tables]
 
-        collection.insert([ids_batch, texts_batch, embeddings_batch])
+    if incremental:
+        added, removed = sync_entities(
+            collection, "table", ids, texts, clean_tables, pool)
+        print(f"✅ Tables: {added} added, {removed} removed")
+        return
 
-    collection.flush()
-    print(f"✅ Inserted {len(table_entities)} tables into Milvus")
+    ids, texts, clean_tables = unique_rows(ids, texts, clean_tables)
+    embed_and_insert(collection, ids, texts, clean_tables, pool)
+    print(f"✅ Inserted {len(ids)} tables into Milvus")
 
 
 if __name__ == "__main__":
+    # PDF File Path
+    PDF_PATH = r"C:\Users\reema\OneDrive\Desktop\thesis\heart-failure-guidelines\esc_guidelines1.pdf"
+
+    parser = argparse.ArgumentParser(
+        description="Embed the ESC guidelines and store them in Milvus")
+    parser.add_argument("pdf_paths", nargs="*", default=[PDF_PATH],
+                        help="guideline PDFs to index")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS,
+                        help="number of encoding worker processes")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only embed new or changed chunks and delete stale ones "
+                             "instead of rebuilding the collection")
+    parser.add_argument("--stream", action="store_true",
+                        help="parse, chunk and embed page by page instead of "
+                             "loading whole documents into memory")
+    args = parser.parse_args()
+
     embedder = SentenceTransformer(EMBEDDING_MODEL)
+    embedding_cache = EmbeddingCache(
+        EMBEDDING_CACHE_DIR, EMBEDDING_MODEL, VECTOR_DIM, EMBEDDING_CACHE_MAX_ENTRIES)
     connections.connect(host=MILVUS_HOST, port=MILVUS_PORT)
 
-    # PDF File Path
-    PDF_PATH = r"C:\Users\reema\OneDrive\Desktop\thesis\heart-failure-guidelines\esc_guidelines1.pdf"
+    # Spread encoding over several CPU processes if requested
+    pool = None
+    if args.workers > 1:
+        pool = embedder.start_multi_process_pool(
+            target_devices=["cpu"] * args.workers)
 
     # Create or get the collection
-    collection = create_collection()
-
-    # --- Extract Tables ---
-    tables_data = extract_tables_from_pdf(
-        PDF_PATH, difference_between_each_row=100)
-    # with open("tables.json", "w", encoding="utf-8") as f:
-    #     json.dump(tables_data, f, indent=4)
-    #     print("✅ Tables extracted and saved to tables.json!")
-
-    # --- Store Tables in Milvus ---
-    process_and_store_tables(tables_data, collection)
-
-    # # --- Extract Text Sections ---
-    raw_text = extract_text_from_pdf(PDF_PATH)
-    raw_text = clean_text(raw_text)
-    sections = chunk_text(raw_text)
-    store_embeddings(sections, collection)
+    collection = create_collection(drop_existing=not args.incremental)
+
+    if args.stream:
+        stream_and_store(args.pdf_paths, collection, pool,
+                         workers=args.workers, incremental=args.incremental)
+    else:
+        # --- Extract Tables and Text in one pass over each PDF ---
+        tables_data = []
+        text_blocks = []
+        for pdf_path in args.pdf_paths:
+            pdf_tables, pdf_blocks = extract_pdf_content(
+                pdf_path, difference_between_each_row=100, workers=args.workers)
+            tables_data.extend(pdf_tables)
+            text_blocks.extend(pdf_blocks)
+        # with open("tables.json", "w", encoding="utf-8") as f:
+        #     json.dump(tables_data, f, indent=4)
+        #     print("✅ Tables extracted and saved to tables.json!")
+
+        # --- Store Tables in Milvus ---
+        process_and_store_tables(
+            tables_data, collection, pool, incremental=args.incremental)
+
+        # # --- Extract Text Sections ---
+        raw_text = "\n".join(text_blocks)
+        raw_text = clean_text(raw_text)
+        sections = chunk_text(raw_text)
+        store_embeddings(sections, collection, pool,
+                         incremental=args.incremental)
+
+    if pool is not None:
+        embedder.stop_multi_process_pool(pool)
 
     print("✅ All content stored successfully with vector embeddings in Milvus!")
@@ -0,0 +1,114 @@
+import os
+import sys
+import tempfile
+import types
+
+import numpy as np
+import pytest
+
+# The modules under test live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.audit_log import get_audit_log  # noqa: E402
+from services.migrations import migrate  # noqa: E402
+from services.patient_db import connection, set_database_path  # noqa: E402
+
+# Importing form.py migrates whatever database the pool points at, so point it at a
+# scratch file before any test module imports it: tests never touch patients.db
+set_database_path(os.path.join(tempfile.mkdtemp(prefix="hf-tests-"), "patients.db"))
+
+
+@pytest.fixture
+def patient_db(tmp_path):
+    """A fresh, fully migrated patients database behind the process-wide pool"""
+    path = str(tmp_path / "patients.db")
+    set_database_path(path)
+    with connection() as conn:
+        migrate(conn)
+    yield path
+    # Audit events queued by this test belong in this test's database
+    get_audit_log().flush()
+
+
+# -------------------- Chatbot doubles --------------------
+
+class FakeHit:
+    def __init__(self, hit_id, text):
+        self.id = hit_id
+        self.score = 0.0
+        self.entity = {"text": text}
+
+
+class FakeCollection:
+    """Milvus collection double: every query vector gets the same hits; searches are recorded"""
+
+    def __init__(self, hits=3):
+        self.hits = [FakeHit(i, f"guideline {i}") for i in range(hits)]
+        self.searches = []
+
+    def search(self, data, anns_field, param, limit, output_fields):
+        self.searches.append(data)
+        return [self.hits[:limit] for _ in data]
+
+
+class FakeEmbedder:
+    """SentenceTransformer double with distinct, deterministic vectors; batches are recorded"""
+
+    def __init__(self, dim):
+        self.dim = dim
+        self.batches = []
+
+    def encode(self, texts, **kwargs):
+        self.batches.append(list(texts))
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            vectors[row, sum(map(ord, text)) % self.dim] = 1.0
+        return vectors
+
+
+def fake_completion(content):
+    message = types.SimpleNamespace(content=content)
+    return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)])
+
+
+def fake_chunks(pieces):
+    for piece in pieces:
+        delta = types.SimpleNamespace(content=piece)
+        yield types.SimpleNamespace(choices=[types.SimpleNamespace(delta=delta)])
+
+
+class FakeCompletions:
+    """Groq chat.completions double answering with `pieces`; requests are recorded"""
+
+    def __init__(self, pieces=("Rest ", "and ", "weigh daily.")):
+        self.pieces = list(pieces)
+        self.requests = []
+
+    def create(self, messages, model, stream=False):
+        self.requests.append(messages)
+        if stream:
+            return fake_chunks(self.pieces)
+        return fake_completion("".join(self.pieces))
+
+
+@pytest.fixture
+def chat_resources(monkeypatch, tmp_path):
+    """The process-wide chatbot resources, replaced by doubles and fresh caches"""
+    resources = pytest.importorskip("services.resources")
+    from services.answer_cache import AnswerCache
+    from services.embedding_cache import EmbeddingCache
+
+    dim = 8
+    fakes = types.SimpleNamespace(
+        collection=FakeCollection(),
+        embedder=FakeEmbedder(dim),
+        embedding_cache=EmbeddingCache(str(tmp_path / "embeddings"), "test-model", dim, 100),
+        answer_cache=AnswerCache(100, 60, 0.95),
+        completions=FakeCompletions())
+    client = types.SimpleNamespace(chat=types.SimpleNamespace(completions=fakes.completions))
+    monkeypatch.setattr(resources, "_resources", {
+        "collection": fakes.collection, "embedder": fakes.embedder,
+        "embedding_cache": fakes.embedding_cache, "answer_cache": fakes.answer_cache,
+        "llm_client": client})
+    yield fakes
+    fakes.embedding_cache.close()
@@ -0,0 +1,98 @@
+from types import MappingProxyType
+
+import numpy as np
+import pytest
+
+from services import answer_cache
+from services.answer_cache import AnswerCache, patient_fingerprint
+
+PATIENT = MappingProxyType({"patient_name": "Ada", "age": 71,
+                            "symptoms": (MappingProxyType({"symptom": "Dyspnea"}),)})
+CHUNKS = [3, 1, 4]
+
+
+def vector(*values):
+    return np.array(values, dtype=np.float32)
+
+
+@pytest.fixture
+def cache():
+    return AnswerCache(max_entries=3, ttl_seconds=60, similarity_threshold=0.95)
+
+
+def test_exact_question_hits_after_normalization(cache):
+    cache.store(1, PATIENT, "patient", "What dose?", CHUNKS, "10 mg")
+
+    assert cache.lookup(1, PATIENT, "patient", "  what   DOSE? ", CHUNKS) == "10 mg"
+    assert cache.lookup("1", PATIENT, "patient", "What dose?", CHUNKS) == "10 mg"
+
+
+def test_answers_are_scoped_to_mode_chunks_and_patient(cache):
+    cache.store(1, PATIENT, "patient", "What dose?", CHUNKS, "10 mg")
+
+    assert cache.lookup(1, PATIENT, "doc", "What dose?", CHUNKS) is None
+    assert cache.lookup(1, PATIENT, "patient", "What dose?", [3, 1]) is None
+    assert cache.lookup(2, PATIENT, "patient", "What dose?", CHUNKS) is None
+
+
+def test_similar_question_vectors_hit(cache):
+    cache.store(1, PATIENT, "patient", "What dose?", CHUNKS, "10 mg", vector(1, 0, 0))
+    cache.store(1, PATIENT, "patient", "Side effects?", CHUNKS, "cough", vector(0, 1, 0))
+
+    assert cache.lookup(1, PATIENT, "patient", "Which dosage?", CHUNKS, vector(5, 0.5, 0)) == "10 mg"
+    assert cache.lookup(1, PATIENT, "patient", "Adverse effects?", CHUNKS, vector(0.1, 2, 0)) == "cough"
+    assert cache.lookup(1, PATIENT, "patient", "Unrelated?", CHUNKS, vector(1, 1, 0)) is None
+    assert cache.lookup(1, PATIENT, "patient", "Which dosage?", CHUNKS) is None
+
+
+def test_changed_patient_data_drops_their_answers(cache):
+    cache.store(1, PATIENT, "patient", "What dose?", CHUNKS, "10 mg")
+    cache.store(2, PATIENT, "patient", "What dose?", CHUNKS, "20 mg")
+    edited = MappingProxyType({**PATIENT, "age": 72})
+
+    assert cache.lookup(1, edited, "patient", "What dose?", CHUNKS) is None
+    # Even the old data no longer hits: its entries are gone
+    assert cache.lookup(1, PATIENT, "patient", "What dose?", CHUNKS) is None
+    assert cache.lookup(2, PATIENT, "patient", "What dose?", CHUNKS) == "20 mg"
+
+
+def test_invalidate_patient(cache):
+    cache.store(1, PATIENT, "patient", "What dose?", CHUNKS, "10 mg")
+    cache.store(1, PATIENT, "doc", "What dose?", CHUNKS, "5 mg")
+
+    cache.invalidate_patient("1")
+
+    assert cache.lookup(1, PATIENT, "patient", "What dose?", CHUNKS) is None
+    assert cache.lookup(1, PATIENT, "doc", "What dose?", CHUNKS) is None
+    assert cache._entries == {} and cache._groups == {}
+
+
+def test_least_recently_used_entry_is_evicted(cache):
+    for question in ("a", "b", "c"):
+        cache.store(1, PATIENT, "patient", question, CHUNKS, question.upper())
+    cache.lookup(1, PATIENT, "patient", "a", CHUNKS)
+
+    cache.store(1, PATIENT, "patient", "d", CHUNKS, "D")
+
+    assert [cache.lookup(1, PATIENT, "patient", q, CHUNKS) for q in "abcd"] == ["A", None, "C", "D"]
+
+
+def test_expired_entries_miss_and_are_swept(cache, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "time", lambda: now[0])
+    cache.store(1, PATIENT, "patient", "old", CHUNKS, "stale")
+
+    now[0] += 61
+    assert cache.lookup(1, PATIENT, "patient", "old", CHUNKS) is None
+
+    cache.store(1, PATIENT, "patient", "older", CHUNKS, "stale too")
+    now[0] += 61
+    cache.store(2, PATIENT, "patient", "new", CHUNKS, "fresh")
+    assert [key[1] for key in cache._entries] == ["new"]
+
+
+def test_fingerprint_covers_nested_read_only_data():
+    other = MappingProxyType({**PATIENT, "symptoms": (MappingProxyType({"symptom": "Edema"}),)})
+
+    assert patient_fingerprint(PATIENT) == patient_fingerprint(MappingProxyType(dict(PATIENT)))
+    assert patient_fingerprint(PATIENT) != patient_fingerprint(other)
@@ -0,0 +1,130 @@
+import asyncio
+import threading
+import types
+
+import pytest
+
+from form import save_encounter
+
+pytest.importorskip("pymilvus")
+pytest.importorskip("sentence_transformers")
+
+from services import async_chatbot_service  # noqa: E402
+from services.async_chatbot_service import AsyncChatbotService, ask_concurrently  # noqa: E402
+
+
+class AsyncCompletions:
+    """AsyncGroq chat.completions over the synchronous double in conftest"""
+
+    def __init__(self, completions):
+        self.completions = completions
+
+    async def create(self, messages, model, stream=False):
+        response = self.completions.create(messages, model, stream)
+        if not stream:
+            return response
+
+        async def chunks():
+            for chunk in response:
+                yield chunk
+        return chunks()
+
+
+@pytest.fixture
+def clients(chat_resources, monkeypatch):
+    """AsyncGroq clients the service creates; each records whether it was closed"""
+    created = []
+
+    def create_async_llm_client(max_connections=100):
+        async def close():
+            client.closed = True
+
+        client = types.SimpleNamespace(
+            chat=types.SimpleNamespace(completions=AsyncCompletions(chat_resources.completions)),
+            close=close, closed=False, max_connections=max_connections)
+        created.append(client)
+        return client
+
+    monkeypatch.setattr(async_chatbot_service, "create_async_llm_client", create_async_llm_client)
+    return created
+
+
+@pytest.fixture
+def patient_id(patient_db):
+    return save_encounter({"patient_name": "Ada", "age": 71, "hf_type": "HFrEF"})
+
+
+def run(coroutine_function, *args):
+    """Runs coroutine_function(service, *args) on a fresh service and event loop"""
+    async def main():
+        service = AsyncChatbotService()
+        try:
+            return await coroutine_function(service, *args)
+        finally:
+            await service.close()
+    return asyncio.run(main())
+
+
+async def collect(stream):
+    return [piece async for piece in stream]
+
+
+@pytest.mark.parametrize("mode", ["Patient", "Doctor"])
+def test_turn_matches_the_sync_service(clients, chat_resources, patient_id, mode):
+    answer = run(lambda service: service.generate_response(patient_id, "Which dose?", mode))
+
+    assert answer == "Rest and weigh daily."
+    context, question = chat_resources.embedder.batches[0]
+    assert "Name: Ada" in context and question == "Which dose?"
+    assert len(chat_resources.embedder.batches) == 1
+    assert len(chat_resources.collection.searches) == 1
+    assert clients[0].closed
+
+
+def test_cached_answer_skips_the_llm(clients, chat_resources, patient_id):
+    run(lambda service: service.generate_response(patient_id, "Which dose?"))
+    chat_resources.completions.pieces = ["other answer"]
+
+    assert run(lambda service: service.generate_response(patient_id, "Which dose?")) == "Rest and weigh daily."
+    assert len(chat_resources.completions.requests) == 1
+
+
+def test_stream_response_yields_pieces_then_caches(clients, chat_resources, patient_id):
+    pieces = run(lambda service: collect(service.stream_response(patient_id, "Which dose?", "Doctor")))
+
+    assert pieces == ["Rest ", "and ", "weigh daily."]
+    assert run(lambda service: collect(service.stream_response(patient_id, "Which dose?", "Doctor"))) == \
+        ["Rest and weigh daily."]
+
+
+def test_missing_patient(clients, patient_db):
+    message = "Patient not found. Please check the patient ID."
+
+    assert run(lambda service: service.generate_response(404, "Which dose?")) == message
+    assert run(lambda service: collect(service.stream_response(404, "Which dose?"))) == [message]
+
+
+def test_blocking_work_of_sessions_overlaps(clients, chat_resources, patient_id):
+    # Each turn's embedding waits for the other's: only possible off the event loop
+    both_embedding = threading.Barrier(2, timeout=5)
+    encode = chat_resources.embedder.encode
+
+    def encode_together(texts, **kwargs):
+        both_embedding.wait()
+        return encode(texts, **kwargs)
+
+    chat_resources.embedder.encode = encode_together
+
+    async def two_turns(service):
+        return await asyncio.gather(service.generate_response(patient_id, "Which dose?"),
+                                    service.generate_response(patient_id, "How much salt?"))
+
+    assert run(two_turns) == ["Rest and weigh daily."] * 2
+
+
+def test_ask_concurrently(clients, patient_id):
+    answers, seconds = asyncio.run(ask_concurrently(patient_id, "Which dose?", "Doctor", sessions=3))
+
+    assert answers == ["Rest and weigh daily."] * 3
+    assert seconds >= 0
+    assert clients[0].max_connections == 3 and clients[0].closed
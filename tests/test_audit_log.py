@@ -0,0 +1,115 @@
+import os
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from services.audit_log import AuditLogError, AuditLogWriter
+from services.patient_db import connection
+
+
+@pytest.fixture
+def writer(patient_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(AuditLogWriter, "RETRY_SECONDS", 0.05)
+    writer = AuditLogWriter(max_queue=100, batch_size=10, flush_interval=0.01,
+                            spill_path=str(tmp_path / "spill.jsonl"))
+    yield writer
+    writer.close()
+
+
+def audit_rows():
+    with connection() as conn:
+        return conn.execute("SELECT patient_id, action, purpose, user_agent "
+                            "FROM consent_audit_log ORDER BY id").fetchall()
+
+
+def block_inserts(patient_db):
+    conn = sqlite3.connect(patient_db)
+    conn.execute("CREATE TRIGGER block_audit BEFORE INSERT ON consent_audit_log "
+                 "BEGIN SELECT RAISE(ABORT, 'rejected'); END")
+    conn.commit()
+    return conn
+
+
+def test_events_are_written_in_order(writer):
+    writer.log(1, "CONSENT_GIVEN", "CLINICAL_CARE")
+    writer.log_many([(i, "CONSENT_GIVEN", "AI_TRAINING", None, "ui") for i in range(2, 30)])
+    writer.flush()
+
+    rows = audit_rows()
+    assert [row[0] for row in rows] == list(range(1, 30))
+    assert rows[1] == (2, "CONSENT_GIVEN", "AI_TRAINING", "ui")
+
+
+def test_invalid_events_are_rejected_before_queueing(writer):
+    with pytest.raises(ValueError):
+        writer.log(1, None, "CLINICAL_CARE")
+    with pytest.raises(ValueError):
+        writer.log_many([(1, "A", "P", None, None), (2, "A", object(), None, None)])
+    writer.flush()
+
+    # log_many validates the whole list first, so nothing of it was queued
+    assert audit_rows() == []
+
+
+def test_locked_database_is_retried(writer, patient_db):
+    locker = sqlite3.connect(patient_db, isolation_level=None, check_same_thread=False)
+    locker.execute("BEGIN IMMEDIATE")
+    writer.log(1, "CONSENT_GIVEN", "CLINICAL_CARE")
+    release = threading.Timer(0.3, locker.rollback)
+    release.start()
+
+    writer.flush()
+
+    release.join()
+    assert audit_rows() == [(1, "CONSENT_GIVEN", "CLINICAL_CARE", None)]
+
+
+def test_rejected_events_are_kept_and_replayed(writer, patient_db):
+    blocker = block_inserts(patient_db)
+    writer.log(1, "CONSENT_GIVEN", "CLINICAL_CARE", user_agent=b"\x00raw")
+    writer.log(2, "CONSENT_WITHDRAWN", "CLINICAL_CARE")
+
+    with pytest.raises(AuditLogError):
+        writer.flush()
+    assert audit_rows() == []
+    assert len(open(writer.spill_path).read().splitlines()) == 2
+
+    blocker.execute("DROP TRIGGER block_audit")
+    blocker.commit()
+    writer.flush()
+
+    assert audit_rows() == [(1, "CONSENT_GIVEN", "CLINICAL_CARE", b"\x00raw"),
+                            (2, "CONSENT_WITHDRAWN", "CLINICAL_CARE", None)]
+    assert not os.path.exists(writer.spill_path)
+
+
+def test_spilled_events_survive_a_restart(writer, patient_db):
+    blocker = block_inserts(patient_db)
+    writer.log(7, "CONSENT_GIVEN", "QUALITY_RESEARCH")
+    with pytest.raises(AuditLogError):
+        writer.flush()
+    writer.close()
+    blocker.execute("DROP TRIGGER block_audit")
+    blocker.commit()
+
+    restarted = AuditLogWriter(spill_path=writer.spill_path, flush_interval=0.01)
+    try:
+        deadline = time.time() + 5
+        while not audit_rows() and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        restarted.close()
+
+    assert audit_rows() == [(7, "CONSENT_GIVEN", "QUALITY_RESEARCH", None)]
+    assert not os.path.exists(writer.spill_path)
+
+
+def test_close_drains_the_queue(patient_db):
+    writer = AuditLogWriter(flush_interval=0.01)
+    writer.log_many([(i, "CONSENT_GIVEN", "CLINICAL_CARE", None, None) for i in range(50)])
+
+    writer.close()
+
+    assert len(audit_rows()) == 50
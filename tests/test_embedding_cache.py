@@ -0,0 +1,153 @@
+import os
+import sqlite3
+
+import numpy as np
+import pytest
+
+from services.embedding_cache import EmbeddingCache
+
+DIM = 8
+
+
+class CountingEncoder:
+    """Deterministic stand-in for SentenceTransformer.encode that records its calls"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return np.stack([self.vector(text) for text in texts])
+
+    @staticmethod
+    def vector(text):
+        rng = np.random.default_rng(sum(map(ord, " ".join(text.split()))))
+        return rng.normal(size=DIM).astype(np.float32)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "org/model-v1", DIM, max_entries=3)
+    yield cache
+    cache.close()
+
+
+def index_rows(cache):
+    return cache._index.execute("SELECT key, slot, last_used, checksum FROM entries").fetchall()
+
+
+def test_only_misses_are_encoded_once_each(cache):
+    encoder = CountingEncoder()
+
+    first = cache.encode(["a", "b", "a"], encoder)
+    second = cache.encode(["b", " b ", "c"], encoder)
+
+    assert encoder.calls == [["a", "b"], ["c"]]
+    np.testing.assert_array_equal(first[0], first[2])
+    np.testing.assert_array_equal(second[0], first[1])
+    np.testing.assert_array_equal(second[1], first[1])
+    assert second.dtype == np.float32 and second.shape == (3, DIM)
+
+
+def test_unstored_texts_never_reach_the_cache(cache):
+    encoder = CountingEncoder()
+
+    vectors = cache.encode(["Patient: Ada, 71", "what dose?"], encoder, store=[False, True])
+    cache.encode(["Patient: Ada, 71"], encoder, store=[False])
+
+    # Encoded in one batch with the miss, and again next time: it was never stored
+    assert encoder.calls == [["Patient: Ada, 71", "what dose?"], ["Patient: Ada, 71"]]
+    assert len(index_rows(cache)) == 1
+    assert cache.get_many(["Patient: Ada, 71"]) == [None]
+    np.testing.assert_array_equal(vectors[0], CountingEncoder.vector("Patient: Ada, 71"))
+
+
+def test_same_text_stored_and_unstored_in_one_call(cache):
+    encoder = CountingEncoder()
+
+    vectors = cache.encode(["q", "q"], encoder, store=[False, True])
+
+    assert encoder.calls == [["q", "q"]]
+    np.testing.assert_array_equal(vectors[0], vectors[1])
+    assert len(index_rows(cache)) == 1
+
+
+def test_least_recently_used_entry_is_evicted(cache, monkeypatch):
+    monkeypatch.setattr(EmbeddingCache, "TOUCH_INTERVAL", 0.0)
+    encoder = CountingEncoder()
+    cache.encode(["a", "b", "c"], encoder)
+    for age, text in enumerate(["a", "b", "c"]):
+        cache._index.execute("UPDATE entries SET last_used = ? WHERE key = ?", (age, cache._key(text)))
+    cache.encode(["a"], encoder)
+
+    cache.encode(["d"], encoder)
+
+    assert [vector is None for vector in cache.get_many(["a", "b", "c", "d"])] == [False, True, False, False]
+    assert sorted(row[1] for row in index_rows(cache)) == [0, 1, 2]
+
+
+def test_hits_touch_last_used_only_after_the_interval(cache, monkeypatch):
+    cache.encode(["a"], CountingEncoder())
+    cache._index.execute("UPDATE entries SET last_used = 0")
+
+    monkeypatch.setattr(EmbeddingCache, "TOUCH_INTERVAL", 1e12)
+    cache.get_many(["a"])
+    assert index_rows(cache)[0][2] == 0
+
+    monkeypatch.setattr(EmbeddingCache, "TOUCH_INTERVAL", 60.0)
+    cache.get_many(["a"])
+    assert index_rows(cache)[0][2] > 0
+
+
+def test_checksum_mismatch_is_a_miss(cache):
+    encoder = CountingEncoder()
+    cache.encode(["a"], encoder)
+    slot = index_rows(cache)[0][1]
+
+    # What a reader sees when another process recycles the slot mid-read
+    vectors = cache._mapped_rows(slot + 1)
+    vectors[slot] = np.ones(DIM, dtype=np.float32)
+    vectors.flush()
+
+    assert cache.get_many(["a"]) == [None]
+
+
+def test_cache_persists_across_instances(tmp_path):
+    encoder = CountingEncoder()
+    first = EmbeddingCache(str(tmp_path), "org/model-v1", DIM, max_entries=10)
+    expected = first.encode(["a", "b"], encoder)
+    first.close()
+
+    second = EmbeddingCache(str(tmp_path), "org/model-v1", DIM, max_entries=10)
+    try:
+        np.testing.assert_array_equal(second.encode(["a", "b"], encoder), expected)
+    finally:
+        second.close()
+    assert len(encoder.calls) == 1
+    assert os.listdir(tmp_path) == ["org_model-v1"]
+
+
+def test_caches_without_checksums_are_backfilled(tmp_path):
+    first = EmbeddingCache(str(tmp_path), "m", DIM, max_entries=10)
+    expected = first.encode(["a", "b"], CountingEncoder())
+    first.close()
+
+    # Rebuild the index as it was before the checksum column existed
+    index_path = os.path.join(tmp_path, "m", "index.sqlite")
+    conn = sqlite3.connect(index_path)
+    conn.executescript("""
+        CREATE TABLE old (key TEXT PRIMARY KEY, slot INTEGER NOT NULL UNIQUE, last_used REAL NOT NULL);
+        INSERT INTO old SELECT key, slot, last_used FROM entries;
+        DROP TABLE entries;
+        ALTER TABLE old RENAME TO entries;
+    """)
+    conn.close()
+
+    encoder = CountingEncoder()
+    upgraded = EmbeddingCache(str(tmp_path), "m", DIM, max_entries=10)
+    try:
+        np.testing.assert_array_equal(upgraded.encode(["a", "b"], encoder), expected)
+        assert all(row[3] is not None for row in index_rows(upgraded))
+    finally:
+        upgraded.close()
+    assert encoder.calls == []
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from form import save_encounter
+
+
+@pytest.fixture
+def chatbot(chat_resources):
+    from services.chatbot_service import ChatbotService
+    return ChatbotService()
+
+
+@pytest.fixture
+def patient_id(patient_db):
+    return save_encounter({"patient_name": "Ada", "age": 71, "hf_type": "HFrEF"})
+
+
+def cached_texts(cache, texts):
+    return [vector is not None for vector in cache.get_many(texts)]
+
+
+def test_context_and_question_are_embedded_in_one_batch(chatbot, chat_resources):
+    context_vector, question_vector = chatbot.embed_queries("Patient: Ada, 71\nQuestion: dose?", "dose?")
+
+    assert chat_resources.embedder.batches == [["Patient: Ada, 71\nQuestion: dose?", "dose?"]]
+    np.testing.assert_array_equal(question_vector, chat_resources.embedder.encode(["dose?"])[0])
+    assert not np.array_equal(context_vector, question_vector)
+    # Only the question, which carries no patient data, is kept on disk
+    assert cached_texts(chat_resources.embedding_cache,
+                        ["Patient: Ada, 71\nQuestion: dose?", "dose?"]) == [False, True]
+
+
+def test_repeated_question_only_embeds_the_new_context(chatbot, chat_resources):
+    chatbot.embed_queries("context one", "dose?")
+    chatbot.embed_queries("context two", "dose?")
+
+    assert chat_resources.embedder.batches[-1] == ["context two"]
+
+
+def test_several_vectors_share_one_milvus_search(chatbot, chat_resources):
+    vectors = np.eye(3, 8, dtype=np.float32)
+
+    results = chatbot.search_guidelines_vectors(vectors, top_k=2)
+
+    assert len(chat_resources.collection.searches) == 1
+    assert chat_resources.collection.searches[0] == vectors.tolist()
+    assert [[hit.id for hit in hits] for hits in results] == [[0, 1]] * 3
+    assert chatbot.search_guidelines_vectors([]) == []
+    assert len(chat_resources.collection.searches) == 1
+
+
+def test_search_guidelines_bypasses_the_disk_cache(chatbot, chat_resources):
+    hits = chatbot.search_guidelines("Patient: Ada, 71", top_k=1)
+
+    assert [hit.id for hit in hits] == [0]
+    assert cached_texts(chat_resources.embedding_cache, ["Patient: Ada, 71"]) == [False]
+
+
+@pytest.mark.parametrize("mode", ["Patient", "Doctor"])
+def test_a_turn_searches_once_on_the_patient_context(chatbot, chat_resources, patient_id, mode):
+    generate = chatbot.generate_doc_response if mode == "Doctor" else chatbot.generate_patient_response
+
+    answer = generate(patient_id, "Which beta blocker dose?")
+
+    assert answer == "Rest and weigh daily."
+    assert chat_resources.embedder.batches == [[chat_resources.embedder.batches[0][0], "Which beta blocker dose?"]]
+    assert "Name: Ada" in chat_resources.embedder.batches[0][0]
+    assert len(chat_resources.collection.searches) == 1
+    assert len(chat_resources.collection.searches[0]) == 1
+    prompt = chat_resources.completions.requests[0][1]["content"]
+    assert "guideline 0" in prompt and "guideline 2" in prompt
+
+
+def test_milvus_service_batches_queries(chat_resources):
+    from services.milvus_service import MilvusService
+    service = MilvusService()
+
+    matches = service.search_many(["Patient: Ada", "dose?"], top_k=2, store=[False, True])
+
+    assert chat_resources.embedder.batches == [["Patient: Ada", "dose?"]]
+    assert len(chat_resources.collection.searches) == 1
+    assert [[match["metadata"]["text"] for match in hits] for hits in matches] == [
+        ["guideline 0", "guideline 1"]] * 2
+    assert cached_texts(chat_resources.embedding_cache, ["Patient: Ada", "dose?"]) == [False, True]
+    assert service.search_many([]) == []
+    assert service.search("dose?", top_k=1)[0]["id"] == 0
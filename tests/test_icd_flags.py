@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from extract_hf_cases import COMORBIDITY_CODES, DEVICE_CODES, HF_TYPE_CODES, IcdPrefixTrie, icd_flags
+
+
+def reference_flags(df, groups):
+    """The str.startswith scan icd_flags replaces, one pass per group"""
+    hits = {name: set(df.loc[df["icd_code"].str.startswith(tuple(prefixes)), "hadm_id"])
+            for name, prefixes in groups.items()}
+    index = pd.Index(sorted(set().union(*hits.values())), name="hadm_id")
+    return pd.DataFrame({name: index.isin(list(ids)) for name, ids in hits.items()}, index=index)
+
+
+def random_codes(groups, n, seed):
+    """Codes that extend the groups' prefixes, mixed with unrelated ones"""
+    rng = np.random.default_rng(seed)
+    prefixes = [prefix for group in groups.values() for prefix in group]
+    codes = []
+    for _ in range(n):
+        if rng.random() < 0.6:
+            prefix = prefixes[rng.integers(len(prefixes))]
+            codes.append(prefix + "".join(rng.choice(list("0123456789"), rng.integers(0, 3))))
+        else:
+            codes.append(rng.choice(["Z99", "E11", "427.31", "I10", "0", ""]) + str(rng.integers(10)))
+    return pd.DataFrame({"hadm_id": rng.integers(1, 80, n).astype("int32"), "icd_code": codes})
+
+
+@pytest.mark.parametrize("groups", [{**COMORBIDITY_CODES, **HF_TYPE_CODES}, DEVICE_CODES],
+                         ids=["diagnoses", "devices"])
+def test_matches_startswith_reference(groups):
+    df = random_codes(groups, 3000, seed=len(groups))
+
+    flags = icd_flags(df, groups)
+    expected = reference_flags(df, groups)
+
+    assert list(flags.columns) == list(groups)
+    pd.testing.assert_frame_equal(flags.sort_index(), expected[list(groups)].sort_index(),
+                                  check_names=False, check_index_type=False)
+
+
+def test_trie_reports_every_group_along_the_code():
+    trie = IcdPrefixTrie({"short": ["I5"], "long": ["I50", "X"], "exact": ["I502"], "other": ["J"]})
+
+    assert trie.match("I5022") == {0, 1, 2}
+    assert trie.match("I51") == {0}
+    assert trie.match("J44") == {3}
+    assert trie.match("K") == set()
+    assert trie.match("") == set()
+
+
+def test_admissions_without_matches_are_absent():
+    df = pd.DataFrame({"hadm_id": [1, 2, 2], "icd_code": ["Z00", "I501", "Z00"]})
+
+    flags = icd_flags(df, {"hf": ["I50"], "copd": ["J44"]})
+
+    assert flags.to_dict("index") == {2: {"hf": True, "copd": False}}
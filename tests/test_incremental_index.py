@@ -0,0 +1,134 @@
+import json
+
+import numpy as np
+import pytest
+
+pytest.importorskip("pymilvus")
+pytest.importorskip("sentence_transformers")
+
+import store_data  # noqa: E402
+from store_data import chunk_id, process_and_store_tables, store_embeddings, sync_entities, unique_rows  # noqa: E402
+
+
+class FakeIterator:
+    def __init__(self, rows, batch_size):
+        self.batches = [rows[i:i + batch_size] for i in range(0, len(rows), batch_size)]
+
+    def next(self):
+        return self.batches.pop(0) if self.batches else []
+
+    def close(self):
+        pass
+
+
+class FakeCollection:
+    """In-memory stand-in for a Milvus collection that records every call"""
+
+    def __init__(self):
+        self.rows = {}
+        self.calls = []
+
+    def load(self):
+        pass
+
+    def query_iterator(self, batch_size, expr, output_fields):
+        prefix = expr.split('"')[1].rstrip("%")
+        return FakeIterator([{"id": row_id} for row_id in sorted(self.rows) if row_id.startswith(prefix)],
+                            batch_size)
+
+    def insert(self, columns):
+        ids, texts, vectors = columns
+        assert not set(ids) & set(self.rows), "duplicate primary key"
+        self.calls.append(("insert", list(ids)))
+        self.rows.update(zip(ids, texts))
+
+    def delete(self, expr):
+        ids = json.loads(expr[len("id in "):])
+        self.calls.append(("delete", ids))
+        for row_id in ids:
+            self.rows.pop(row_id, None)
+
+    def flush(self):
+        pass
+
+
+@pytest.fixture
+def encoded(monkeypatch):
+    """Replaces the model with one recording which texts it was asked to embed"""
+    texts = []
+
+    def encode_texts(batch, pool=None):
+        texts.extend(batch)
+        return np.zeros((len(batch), 4), dtype=np.float32)
+
+    monkeypatch.setattr(store_data, "encode_texts", encode_texts)
+    return texts
+
+
+def sync(collection, chunks):
+    ids = [chunk_id("chunk", text) for text in chunks]
+    return sync_entities(collection, "chunk", ids, chunks, chunks)
+
+
+def test_chunk_ids_depend_only_on_content():
+    assert chunk_id("chunk", "a") == chunk_id("chunk", "a") != chunk_id("chunk", "b")
+    assert chunk_id("table", "a").startswith("table-")
+
+
+def test_first_sync_inserts_every_distinct_chunk(encoded):
+    collection = FakeCollection()
+
+    assert sync(collection, ["a", "b", "a"]) == (2, 0)
+
+    assert sorted(collection.rows.values()) == ["a", "b"]
+    assert encoded == ["a", "b"]
+
+
+def test_unchanged_document_embeds_nothing(encoded):
+    collection = FakeCollection()
+    sync(collection, ["a", "b"])
+    collection.calls.clear()
+
+    assert sync(collection, ["b", "a"]) == (0, 0)
+
+    assert encoded == ["a", "b"] and collection.calls == []
+
+
+def test_edited_chunk_is_replaced_before_the_old_one_goes(encoded):
+    collection = FakeCollection()
+    sync(collection, ["a", "b", "c"])
+    collection.calls.clear()
+
+    assert sync(collection, ["a", "b2", "c"]) == (1, 1)
+
+    assert sorted(collection.rows.values()) == ["a", "b2", "c"]
+    assert collection.calls == [("insert", [chunk_id("chunk", "b2")]),
+                                ("delete", [chunk_id("chunk", "b")])]
+
+
+def test_other_prefixes_are_left_alone(encoded):
+    collection = FakeCollection()
+    collection.rows[chunk_id("table", "t")] = "t"
+
+    sync(collection, ["a"])
+    sync(collection, [])
+
+    assert list(collection.rows.values()) == ["t"]
+
+
+def test_full_rebuild_drops_duplicates(encoded):
+    ids, texts, embed_texts = unique_rows(["x", "y", "x"], ["1", "2", "3"], ["e1", "e2", "e3"])
+
+    assert (ids, texts, embed_texts) == (["x", "y"], ["1", "2"], ["e1", "e2"])
+    assert unique_rows([], [], []) == [[], [], []]
+
+
+def test_incremental_sections_and_tables(encoded):
+    collection = FakeCollection()
+
+    store_embeddings(["Loop  diuretics", "Beta blockers"], collection, incremental=True)
+    process_and_store_tables(["Drug | Dose\n"], collection, incremental=True)
+    store_embeddings(["Beta blockers"], collection, incremental=True)
+
+    assert sorted(collection.rows.values()) == ["Beta blockers", "Drug | Dose"]
+    assert encoded == ["Loop  diuretics", "Beta blockers", "Drug | Dose"]
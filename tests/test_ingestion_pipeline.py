@@ -0,0 +1,127 @@
+import threading
+
+import numpy as np
+import pytest
+
+pytest.importorskip("pymilvus")
+pytest.importorskip("sentence_transformers")
+
+import store_data  # noqa: E402
+from services.embedding_cache import EmbeddingCache  # noqa: E402
+from store_data import (embed_and_insert, embed_and_insert_batches, encode_texts, encode_window,  # noqa: E402
+                        insert_batches, iter_batches)
+
+DIM = 4
+
+
+class FakeEmbedder:
+    """Records how SentenceTransformer was asked to encode"""
+
+    def __init__(self):
+        self.calls = []
+
+    def vectors(self, texts):
+        return np.array([[len(text), i, 0, 1] for i, text in enumerate(texts)], dtype=np.float32)
+
+    def encode(self, texts, batch_size, show_progress_bar):
+        self.calls.append(("encode", list(texts), batch_size))
+        return self.vectors(texts)
+
+    def encode_multi_process(self, texts, pool, batch_size):
+        self.calls.append(("multi_process", list(texts), batch_size))
+        return self.vectors(texts)
+
+
+class RecordingCollection:
+    def __init__(self):
+        self.inserted = []
+        self.flushes = 0
+
+    def insert(self, columns):
+        self.inserted.append(columns)
+
+    def flush(self):
+        self.flushes += 1
+
+
+@pytest.fixture
+def embedder(tmp_path, monkeypatch):
+    embedder = FakeEmbedder()
+    cache = EmbeddingCache(str(tmp_path), "test-model", DIM, 100)
+    monkeypatch.setattr(store_data, "embedder", embedder, raising=False)
+    monkeypatch.setattr(store_data, "embedding_cache", cache, raising=False)
+    yield embedder
+    cache.close()
+
+
+def test_encode_texts_batches_misses_only(embedder):
+    first = encode_texts(["a", "bb", "a"], batch_size=16)
+    second = encode_texts(["bb", "ccc"], pool={"processes": [1, 2]}, batch_size=16)
+
+    assert embedder.calls == [("encode", ["a", "bb"], 16), ("multi_process", ["ccc"], 16)]
+    np.testing.assert_array_equal(second[0], first[1])
+    assert second.shape == (2, DIM)
+
+
+def test_encode_window_scales_with_the_pool(monkeypatch):
+    monkeypatch.setattr(store_data, "ENCODE_BATCH_SIZE", 32)
+
+    assert encode_window() == 32
+    assert encode_window({"processes": [object()] * 3}) == 96
+
+
+def test_iter_batches():
+    rows = [(f"id{i}", f"text{i}", f"embed{i}") for i in range(5)]
+
+    assert list(iter_batches(rows, 2)) == [
+        (["id0", "id1"], ["text0", "text1"], ["embed0", "embed1"]),
+        (["id2", "id3"], ["text2", "text3"], ["embed2", "embed3"]),
+        (["id4"], ["text4"], ["embed4"])]
+    assert list(iter_batches([], 2)) == []
+
+
+def test_insert_batches_respects_the_milvus_batch_size(monkeypatch):
+    monkeypatch.setattr(store_data, "INSERT_BATCH_SIZE", 2)
+    collection = RecordingCollection()
+
+    insert_batches(collection, ["a", "b", "c"], ["A", "B", "C"], np.eye(3, dtype=np.float32))
+
+    assert [columns[0] for columns in collection.inserted] == [["a", "b"], ["c"]]
+    assert collection.inserted[1][2] == [[0.0, 0.0, 1.0]]
+
+
+def test_embed_and_insert_stores_every_row_in_order(embedder, monkeypatch):
+    monkeypatch.setattr(store_data, "ENCODE_BATCH_SIZE", 2)
+    collection = RecordingCollection()
+    ids = [f"id{i}" for i in range(5)]
+
+    count = embed_and_insert(collection, ids, [i.upper() for i in ids], [f"text {i}" for i in ids])
+
+    assert count == 5
+    assert sum((columns[0] for columns in collection.inserted), []) == ids
+    assert [len(call[1]) for call in embedder.calls] == [2, 2, 1]
+    assert collection.flushes == 1
+
+
+def test_next_batch_is_encoded_while_the_previous_one_is_inserted(embedder):
+    second_encoded = threading.Event()
+    encode = embedder.encode
+
+    def encode_and_signal(texts, batch_size, show_progress_bar):
+        if len(embedder.calls) == 1:
+            second_encoded.set()
+        return encode(texts, batch_size, show_progress_bar)
+
+    class SlowCollection(RecordingCollection):
+        def insert(self, columns):
+            # The first insert only finishes once the second batch is being encoded
+            if not self.inserted:
+                assert second_encoded.wait(5), "encoding waited for the insert"
+            super().insert(columns)
+
+    embedder.encode = encode_and_signal
+    collection = SlowCollection()
+    batches = [(["a"], ["A"], ["text a"]), (["b"], ["B"], ["text b"])]
+
+    assert embed_and_insert_batches(collection, batches) == 2
+    assert [columns[0] for columns in collection.inserted] == [["a"], ["b"]]
@@ -0,0 +1,75 @@
+import gzip
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from extract_hf_cases import EVENT_COLUMNS, EVENT_DTYPES, find_csv, iter_csv, load_csv
+
+
+@pytest.fixture
+def folder(tmp_path):
+    """A gzipped chartevents-like table with extra columns and missing hadm_ids"""
+    rng = np.random.default_rng(3)
+    n = 500
+    table = pd.DataFrame({
+        "subject_id": rng.integers(1, 50, n),
+        "hadm_id": rng.integers(100, 120, n).astype(float),
+        "stay_id": rng.integers(1, 9, n),
+        "charttime": pd.Timestamp("2150-01-01") + pd.to_timedelta(rng.integers(0, 10000, n), unit="min"),
+        "itemid": rng.choice([220045, 220179, 220181, 50912], n),
+        "value": rng.choice(["abc", "12", ""], n),
+        "valuenum": rng.normal(100, 10, n).round(2),
+    })
+    table.loc[::37, "hadm_id"] = np.nan
+    with gzip.open(tmp_path / "CHARTEVENTS.csv.gz", "wt") as f:
+        table.to_csv(f, index=False)
+    return tmp_path
+
+
+def reference(folder, where):
+    table = pd.read_csv(folder / "CHARTEVENTS.csv.gz", usecols=EVENT_COLUMNS, dtype=EVENT_DTYPES)
+    for col, values in where.items():
+        table = table[table[col].isin(list(values))]
+    return table.reset_index(drop=True)
+
+
+@pytest.mark.parametrize("chunksize", [500, 64, 7])
+def test_chunked_filter_matches_filtering_the_whole_table(folder, chunksize):
+    where = {"itemid": {220045, 50912}, "hadm_id": range(100, 110)}
+
+    df = load_csv(str(folder), "chartevents", EVENT_COLUMNS, EVENT_DTYPES, where, chunksize)
+
+    pd.testing.assert_frame_equal(df, reference(folder, where))
+    assert set(df.columns) == set(EVENT_COLUMNS)
+    assert df.dtypes.to_dict() == {"hadm_id": "Int32", "itemid": "int32",
+                                   "valuenum": "float32", "charttime": "object"}
+
+
+def test_iter_csv_yields_filtered_chunks(folder):
+    where = {"itemid": [220179]}
+
+    chunks = list(iter_csv(str(folder), "chartevents", EVENT_COLUMNS, EVENT_DTYPES, where, chunksize=100))
+
+    assert len(chunks) == 5
+    assert all(set(chunk["itemid"]) <= {220179} for chunk in chunks)
+    pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), reference(folder, where))
+
+
+def test_filter_matching_nothing_keeps_columns_and_dtypes(folder):
+    df = load_csv(str(folder), "chartevents", EVENT_COLUMNS, EVENT_DTYPES, {"itemid": [1]}, chunksize=50)
+
+    assert df.empty
+    assert set(df.columns) == set(EVENT_COLUMNS) and df["itemid"].dtype == "int32"
+
+
+def test_without_filter_reads_the_pruned_table(folder):
+    df = load_csv(str(folder), "chartevents", ["itemid", "valuenum"], {"itemid": "int32"})
+
+    assert list(df.columns) == ["itemid", "valuenum"] and len(df) == 500
+
+
+def test_find_csv_is_case_insensitive(folder):
+    assert find_csv(str(folder), "chartevents").endswith("CHARTEVENTS.csv.gz")
+    with pytest.raises(FileNotFoundError):
+        find_csv(str(folder), "labevents")
@@ -0,0 +1,131 @@
+import os
+
+import pytest
+
+from form import bulk_save_encounters, save_encounter
+from load_hf_cases import case_to_encounter, iter_encounters, load_cases
+from services.migrations import NOTES_INSERT_TRIGGER, SUMMARY_INSERT_TRIGGERS, bulk_insert, migrate
+from services.patient_db import connection, set_database_path, transaction
+
+CASES_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                         "heart_failure_cases.csv")
+
+
+def encounters():
+    """The sample cases plus hand-made ones exercising symptoms and comorbidity details"""
+    cases = list(iter_encounters([CASES_CSV]))
+    cases.append({"patient": {"patient_name": "Ada", "follow_plan": "titrate sacubitril"},
+                  "symptoms": [{"symptom": "Dyspnea", "category": "Respiratory", "severity": 2,
+                                "duration": "weeks"},
+                               {"symptom": "Dyspnea", "category": "Respiratory", "severity": 3,
+                                "duration": "days"}],
+                  "comorbidities": {"Hypertension": True, "Sleep Apnea": True}})
+    cases.append({"patient": {"patient_name": "Ben"}, "consents": (True, False, False)})
+    return cases
+
+
+def derived_rows():
+    with connection() as conn:
+        summary = conn.execute("SELECT * FROM patient_summary ORDER BY patient_id").fetchall()
+        matches = {term: conn.execute("SELECT rowid FROM patient_notes_fts WHERE patient_notes_fts MATCH ? "
+                                      "ORDER BY rowid", (term,)).fetchall()
+                   for term in ("furosemide", "sacub*", "ICD", "insulin OR digoxin")}
+    return summary, matches
+
+
+def triggers():
+    with connection() as conn:
+        return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+
+
+def fresh_database(path):
+    set_database_path(path)
+    with connection() as conn:
+        migrate(conn)
+
+
+def test_bulk_load_matches_per_row_triggers(patient_db, tmp_path):
+    cases = encounters()
+    bulk_ids = bulk_save_encounters(cases, batch_size=7)
+    bulk = derived_rows()
+
+    fresh_database(str(tmp_path / "per_row.db"))
+    per_row_ids = [save_encounter(case["patient"], case.get("consents"), case.get("symptoms", ()),
+                                  case.get("comorbidities"), case.get("comorbidity_details", ()),
+                                  case.get("cv_events"))
+                   for case in cases]
+
+    assert bulk_ids == per_row_ids == list(range(1, len(cases) + 1))
+    assert derived_rows() == bulk
+    summary, matches = bulk
+    assert len(summary) == len(cases)
+    assert (len(cases) - 1,) in matches["sacub*"]
+    assert matches["furosemide"]
+
+
+def test_triggers_are_restored_after_a_bulk_load(patient_db):
+    before = triggers()
+    assert set(SUMMARY_INSERT_TRIGGERS) | {NOTES_INSERT_TRIGGER} <= before
+
+    bulk_save_encounters(encounters())
+    assert triggers() == before
+
+    # Single inserts are kept current by the triggers again
+    patient_id = save_encounter({"patient_name": "Cy", "follow_plan": "sacubitril"})
+    summary, matches = derived_rows()
+    assert summary[-1][:2] == (patient_id, "Cy")
+    assert (patient_id,) in matches["sacub*"]
+
+
+def test_failed_bulk_load_rolls_back_with_the_triggers(patient_db):
+    before = triggers()
+    cases = encounters()
+    cases.append({"patient": {"patient_name": "bad"}, "symptoms": [{"symptom": "Edema"}]})
+
+    with pytest.raises(KeyError):
+        bulk_save_encounters(cases)
+
+    assert triggers() == before
+    assert derived_rows()[0] == []
+
+
+def test_bulk_insert_joins_an_open_transaction(patient_db):
+    with transaction() as conn:
+        conn.execute("INSERT INTO patients (patient_name) VALUES ('first')")
+        with bulk_insert(conn) as patient_ids:
+            cursor = conn.execute("INSERT INTO patients (patient_name) VALUES ('second')")
+            patient_ids.append(cursor.lastrowid)
+
+    summary, _ = derived_rows()
+    assert [row[1] for row in summary] == ["first", "second"]
+
+
+def test_case_to_encounter_converts_units_and_flags():
+    row = {"Subject Id": "10", "Hadm Id": "20", "Gender": "F", "Age": "66", "Height Cm": "",
+           "Heart Rate Mean": "71.6", "Temperature Mean": "98.6", "Hf Type": "HFrEF",
+           "Has Icd": "True", "Has Pacemaker": "True", "Diabetes": "True", "Copd": "True",
+           "Coronary Artery Disease": "True", "Has Cabg": "True", "Stroke": "False"}
+
+    encounter = case_to_encounter(row, copy=2)
+
+    patient = encounter["patient"]
+    assert patient["patient_name"] == "MIMIC 10 / 20 #2"
+    assert (patient["sex"], patient["age"], patient["height"]) == ("Female", 66, None)
+    assert patient["heart_rate"] == 72
+    assert patient["temperature"] == 37.0
+    assert patient["devices"] == "ICD,Pacemaker"
+    assert encounter["comorbidities"]["Diabetes"] and not encounter["comorbidities"]["Obesity"]
+    assert encounter["comorbidity_details"] == [
+        {"detail_key": "Other Comorbidities", "detail_value": "Coronary Artery Disease, Copd"}]
+    assert encounter["cv_events"] == {"Hospitalization for HF": True, "PCI / CABG": True, "Stroke": False}
+
+
+def test_load_cases_imports_every_row_repeat_times(patient_db):
+    rows = sum(1 for _ in iter_encounters([CASES_CSV]))
+
+    imported, _ = load_cases([CASES_CSV], batch_size=8, repeat=2)
+
+    assert imported == 2 * rows
+    with connection() as conn:
+        assert conn.execute("SELECT count(*) FROM patient_summary").fetchone()[0] == 2 * rows
+        assert conn.execute("SELECT count(*) FROM patients WHERE patient_name LIKE '% #1'").fetchone()[0] == rows
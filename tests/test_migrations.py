@@ -0,0 +1,136 @@
+import sqlite3
+
+import pytest
+
+from services import migrations
+from services.migrations import MIGRATIONS, migrate, schema_version
+
+
+def connect(path):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA foreign_keys = ON")
+    return conn
+
+
+def names(conn, kind):
+    return {row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = ?", (kind,))}
+
+
+def query_plan(conn, sql, params=()):
+    return " ".join(row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params))
+
+
+@pytest.fixture
+def v0_db(tmp_path):
+    """A database as create_patient_table left it before versioning, with data"""
+    path = str(tmp_path / "v0.db")
+    conn = sqlite3.connect(path)
+    migrations._initial_schema(conn.cursor())
+    conn.execute("INSERT INTO patients (patient_name, age, sex, hf_type, follow_plan) "
+                 "VALUES ('Ada', 71, 'Female', 'HFrEF', 'titrate sacubitril')")
+    conn.execute("INSERT INTO patients (patient_name, age, sex) VALUES ('Ben', 58, 'Male')")
+    conn.execute("INSERT INTO patient_symptoms (patient_id, symptom, category, present, severity, duration) "
+                 "VALUES (1, 'Dyspnea', 'Respiratory', 1, 2, 'weeks')")
+    conn.execute("INSERT INTO patient_comorbidities (patient_id, hypertension, diabetes) VALUES (1, 1, 0)")
+    conn.execute("INSERT INTO comorbidity_details (patient_id, comorbidity_record_id, detail_key, detail_value) "
+                 "VALUES (1, 1, 'BMI Classification', 'Normal')")
+    conn.execute("INSERT INTO cv_events (patient_id, event_key, event_present) VALUES (2, 'Stroke', 1)")
+    conn.execute("INSERT INTO patient_consents (patient_id, clinical_care_consent) VALUES (1, 1)")
+    conn.execute("INSERT INTO consent_audit_log (patient_id, action, purpose) "
+                 "VALUES (1, 'CONSENT_GIVEN', 'CLINICAL_CARE')")
+    # Rows left behind by the old delete path, for a patient that no longer exists
+    conn.execute("INSERT INTO patient_symptoms (patient_id, symptom) VALUES (99, 'Orphan')")
+    conn.execute("INSERT INTO consent_audit_log (patient_id, action, purpose) "
+                 "VALUES (99, 'CONSENT_WITHDRAWN', 'CLINICAL_CARE')")
+    conn.commit()
+    conn.close()
+    return path
+
+
+def test_empty_database_migrates_to_latest(tmp_path):
+    conn = connect(str(tmp_path / "empty.db"))
+
+    assert migrate(conn) == len(MIGRATIONS)
+    assert schema_version(conn) == len(MIGRATIONS)
+    assert {"patients", "patient_symptoms", "patient_comorbidities", "comorbidity_details",
+            "cv_events", "patient_consents", "consent_audit_log", "patient_summary",
+            "patient_notes_fts"} <= names(conn, "table")
+    assert {"idx_patient_symptoms_patient", "idx_cv_events_patient",
+            "idx_comorbidity_details_record", "idx_patient_consents_purpose",
+            "idx_consent_audit_log_patient", "idx_patient_summary_name"} <= names(conn, "index")
+    assert conn.execute("PRAGMA foreign_key_check").fetchall() == []
+
+
+def test_v0_database_migrates_and_keeps_its_data(v0_db):
+    conn = connect(v0_db)
+    assert schema_version(conn) == 0
+
+    assert migrate(conn) == len(MIGRATIONS)
+
+    assert conn.execute("SELECT patient_id, patient_name FROM patients ORDER BY patient_id").fetchall() == [
+        (1, "Ada"), (2, "Ben")]
+    assert conn.execute("SELECT patient_id, symptom FROM patient_symptoms").fetchall() == [
+        (1, "Dyspnea")]
+    assert conn.execute("SELECT patient_id, event_key FROM cv_events").fetchall() == [(2, "Stroke")]
+    # The audit trail keeps every row, including those of patients already gone
+    assert conn.execute("SELECT patient_id FROM consent_audit_log ORDER BY id").fetchall() == [
+        (1,), (99,)]
+
+    # New consent columns were added in place, not by dropping the table
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(patient_consents)")}
+    assert {"purpose", "consent_given", "withdrawal_date"} <= columns
+    assert conn.execute("SELECT clinical_care_consent FROM patient_consents").fetchall() == [(1,)]
+
+    # Derived tables are backfilled for existing patients
+    assert conn.execute("SELECT patient_id, symptoms, comorbidities FROM patient_summary "
+                        "WHERE patient_id = 1").fetchone() == (1, '["Dyspnea"]', '["Hypertension"]')
+    assert conn.execute("SELECT rowid FROM patient_notes_fts WHERE patient_notes_fts MATCH 'sacub*'"
+                        ).fetchall() == [(1,)]
+
+
+def test_v0_ids_continue_after_rebuild(v0_db):
+    conn = connect(v0_db)
+    migrate(conn)
+
+    conn.execute("INSERT INTO patient_symptoms (patient_id, symptom) VALUES (1, 'Edema')")
+    # AUTOINCREMENT counters survive the table rebuild: the orphan's id is not reused
+    assert conn.execute("SELECT max(id) FROM patient_symptoms").fetchone()[0] == 3
+
+
+def test_migrate_is_idempotent(v0_db):
+    conn = connect(v0_db)
+    migrate(conn)
+    schema = conn.execute("SELECT type, name, sql FROM sqlite_master ORDER BY name").fetchall()
+
+    assert migrate(conn) == len(MIGRATIONS)
+    assert conn.execute("SELECT type, name, sql FROM sqlite_master ORDER BY name").fetchall() == schema
+
+
+def test_failed_migration_leaves_previous_version(tmp_path, monkeypatch):
+    conn = connect(str(tmp_path / "failing.db"))
+    migrate(conn)
+
+    def broken(cursor):
+        cursor.execute("CREATE TABLE half_done (id INTEGER)")
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(migrations, "MIGRATIONS", MIGRATIONS + [broken])
+    with pytest.raises(RuntimeError):
+        migrate(conn)
+
+    assert schema_version(conn) == len(MIGRATIONS)
+    assert "half_done" not in names(conn, "table")
+    assert conn.execute("PRAGMA foreign_keys").fetchone()[0] == 1
+
+
+def test_per_patient_lookups_use_indexes(tmp_path):
+    conn = connect(str(tmp_path / "plans.db"))
+    migrate(conn)
+
+    for table in ("patient_symptoms", "patient_comorbidities", "cv_events"):
+        plan = query_plan(conn, f"SELECT * FROM {table} WHERE patient_id = ?", (1,))
+        assert "USING" in plan and "INDEX" in plan, (table, plan)
+    plan = query_plan(conn, "SELECT detail_key, detail_value FROM comorbidity_details "
+                            "WHERE comorbidity_record_id = ?", (1,))
+    assert "COVERING INDEX idx_comorbidity_details_record" in plan
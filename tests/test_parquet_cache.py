@@ -0,0 +1,90 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from extract_hf_cases import (EVENT_COLUMNS, EVENT_DTYPES, ICD_COLUMNS, ICD_DTYPES, build_parquet_cache,
+                              iter_csv, load_csv, parquet_path)
+
+# Skipped where pyarrow is missing or built against another NumPy
+pytest.importorskip("pyarrow", exc_type=ImportError)
+
+
+@pytest.fixture
+def folder(tmp_path):
+    rng = np.random.default_rng(5)
+    n = 400
+    events = pd.DataFrame({
+        "subject_id": rng.integers(1, 50, n),
+        "hadm_id": rng.integers(100, 120, n).astype(float),
+        "itemid": rng.choice([220045, 220179, 50912], n),
+        "charttime": (pd.Timestamp("2150-01-01")
+                      + pd.to_timedelta(rng.integers(0, 10000, n), unit="min")).astype(str),
+        "valuenum": rng.normal(100, 10, n).round(2),
+    })
+    events.loc[::29, "hadm_id"] = np.nan
+    events.to_csv(tmp_path / "labevents.csv", index=False)
+    pd.DataFrame({"hadm_id": [100, 100, 101], "icd_code": ["I50", "0401", "E11"],
+                  "icd_version": [10, 9, 10]}).to_csv(tmp_path / "diagnoses_icd.csv", index=False)
+    return str(tmp_path)
+
+
+def same_rows(left, right):
+    """Compare ignoring row and column order, which partitioning changes"""
+    columns = sorted(left.columns)
+    left = left[columns].sort_values(columns).reset_index(drop=True)
+    right = right[columns].sort_values(columns).reset_index(drop=True)
+    pd.testing.assert_frame_equal(left, right)
+
+
+def test_cache_returns_what_the_csv_does(folder):
+    where = {"itemid": [220045, 50912], "hadm_id": range(100, 110)}
+    from_csv = load_csv(folder, "labevents", EVENT_COLUMNS, EVENT_DTYPES, where)
+
+    build_parquet_cache(folder, "labevents")
+    from_parquet = load_csv(folder, "labevents", EVENT_COLUMNS, EVENT_DTYPES, where)
+
+    assert os.path.isdir(os.path.join(parquet_path(folder, "labevents"), "itemid=220045"))
+    same_rows(from_parquet, from_csv)
+
+
+def test_streamed_batches_match_the_full_read(folder):
+    build_parquet_cache(folder, "labevents")
+    where = {"itemid": [220179]}
+
+    batches = list(iter_csv(folder, "labevents", EVENT_COLUMNS, EVENT_DTYPES, where, chunksize=50))
+
+    assert all(set(batch["itemid"]) <= {220179} for batch in batches)
+    same_rows(pd.concat(batches, ignore_index=True),
+              load_csv(folder, "labevents", EVENT_COLUMNS, EVENT_DTYPES, where))
+
+
+def test_unpartitioned_table_keeps_text_codes(folder):
+    build_parquet_cache(folder, "diagnoses_icd")
+
+    df = load_csv(folder, "diagnoses_icd", ICD_COLUMNS, ICD_DTYPES, {"hadm_id": [100]})
+
+    # Leading zeros survive: codes are stored as text, not parsed as numbers
+    assert sorted(df["icd_code"]) == ["0401", "I50"]
+    assert df["hadm_id"].dtype == "int32"
+
+
+def test_stale_cache_is_ignored(folder):
+    build_parquet_cache(folder, "diagnoses_icd")
+    path = os.path.join(folder, "diagnoses_icd.csv")
+    pd.DataFrame({"hadm_id": [200], "icd_code": ["I11"], "icd_version": [10]}).to_csv(path, index=False)
+    cache_time = os.path.getmtime(parquet_path(folder, "diagnoses_icd"))
+    os.utime(path, (cache_time + 10, cache_time + 10))
+
+    df = load_csv(folder, "diagnoses_icd", ICD_COLUMNS, ICD_DTYPES)
+
+    assert df["icd_code"].tolist() == ["I11"]
+
+
+def test_rebuild_replaces_the_cache(folder):
+    build_parquet_cache(folder, "labevents")
+    build_parquet_cache(folder, "labevents")
+
+    assert os.listdir(os.path.join(folder, "parquet")) == ["labevents"]
+    assert len(load_csv(folder, "labevents", EVENT_COLUMNS, EVENT_DTYPES)) == 400
@@ -0,0 +1,98 @@
+import queue
+import sqlite3
+import threading
+
+import pytest
+
+from services.patient_db import ConnectionPool
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "pool.db"), max_size=2)
+    with pool.transaction() as conn:
+        conn.execute("CREATE TABLE t (x INTEGER)")
+    yield pool
+    pool.close_all()
+
+
+def values(pool):
+    with pool.connection() as conn:
+        return [row[0] for row in conn.execute("SELECT x FROM t ORDER BY rowid")]
+
+
+def test_connections_are_configured(pool):
+    with pool.connection() as conn:
+        pragmas = {name: conn.execute(f"PRAGMA {name}").fetchone()[0]
+                   for name in ("journal_mode", "synchronous", "foreign_keys", "temp_store")}
+
+    assert pragmas == {"journal_mode": "wal", "synchronous": 1, "foreign_keys": 1, "temp_store": 2}
+
+
+def test_nested_blocks_share_one_connection_and_transaction(pool):
+    with pool.transaction() as outer:
+        outer.execute("INSERT INTO t VALUES (1)")
+        with pool.connection() as inner:
+            assert inner is outer
+        with pool.transaction() as inner:
+            assert inner is outer
+            inner.execute("INSERT INTO t VALUES (2)")
+        # The inner block did not commit on its own
+        assert outer.in_transaction
+
+    assert values(pool) == [1, 2]
+
+
+def test_failed_transaction_rolls_back_everything(pool):
+    with pytest.raises(ZeroDivisionError):
+        with pool.transaction() as conn:
+            conn.execute("INSERT INTO t VALUES (1)")
+            with pool.transaction() as inner:
+                inner.execute("INSERT INTO t VALUES (2)")
+            1 / 0
+
+    assert values(pool) == []
+
+
+def test_connection_is_returned_without_an_open_transaction(pool):
+    with pool.connection() as conn:
+        conn.execute("INSERT INTO t VALUES (1)")
+        assert conn.in_transaction
+
+    with pool.connection() as again:
+        assert again is conn and not again.in_transaction
+    assert values(pool) == []
+
+
+def test_pool_is_bounded_and_lends_each_connection_to_one_thread(pool):
+    held = [pool.acquire(), pool.acquire()]
+    assert held[0] is not held[1]
+    with pytest.raises(queue.Empty):
+        pool.acquire(timeout=0.05)
+
+    pool.release(held.pop())
+    assert pool.acquire(timeout=0.05) is not held[0]
+
+
+def test_threads_read_while_another_writes(pool):
+    reads = []
+    with pool.transaction() as conn:
+        conn.execute("INSERT INTO t VALUES (1)")
+
+        # WAL: a reader on another connection sees the last commit, without waiting
+        worker = threading.Thread(target=lambda: reads.append(values(pool)))
+        worker.start()
+        worker.join(5)
+
+    assert reads == [[]]
+    assert values(pool) == [1]
+
+
+def test_foreign_keys_are_enforced(pool):
+    with pool.transaction() as conn:
+        conn.execute("CREATE TABLE parent (id INTEGER PRIMARY KEY)")
+        conn.execute("CREATE TABLE child (parent_id INTEGER REFERENCES parent(id))")
+
+    with pytest.raises(sqlite3.IntegrityError):
+        with pool.transaction() as conn:
+            conn.execute("INSERT INTO child VALUES (1)")
@@ -0,0 +1,118 @@
+import sqlite3
+
+import pytest
+
+from form import save_encounter, withdraw_consent_and_delete_data
+from services import patient_deletion
+from services.audit_log import get_audit_log
+from services.patient_deletion import delete_patients
+from services.patient_db import connection
+
+CHILD_TABLES = ("patient_symptoms", "patient_comorbidities", "comorbidity_details",
+                "cv_events", "patient_consents", "patient_summary")
+
+
+def new_patient(name):
+    return save_encounter(
+        {"patient_name": name, "age": 70, "follow_plan": f"{name} sacubitril plan"},
+        consents=(True, True, False),
+        individual_symptoms=[{"symptom": "Dyspnea", "category": "Respiratory",
+                              "severity": 2, "duration": "weeks"}],
+        comorbidities_data={"Hypertension": True},
+        comorbidity_details_data=[{"detail_key": "BMI Classification", "detail_value": "Normal"}],
+        cv_events_data={"Stroke": True})
+
+
+def rows_of(table, patient_id):
+    with connection() as conn:
+        return conn.execute(f"SELECT count(*) FROM {table} WHERE patient_id = ?",
+                            (patient_id,)).fetchone()[0]
+
+
+def audit_rows(patient_id):
+    get_audit_log().flush()
+    with connection() as conn:
+        return conn.execute("SELECT action, purpose FROM consent_audit_log "
+                            "WHERE patient_id = ? ORDER BY id", (patient_id,)).fetchall()
+
+
+@pytest.fixture
+def two_patients(patient_db):
+    return new_patient("Ada"), new_patient("Ben")
+
+
+def test_delete_cascades_to_every_child_table(two_patients):
+    erased, kept = two_patients
+    assert all(rows_of(table, erased) for table in CHILD_TABLES)
+
+    stats = delete_patients([erased])
+
+    assert stats["patients"] == 1
+    assert {table: rows_of(table, erased) for table in CHILD_TABLES} == dict.fromkeys(CHILD_TABLES, 0)
+    assert all(rows_of(table, kept) for table in CHILD_TABLES)
+    with connection() as conn:
+        assert conn.execute("SELECT rowid FROM patient_notes_fts WHERE patient_notes_fts MATCH 'sacub*' "
+                            "ORDER BY rowid").fetchall() == [(kept,)]
+
+
+def test_delete_writes_one_audit_row_per_erased_patient(two_patients):
+    erased, kept = two_patients
+    before = audit_rows(erased)
+
+    delete_patients([erased, erased, 12345], "CONSENT_WITHDRAWN", "CLINICAL_CARE")
+
+    # The consent history survives the patient, followed by the erasure itself
+    assert audit_rows(erased) == before + [("CONSENT_WITHDRAWN", "CLINICAL_CARE")]
+    assert audit_rows(12345) == []
+    assert ("CONSENT_WITHDRAWN", "CLINICAL_CARE") not in audit_rows(kept)
+
+
+def test_audit_rows_commit_with_the_delete(two_patients, monkeypatch):
+    erased, _ = two_patients
+    before = audit_rows(erased)
+    monkeypatch.setattr(patient_deletion, "INSERT_AUDIT_SQL",
+                        "INSERT INTO consent_audit_log (no_such_column) VALUES (?, ?, ?, ?, ?, ?)")
+
+    with pytest.raises(sqlite3.OperationalError):
+        delete_patients([erased])
+
+    # No erasure without its audit record: the delete rolled back too
+    assert rows_of("patients", erased) == 1
+    assert audit_rows(erased) == before
+
+
+def test_invalid_audit_event_deletes_nothing(two_patients):
+    erased, _ = two_patients
+
+    with pytest.raises(ValueError):
+        delete_patients([erased], action=None)
+
+    assert rows_of("patients", erased) == 1
+
+
+def test_purge_hooks_run_for_erased_patients(two_patients, monkeypatch):
+    erased, kept = two_patients
+    purged = []
+    monkeypatch.setattr(patient_deletion, "_purge_hooks", [purged.append])
+
+    delete_patients([erased, kept + 1000])
+
+    assert purged == [erased]
+
+
+def test_withdraw_consent_and_delete_data(two_patients):
+    erased, _ = two_patients
+
+    assert withdraw_consent_and_delete_data(erased) is True
+    assert rows_of("patients", erased) == 0
+    assert audit_rows(erased)[-1] == ("CONSENT_WITHDRAWN", "CLINICAL_CARE")
+
+
+def test_erasure_is_logged_after_queued_events(two_patients):
+    erased, _ = two_patients
+    get_audit_log().log(erased, "CONSENT_WITHDRAWN", "AI_TRAINING")
+
+    delete_patients([erased])
+
+    assert audit_rows(erased)[-2:] == [("CONSENT_WITHDRAWN", "AI_TRAINING"),
+                                       ("CONSENT_WITHDRAWN", "CLINICAL_CARE")]
@@ -0,0 +1,67 @@
+import pytest
+
+from form import save_encounter
+from services.patient_db import connection, transaction
+from services.patient_search import notes_match_query, search_patient_notes
+
+
+@pytest.fixture
+def patients(patient_db):
+    """Four patients with free-text notes; returns their ids"""
+    notes = [{"follow_plan": "Start sacubitril/valsartan, review in 2 weeks"},
+             {"medications": "Sacubitril-valsartan 49/51 mg", "devices": "ICD"},
+             {"echo_other": "Severe mitral régurgitation", "follow_plan": "Refer for ICD"},
+             {"other_meds": "none"}]
+    return [save_encounter({"patient_name": f"P{i}", **fields}) for i, fields in enumerate(notes)]
+
+
+def ids(text, columns=None):
+    return sorted(patient_id for patient_id, _ in search_patient_notes(text, columns))
+
+
+def test_prefixes_and_all_words_must_match(patients):
+    assert ids("sacub") == [patients[0], patients[1]]
+    assert ids("sacubitril valsartan 49") == [patients[1]]
+    assert ids("SACUBITRIL weeks") == [patients[0]]
+    assert ids("digoxin") == []
+
+
+def test_columns_restrict_the_match(patients):
+    assert ids("icd") == [patients[1], patients[2]]
+    assert ids("icd", ["devices"]) == [patients[1]]
+    assert ids("icd", ["follow_plan", "echo_other"]) == [patients[2]]
+
+
+def test_diacritics_and_punctuation_are_ignored(patients):
+    assert ids("regurgitation") == [patients[2]]
+    assert ids('mitral" OR "none') == []
+    assert ids("(icd") == [patients[1], patients[2]]
+
+
+def test_empty_text_matches_nothing(patients):
+    assert notes_match_query("   ") is None
+    assert search_patient_notes("") == []
+
+
+def test_scores_rank_better_matches_first(patients):
+    with transaction() as conn:
+        conn.execute("UPDATE patients SET follow_plan = 'ICD ICD ICD check' WHERE patient_id = ?",
+                     (patients[3],))
+
+    results = search_patient_notes("icd")
+
+    assert results[0][0] == patients[3]
+    assert [score for _, score in results] == sorted((score for _, score in results), reverse=True)
+    assert search_patient_notes("icd", limit=1) == results[:1]
+
+
+def test_index_follows_updates_and_deletes(patients):
+    with transaction() as conn:
+        conn.execute("UPDATE patients SET follow_plan = 'Continue furosemide' WHERE patient_id = ?",
+                     (patients[0],))
+        conn.execute("DELETE FROM patients WHERE patient_id = ?", (patients[1],))
+
+    assert ids("sacub") == []
+    assert ids("furosemide") == [patients[0]]
+    with connection() as conn:
+        conn.execute("INSERT INTO patient_notes_fts (patient_notes_fts) VALUES ('integrity-check')")
@@ -0,0 +1,73 @@
+import pytest
+
+from form import save_encounter
+from services.patient_search import list_hf_types, search_patients
+
+
+@pytest.fixture
+def patients(patient_db):
+    """Seven patients; returns their ids, oldest first"""
+    rows = [("Ada", 71, "Female", "HFrEF"), ("adam", 64, "Male", "HFpEF"),
+            ("Ben", 58, "Male", "HFrEF"), ("Bea", 80, "Female", None),
+            ("Ada_2", 45, "Female", "HFmrEF"), ("Cy", 77, "Male", "HFrEF"),
+            ("Ada%", 66, "Male", "HFrEF")]
+    return [save_encounter({"patient_name": name, "age": age, "sex": sex, "hf_type": hf_type})
+            for name, age, sex, hf_type in rows]
+
+
+def all_pages(**filters):
+    pages, after_id = [], None
+    while True:
+        rows, after_id = search_patients(after_id=after_id, **filters)
+        pages.append([row[0] for row in rows])
+        if after_id is None:
+            return pages
+
+
+def test_pages_are_newest_first_without_gaps_or_repeats(patients):
+    pages = all_pages(page_size=3)
+
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert sum(pages, []) == patients[::-1]
+
+
+def test_exact_multiple_of_page_size_has_no_empty_last_page(patients):
+    pages = all_pages(page_size=7)
+
+    assert pages == [patients[::-1]]
+
+
+def test_next_after_id_is_last_row_of_full_page(patients):
+    rows, after_id = search_patients(page_size=2)
+
+    assert after_id == rows[-1][0] == patients[-2]
+    rows, _ = search_patients(after_id=after_id, page_size=2)
+    assert rows[0][0] == patients[-3]
+
+
+def test_after_the_oldest_patient_is_empty(patients):
+    assert search_patients(after_id=patients[0]) == ([], None)
+
+
+def test_filters_apply_across_pages(patients):
+    pages = all_pages(hf_type="HFrEF", page_size=2)
+
+    assert sum(pages, []) == [patients[6], patients[5], patients[2], patients[0]]
+
+
+def test_name_prefix_is_case_insensitive_and_escapes_wildcards(patients):
+    names = [row[1] for row in search_patients(name_prefix="ada")[0]]
+    assert sorted(names) == ["Ada", "Ada%", "Ada_2", "adam"]
+
+    assert [row[1] for row in search_patients(name_prefix="Ada_")[0]] == ["Ada_2"]
+    assert [row[1] for row in search_patients(name_prefix="Ada%")[0]] == ["Ada%"]
+
+
+def test_age_range_is_inclusive(patients):
+    rows, _ = search_patients(min_age=64, max_age=71)
+
+    assert sorted(row[2] for row in rows) == [64, 66, 71]
+
+
+def test_list_hf_types_skips_missing(patients):
+    assert list_hf_types() == ["HFmrEF", "HFpEF", "HFrEF"]
@@ -0,0 +1,107 @@
+import threading
+
+import pytest
+
+from form import save_encounter
+from services.patient_db import transaction
+from services.patient_snapshot import invalidate_patient_snapshot, load_patient_snapshot, snapshot_scope
+
+
+@pytest.fixture
+def patient_id(patient_db):
+    return save_encounter(
+        {"patient_name": "Ada", "age": 71, "activity": "Walks daily"},
+        individual_symptoms=[{"symptom": "Dyspnea", "category": "Respiratory", "severity": 2,
+                              "duration": "weeks"},
+                             {"symptom": "Fatigue", "category": "General", "severity": 1,
+                              "duration": "days"}],
+        comorbidities_data={"Diabetes": True},
+        comorbidity_details_data=[{"detail_key": "HbA1c", "detail_value": "7.1"}],
+        cv_events_data={"Stroke": True, "PCI / CABG": False})
+
+
+def rename(patient_id, name):
+    with transaction() as conn:
+        conn.execute("UPDATE patients SET patient_name = ? WHERE patient_id = ?", (name, patient_id))
+
+
+def test_snapshot_has_the_patient_and_related_rows(patient_id):
+    snapshot = load_patient_snapshot(patient_id)
+
+    assert (snapshot["patient_name"], snapshot["age"]) == ("Ada", 71)
+    assert snapshot["physical_activity"] == "Walks daily"
+    assert [row["symptom"] for row in snapshot["symptoms"]] == ["Dyspnea", "Fatigue"]
+    assert snapshot["comorbidities"]["diabetes"] == 1 and snapshot["comorbidities"]["obesity"] == 0
+    assert [dict(row) for row in snapshot["comorbidity_details"]] == [
+        {"detail_key": "HbA1c", "detail_value": "7.1"}]
+    # In the order of the covering per-patient indexes
+    assert [dict(row) for row in snapshot["cv_events"]] == [
+        {"event_key": "PCI / CABG", "event_present": False},
+        {"event_key": "Stroke", "event_present": True}]
+
+
+def test_snapshot_is_read_only(patient_id):
+    snapshot = load_patient_snapshot(patient_id)
+
+    with pytest.raises(TypeError):
+        snapshot["age"] = 30
+    with pytest.raises(TypeError):
+        snapshot["comorbidities"]["diabetes"] = 0
+    assert isinstance(snapshot["symptoms"], tuple)
+
+
+def test_patient_without_related_rows(patient_db):
+    with transaction() as conn:
+        patient_id = conn.execute("INSERT INTO patients (patient_name) VALUES ('Bare')").lastrowid
+
+    snapshot = load_patient_snapshot(patient_id)
+
+    assert snapshot["symptoms"] == () and snapshot["cv_events"] == ()
+    assert dict(snapshot["comorbidities"]) == {}
+    assert load_patient_snapshot(patient_id + 1) is None
+
+
+def test_snapshots_are_memoized_only_inside_a_scope(patient_id):
+    with snapshot_scope():
+        first = load_patient_snapshot(patient_id)
+        rename(patient_id, "Ann")
+        assert load_patient_snapshot(str(patient_id)) is first
+
+        with snapshot_scope():
+            assert load_patient_snapshot(patient_id) is first
+
+        invalidate_patient_snapshot(patient_id)
+        assert load_patient_snapshot(patient_id)["patient_name"] == "Ann"
+
+    # Outside a scope every lookup reads the database
+    rename(patient_id, "Amy")
+    assert load_patient_snapshot(patient_id)["patient_name"] == "Amy"
+    invalidate_patient_snapshot(patient_id)
+
+
+def test_scopes_are_not_shared_between_threads(patient_id):
+    seen = []
+
+    def request():
+        with snapshot_scope():
+            seen.append(load_patient_snapshot(patient_id)["patient_name"])
+
+    with snapshot_scope():
+        load_patient_snapshot(patient_id)
+        rename(patient_id, "Ann")
+        worker = threading.Thread(target=request)
+        worker.start()
+        worker.join()
+
+    assert seen == ["Ann"]
+
+
+def test_erased_patient_is_not_served_from_a_later_scope(patient_id):
+    with snapshot_scope():
+        assert load_patient_snapshot(patient_id) is not None
+
+    with transaction() as conn:
+        conn.execute("DELETE FROM patients WHERE patient_id = ?", (patient_id,))
+
+    with snapshot_scope():
+        assert load_patient_snapshot(patient_id) is None
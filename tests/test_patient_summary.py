@@ -0,0 +1,87 @@
+import pytest
+
+from form import get_patient_hf_type, get_patient_summary, get_visual_summary_data, save_encounter
+from services.patient_db import connection, transaction
+
+
+@pytest.fixture
+def patient_id(patient_db):
+    return save_encounter(
+        {"patient_name": "Ada", "age": 71, "sex": "Female", "hf_type": "HFrEF"},
+        individual_symptoms=[{"symptom": "Dyspnea", "category": "Respiratory", "severity": 2,
+                              "duration": "weeks"},
+                             {"symptom": "Dyspnea", "category": "Respiratory", "severity": 3,
+                              "duration": "days"}],
+        comorbidities_data={"Sleep Apnea": True, "Hypertension": True,
+                            "Family History of Heart Disease": True})
+
+
+def execute(sql, *params):
+    with transaction() as conn:
+        conn.execute(sql, params)
+
+
+def assert_matches_source():
+    """Every summary row equals what the patient_summary_source view computes now"""
+    with connection() as conn:
+        stored = conn.execute("SELECT * FROM patient_summary ORDER BY patient_id").fetchall()
+        computed = conn.execute("SELECT * FROM patient_summary_source ORDER BY patient_id").fetchall()
+    assert stored == computed
+
+
+def test_summary_is_written_on_insert(patient_id):
+    assert get_patient_summary(patient_id) == {
+        "patient_name": "Ada", "age": 71, "sex": "Female", "hf_type": "HFrEF",
+        "symptoms": ["Dyspnea"],
+        "comorbidities": ["Hypertension", "Sleep Apnea", "Family History of Heart Disease"]}
+    assert get_patient_hf_type(patient_id) == "HFrEF"
+    assert_matches_source()
+
+
+def test_patient_updates_refresh_the_summary(patient_id):
+    execute("UPDATE patients SET age = 72, hf_type = NULL WHERE patient_id = ?", patient_id)
+
+    summary = get_patient_summary(patient_id)
+    assert (summary["age"], summary["hf_type"]) == (72, None)
+    assert get_patient_hf_type(patient_id) is None
+    assert_matches_source()
+
+
+def test_symptom_changes_refresh_the_summary(patient_id):
+    execute("INSERT INTO patient_symptoms (patient_id, symptom) VALUES (?, 'Edema')", patient_id)
+    assert get_visual_summary_data(patient_id)[0] == ["Dyspnea", "Edema"]
+
+    execute("UPDATE patient_symptoms SET symptom = 'Orthopnea' WHERE symptom = 'Edema'")
+    execute("DELETE FROM patient_symptoms WHERE symptom = 'Dyspnea'")
+
+    assert get_visual_summary_data(patient_id)[0] == ["Orthopnea"]
+    assert_matches_source()
+
+
+def test_moving_a_row_refreshes_both_patients(patient_id):
+    other = save_encounter({"patient_name": "Ben"})
+
+    execute("UPDATE patient_symptoms SET patient_id = ? WHERE patient_id = ?", other, patient_id)
+
+    assert get_visual_summary_data(patient_id)[0] == []
+    assert get_visual_summary_data(other)[0] == ["Dyspnea"]
+    assert_matches_source()
+
+
+def test_only_the_first_comorbidity_record_is_summarized(patient_id):
+    execute("INSERT INTO patient_comorbidities (patient_id, diabetes) VALUES (?, 1)", patient_id)
+    assert "Diabetes" not in get_visual_summary_data(patient_id)[1]
+
+    execute("UPDATE patient_comorbidities SET hypertension = 0, obesity = 1 "
+            "WHERE id = (SELECT min(id) FROM patient_comorbidities)")
+    assert get_visual_summary_data(patient_id)[1] == ["Obesity", "Sleep Apnea",
+                                                      "Family History of Heart Disease"]
+    assert_matches_source()
+
+
+def test_deleted_patient_loses_the_summary(patient_id):
+    execute("DELETE FROM patients WHERE patient_id = ?", patient_id)
+
+    assert get_patient_summary(patient_id) is None
+    assert get_visual_summary_data(patient_id) == ([], [])
+    assert_matches_source()
@@ -0,0 +1,117 @@
+import threading
+import time
+
+import fitz
+import pytest
+
+from utils import bounded, extract_pdf_content, iter_page_content
+
+
+def make_pdf(path, pages, title):
+    """A PDF whose pages carry two paragraphs, boilerplate, and a ruled 2x2 table on even pages"""
+    doc = fitz.open()
+    for number in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"{title} paragraph one on page {number} about diuretics.")
+        page.insert_text((72, 110), f"{title} paragraph two on page {number} about beta blockers.")
+        page.insert_text((72, 150), "Downloaded from a journal website by a reader")
+        page.insert_text((72, 190), "Too short")
+        if number % 2 == 0:
+            for y in (300, 330, 360):
+                page.draw_line((72, y), (372, y))
+            for x in (72, 222, 372):
+                page.draw_line((x, 300), (x, 360))
+            page.insert_text((80, 320), "Drug")
+            page.insert_text((230, 320), "Dose")
+            page.insert_text((80, 350), f"Furosemide{number}")
+            page.insert_text((230, 350), "40 mg")
+    doc.save(path)
+    doc.close()
+    return str(path)
+
+
+@pytest.fixture
+def pdfs(tmp_path):
+    return [make_pdf(tmp_path / "a.pdf", 7, "Alpha"), make_pdf(tmp_path / "b.pdf", 3, "Beta")]
+
+
+def flatten(parts):
+    tables, text_blocks = [], []
+    for range_tables, range_blocks in parts:
+        tables.extend(range_tables)
+        text_blocks.extend(range_blocks)
+    return tables, text_blocks
+
+
+def test_single_pass_keeps_text_outside_tables_in_page_order(pdfs):
+    tables, text_blocks = extract_pdf_content(pdfs[0])
+
+    assert text_blocks[:2] == ["Alpha paragraph one on page 0 about diuretics.",
+                               "Alpha paragraph two on page 0 about beta blockers."]
+    assert len(text_blocks) == 14
+    assert not any("Downloaded" in block or "Furosemide" in block for block in text_blocks)
+    assert [table.splitlines() for table in tables[:1]] == [["Drug | Dose", "Furosemide0 | 40 mg"]]
+    assert len(tables) == 4
+
+
+def test_parallel_extraction_matches_serial(pdfs):
+    assert extract_pdf_content(pdfs[0], workers=3) == extract_pdf_content(pdfs[0])
+
+
+@pytest.mark.parametrize("workers, pages_per_task", [(1, 2), (2, 1), (2, 3)])
+def test_streamed_ranges_match_whole_documents(pdfs, workers, pages_per_task):
+    parts = list(iter_page_content(pdfs, workers=workers, pages_per_task=pages_per_task))
+
+    whole = [extract_pdf_content(path) for path in pdfs]
+    assert flatten(parts) == (whole[0][0] + whole[1][0], whole[0][1] + whole[1][1])
+    assert len(parts) == -(-7 // pages_per_task) + -(-3 // pages_per_task)
+
+
+def test_bounded_yields_everything_in_order():
+    assert list(bounded(iter(range(100)), maxsize=3)) == list(range(100))
+
+
+def test_bounded_applies_backpressure():
+    produced = []
+
+    def source():
+        for i in range(50):
+            produced.append(i)
+            yield i
+
+    items = bounded(source(), maxsize=4)
+    assert next(items) == 0
+    # Give the producer time to run ahead as far as it can
+    time.sleep(0.3)
+
+    # The queue, plus the item the producer is blocked on
+    assert len(produced) <= 4 + 2
+    assert list(items) == list(range(1, 50))
+
+
+def test_bounded_reraises_producer_errors():
+    def source():
+        yield 1
+        raise ValueError("bad page")
+
+    items = bounded(source())
+    assert next(items) == 1
+    with pytest.raises(ValueError, match="bad page"):
+        next(items)
+
+
+def test_bounded_closes_the_source_when_the_consumer_stops():
+    closed = threading.Event()
+
+    def source():
+        try:
+            for i in range(1000):
+                yield i
+        finally:
+            closed.set()
+
+    items = bounded(source(), maxsize=2)
+    assert next(items) == 0
+    items.close()
+
+    assert closed.wait(5)
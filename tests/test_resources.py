@@ -0,0 +1,55 @@
+import threading
+
+import pytest
+
+pytest.importorskip("pymilvus")
+pytest.importorskip("sentence_transformers")
+
+from services import patient_deletion, resources  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch):
+    """Empty resource registry and purge hooks, restored after each test"""
+    monkeypatch.setattr(resources, "_resources", {})
+    monkeypatch.setattr(patient_deletion, "_purge_hooks", [])
+    return resources._resources
+
+
+def test_resource_is_created_once_across_threads(registry):
+    created = []
+    all_asking = threading.Barrier(8, timeout=5)
+
+    def factory():
+        created.append(object())
+        return created[-1]
+
+    def get():
+        all_asking.wait()
+        results.append(resources._get_or_create("thing", factory))
+
+    results = []
+    threads = [threading.Thread(target=get) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(created) == 1
+    assert results == created * 8
+    assert registry == {"thing": created[0]}
+
+
+def test_answer_cache_is_shared_and_purged_on_erasure(registry):
+    cache = resources.get_answer_cache()
+
+    assert resources.get_answer_cache() is cache
+    assert patient_deletion._purge_hooks == [cache.invalidate_patient]
+
+
+def test_missing_api_key_names_the_variable(monkeypatch):
+    monkeypatch.setattr(resources, "CHATBOT_API_KEY", None)
+
+    with pytest.raises(RuntimeError, match=resources.CHATBOT_MODEL["api_key_env"]):
+        resources.get_llm_client()
+    assert "llm_client" not in resources._resources
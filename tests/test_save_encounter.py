@@ -0,0 +1,75 @@
+import pytest
+
+from form import (bulk_save_encounters, get_patient_consents, get_patient_data, get_patient_summary,
+                  get_patient_symptoms, save_encounter)
+from services.audit_log import get_audit_log
+from services.patient_db import connection
+
+SYMPTOM = {"symptom": "Orthopnea", "category": "Respiratory", "severity": 3, "duration": "days"}
+
+
+def count(table):
+    with connection() as conn:
+        return conn.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+
+
+def test_encounter_is_saved_with_all_related_rows(patient_db):
+    patient_id = save_encounter(
+        {"patient_name": "Ada", "age": 71, "hf_type": "HFrEF"},
+        consents=(True, False, True),
+        individual_symptoms=[SYMPTOM],
+        comorbidities_data={"Diabetes": True, "Obesity": False},
+        comorbidity_details_data=[{"detail_key": "HbA1c", "detail_value": "7.1"}],
+        cv_events_data={"Stroke": False, "PCI / CABG": True})
+
+    assert get_patient_data(patient_id)["patient_name"] == "Ada"
+    assert [row["symptom"] for row in get_patient_symptoms(patient_id)] == ["Orthopnea"]
+    consents = get_patient_consents(patient_id)
+    assert [(row["clinical_care_consent"], row["ai_training_consent"]) for row in consents] == [(1, 1)]
+    with connection() as conn:
+        record_id, diabetes = conn.execute(
+            "SELECT id, diabetes FROM patient_comorbidities WHERE patient_id = ?", (patient_id,)).fetchone()
+        assert diabetes == 1
+        assert conn.execute("SELECT comorbidity_record_id, detail_value FROM comorbidity_details "
+                            "WHERE patient_id = ?", (patient_id,)).fetchall() == [(record_id, "7.1")]
+        assert conn.execute("SELECT event_key, event_present FROM cv_events WHERE patient_id = ? "
+                            "ORDER BY id", (patient_id,)).fetchall() == [("Stroke", 0), ("PCI / CABG", 1)]
+
+    get_audit_log().flush()
+    with connection() as conn:
+        assert conn.execute("SELECT action, purpose FROM consent_audit_log WHERE patient_id = ? ORDER BY id",
+                            (patient_id,)).fetchall() == [("CONSENT_GIVEN", "CLINICAL_CARE"),
+                                                          ("CONSENT_GIVEN", "AI_TRAINING")]
+
+
+def test_failed_encounter_leaves_nothing_behind(patient_db):
+    with pytest.raises(KeyError):
+        save_encounter({"patient_name": "Ben"}, consents=(True, True, True),
+                       individual_symptoms=[SYMPTOM, {"symptom": "Edema"}])
+
+    for table in ("patients", "patient_consents", "patient_comorbidities", "patient_symptoms",
+                  "patient_summary"):
+        assert count(table) == 0, table
+    get_audit_log().flush()
+    assert count("consent_audit_log") == 0
+
+
+def test_patient_without_optional_data(patient_db):
+    patient_id = save_encounter({"patient_name": "Cy"})
+
+    assert get_patient_summary(patient_id) == {"patient_name": "Cy", "age": None, "sex": None,
+                                               "hf_type": None, "symptoms": [], "comorbidities": []}
+    assert count("patient_consents") == 0
+
+
+def test_bulk_save_commits_per_batch(patient_db):
+    encounters = [{"patient": {"patient_name": f"P{i}"}} for i in range(5)]
+    encounters.append({"patient": {"patient_name": "bad"}, "symptoms": [{"symptom": "Edema"}]})
+
+    with pytest.raises(KeyError):
+        bulk_save_encounters(encounters, batch_size=2)
+
+    # The first two batches were committed; the failing one rolled back whole
+    with connection() as conn:
+        assert [row[0] for row in conn.execute("SELECT patient_name FROM patients ORDER BY patient_id")] \
+            == ["P0", "P1", "P2", "P3"]
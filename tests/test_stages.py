@@ -0,0 +1,125 @@
+import os
+import time
+
+import pytest
+
+import extract_hf_cases
+from extract_hf_cases import Stage, run_stages, stage_keys, stage_order
+
+
+# Stage functions run in worker processes, so they live at module level and
+# report through files
+def record(log, name):
+    with open(log, "a") as f:
+        f.write(name + "\n")
+
+
+def source(log, name, value):
+    record(log, name)
+    return value
+
+
+def add(log, name, left, right):
+    record(log, name)
+    return left + right
+
+
+def wait_for(log, name, other):
+    """Returns once `other` has started too: only possible if the two stages overlap"""
+    record(log, name)
+    deadline = time.time() + 10
+    while other not in runs(log):
+        if time.time() > deadline:
+            raise TimeoutError(f"{other} did not run alongside {name}")
+        time.sleep(0.01)
+    return 0
+
+
+def runs(log):
+    if not os.path.exists(log):
+        return []
+    with open(log) as f:
+        return f.read().split()
+
+
+@pytest.fixture
+def log(tmp_path, monkeypatch):
+    monkeypatch.setattr(extract_hf_cases, "STAGE_CACHE_DIR", str(tmp_path / "stages"))
+    return str(tmp_path / "runs.log")
+
+
+def diamond(log, left_value=2, cache_right=True):
+    return {
+        "total": Stage(add, ["left", "right"], params={"log": log, "name": "total"}),
+        "left": Stage(source, params={"log": log, "name": "left", "value": left_value}),
+        "right": Stage(source, params={"log": log, "name": "right", "value": 3}, cache=cache_right),
+        "other": Stage(source, params={"log": log, "name": "other", "value": 7}),
+    }
+
+
+def test_stage_order_puts_inputs_first(log):
+    order = stage_order(diamond(log))
+
+    assert order.index("total") > max(order.index("left"), order.index("right"))
+    assert sorted(order) == ["left", "other", "right", "total"]
+
+
+def test_stage_order_rejects_cycles_and_unknown_inputs():
+    with pytest.raises(ValueError, match="cycle"):
+        stage_order({"a": Stage(source, ["b"]), "b": Stage(source, ["a"])})
+    with pytest.raises(ValueError, match="Unknown"):
+        stage_order({"a": Stage(source, ["missing"])})
+
+
+def test_keys_follow_params_and_inputs(log):
+    keys = stage_keys(diamond(log))
+    changed = stage_keys(diamond(log, left_value=5))
+
+    assert changed["left"] != keys["left"] and changed["total"] != keys["total"]
+    assert changed["right"] == keys["right"] and changed["other"] == keys["other"]
+
+
+def test_uncached_stages_and_their_dependents_have_no_key(log):
+    keys = stage_keys(diamond(log, cache_right=False))
+
+    assert keys["right"] is None and keys["total"] is None
+    assert keys["left"] is not None
+
+
+def test_run_stages_passes_outputs_along(log):
+    results = run_stages(diamond(log), workers=2)
+
+    assert results == {"left": 2, "right": 3, "other": 7, "total": 5}
+    assert runs(log)[-1] == "total"
+
+
+def test_cached_outputs_are_reused(log):
+    run_stages(diamond(log), workers=2)
+    first = runs(log)
+
+    assert run_stages(diamond(log), workers=2)["total"] == 5
+    assert runs(log) == first
+
+    assert run_stages(diamond(log, left_value=4), workers=2)["total"] == 7
+    assert sorted(runs(log)[len(first):]) == ["left", "total"]
+
+    run_stages(diamond(log), workers=2, use_cache=False)
+    assert len(runs(log)) == len(first) + 2 + 4
+
+
+def test_uncached_stage_reruns_with_its_dependents(log):
+    run_stages(diamond(log, cache_right=False), workers=2)
+    first = runs(log)
+
+    run_stages(diamond(log, cache_right=False), workers=2)
+
+    assert sorted(runs(log)[len(first):]) == ["right", "total"]
+
+
+def test_independent_stages_run_concurrently(log):
+    stages = {
+        "a": Stage(wait_for, params={"log": log, "name": "a", "other": "b"}, cache=False),
+        "b": Stage(wait_for, params={"log": log, "name": "b", "other": "a"}, cache=False),
+    }
+
+    assert run_stages(stages, workers=2) == {"a": 0, "b": 0}
@@ -0,0 +1,82 @@
+import pytest
+
+from form import save_encounter
+
+pytest.importorskip("pymilvus")
+pytest.importorskip("sentence_transformers")
+
+from services.chatbot_service import ChatbotService, render_streamed_response  # noqa: E402
+
+
+@pytest.fixture
+def chatbot(chat_resources):
+    return ChatbotService()
+
+
+@pytest.fixture
+def patient_id(patient_db):
+    return save_encounter({"patient_name": "Ada", "age": 71})
+
+
+class Placeholder:
+    def __init__(self):
+        self.shown = []
+
+    def markdown(self, text):
+        self.shown.append(text)
+
+
+def test_streamed_pieces_arrive_one_by_one(chatbot, patient_id):
+    response = chatbot.generate_patient_response(patient_id, "How much fluid?", stream=True)
+
+    assert not isinstance(response, str)
+    assert list(response) == ["Rest ", "and ", "weigh daily."]
+
+
+def test_answer_is_cached_once_the_stream_completes(chatbot, chat_resources, patient_id):
+    response = chatbot.generate_doc_response(patient_id, "Uptitrate?", stream=True)
+    next(response)
+    # Half-read: nothing cached yet
+    assert chat_resources.answer_cache._entries == {}
+
+    list(response)
+    chat_resources.completions.pieces = ["other answer"]
+    assert chatbot.generate_doc_response(patient_id, "Uptitrate?", stream=True) == "Rest and weigh daily."
+    assert len(chat_resources.completions.requests) == 1
+
+
+def test_failed_stream_yields_an_error_and_caches_nothing(chatbot, chat_resources, patient_id):
+    create = chat_resources.completions.create
+
+    def broken(messages, model, stream=False):
+        # The connection drops after the first piece
+        yield next(create(messages, model, stream))
+        raise ConnectionError("connection reset")
+
+    chat_resources.completions.create = broken
+
+    pieces = list(chatbot.generate_patient_response(patient_id, "How much fluid?", stream=True))
+
+    assert pieces == ["Rest ", "Error generating response: connection reset"]
+    assert chat_resources.answer_cache._entries == {}
+
+
+def test_missing_patient_is_a_plain_message(chatbot, patient_db):
+    assert chatbot.generate_patient_response(404, "How much fluid?", stream=True) == \
+        "Patient not found. Please check the patient ID."
+
+
+def test_render_streamed_response_shows_a_cursor_until_done():
+    placeholder = Placeholder()
+
+    text = render_streamed_response(placeholder, iter(["Rest ", "and ", "weigh daily."]))
+
+    assert text == "Rest and weigh daily."
+    assert placeholder.shown == ["Rest ▌", "Rest and ▌", "Rest and weigh daily.▌", "Rest and weigh daily."]
+
+
+def test_render_plain_string_response():
+    placeholder = Placeholder()
+
+    assert render_streamed_response(placeholder, "cached") == "cached"
+    assert placeholder.shown == ["cached"]
@@ -0,0 +1,133 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from extract_hf_cases import FEATURE_STATS, FEATURE_WINDOWS, WindowedAggregator, aggregate_events, feature_column
+
+NAMES = {220045: "heart_rate", 220179: "systolic_bp", 50912: "creatinine"}
+
+
+@pytest.fixture
+def events():
+    """Shuffled chartevents-like rows for 30 admissions, some before admission or missing"""
+    rng = np.random.default_rng(7)
+    n = 4000
+    admit_times = pd.Series(
+        pd.Timestamp("2150-01-01") + pd.to_timedelta(rng.integers(0, 1000, 30), unit="h"),
+        index=pd.Index(range(100, 130), name="hadm_id"))
+    hadm_ids = rng.integers(100, 130, n)
+    # Minute offsets from -2h to +3 days, unique per row so first/last are unambiguous
+    offsets = pd.to_timedelta(rng.permutation(np.arange(-120, 4200))[:n], unit="min")
+    times = admit_times.loc[hadm_ids].to_numpy() + offsets.to_numpy()
+    frame = pd.DataFrame({
+        "hadm_id": pd.array(hadm_ids, dtype="Int32"),
+        "itemid": rng.choice(list(NAMES), n).astype("int32"),
+        "valuenum": rng.normal(100, 20, n).astype("float32"),
+        "charttime": pd.Series(times).dt.strftime("%Y-%m-%d %H:%M:%S"),
+    })
+    frame.loc[rng.choice(n, 40, replace=False), "valuenum"] = np.nan
+    frame.loc[rng.choice(n, 40, replace=False), "hadm_id"] = pd.NA
+    return frame, admit_times
+
+
+def chunks(frame, size):
+    return [frame.iloc[i:i + size] for i in range(0, len(frame), size)]
+
+
+def expected_features(frame, admit_times):
+    """The same features computed directly on the whole table"""
+    frame = frame.dropna(subset=["hadm_id", "valuenum", "charttime"])
+    events = pd.DataFrame({
+        "hadm_id": frame["hadm_id"].astype("int64"),
+        "itemid": frame["itemid"].astype("int64"),
+        "value": frame["valuenum"].astype("float64"),
+        "time": pd.to_datetime(frame["charttime"]),
+    })
+    events = events.sort_values(["hadm_id", "itemid", "time"], kind="stable")
+    offset = events["time"] - events["hadm_id"].map(admit_times)
+
+    columns = {}
+    for window, length in FEATURE_WINDOWS.items():
+        part = events if length is None else events[(offset >= pd.Timedelta(0)) & (offset < length)]
+        grouped = part.groupby(["hadm_id", "itemid"])["value"]
+        stats = {"mean": grouped.mean(), "min": grouped.min(), "max": grouped.max(),
+                 "first": grouped.first(), "last": grouped.last()}
+        for stat in FEATURE_STATS:
+            for item, series in stats[stat].unstack("itemid").items():
+                columns[feature_column(NAMES[item], window, stat)] = series
+    return pd.DataFrame(columns)
+
+
+def aligned(left, right):
+    right = right[left.columns].reindex(left.index)
+    return left.sort_index(axis=1), right.sort_index(axis=1)
+
+
+@pytest.mark.parametrize("chunk_rows", [4000, 997, 150, 37])
+def test_chunked_matches_unchunked(events, chunk_rows):
+    frame, admit_times = events
+    whole = aggregate_events([frame], admit_times, NAMES)
+
+    chunked = aggregate_events(chunks(frame, chunk_rows), admit_times, NAMES)
+
+    assert set(chunked.columns) == set(whole.columns)
+    left, right = aligned(whole, chunked)
+    pd.testing.assert_frame_equal(left, right, check_dtype=False, rtol=1e-6)
+
+
+def test_matches_direct_computation(events):
+    frame, admit_times = events
+
+    features = aggregate_events(chunks(frame, 333), admit_times, NAMES)
+    expected = expected_features(frame, admit_times)
+
+    assert set(features.columns) == set(expected.columns)
+    left, right = aligned(expected.sort_index(), features)
+    pd.testing.assert_frame_equal(left, right, check_dtype=False, check_names=False, rtol=1e-6)
+
+
+def test_windows_exclude_events_before_admission(events):
+    frame, admit_times = events
+    admit = admit_times.loc[100]
+    rows = pd.DataFrame({
+        "hadm_id": pd.array([100, 100, 100], dtype="Int32"),
+        "itemid": [220045] * 3,
+        "valuenum": [1.0, 2.0, 3.0],
+        "charttime": [str(admit - pd.Timedelta(minutes=5)), str(admit),
+                      str(admit + pd.Timedelta(hours=1))],
+    })
+
+    features = aggregate_events([rows], admit_times, NAMES).loc[100]
+
+    # The 1h window is [admission, admission + 1h)
+    assert features["heart_rate_1h_first"] == 2.0
+    assert features["heart_rate_1h_last"] == 2.0
+    assert features["heart_rate_24h_mean"] == 2.5
+    assert features["heart_rate_first"] == 1.0
+
+
+def test_equal_times_keep_table_order_across_chunks(events):
+    _, admit_times = events
+    time = str(admit_times.loc[101] + pd.Timedelta(minutes=10))
+    rows = pd.DataFrame({
+        "hadm_id": pd.array([101] * 4, dtype="Int32"),
+        "itemid": [220179] * 4,
+        "valuenum": [10.0, 20.0, 30.0, 40.0],
+        "charttime": [time] * 4,
+    })
+
+    aggregator = WindowedAggregator(admit_times)
+    for chunk in chunks(rows, 1):
+        aggregator.add(chunk)
+    features = aggregator.result(NAMES).loc[101]
+
+    assert features["systolic_bp_first"] == 10.0
+    assert features["systolic_bp_last"] == 40.0
+
+
+def test_no_events_gives_empty_frame(events):
+    _, admit_times = events
+
+    features = aggregate_events([], admit_times, NAMES)
+
+    assert features.empty and features.index.name == "hadm_id"
@@ -1,5 +1,9 @@
 import json
+import queue
 import re
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 import fitz
 from tqdm import tqdm
@@ -31,104 +35,218 @@ def clean_extracted_text(text):
     return text
 
 
-def extract_tables_from_pdf(pdf_path, difference_between_each_row=100):
+def table_to_text(table):
+    """Converts a detected table into text, one line per row and " | " between cells."""
+    table_text = ""
+    for row in table.extract():
+        row_text = ""
+        for cell in row:
+            if cell is None or cell == "":
+                continue
+            cell_text = str(cell).strip().replace("\n", "")
+            if cell_text:
+                row_text += cell_text + " | "
+        if row_text:
+            # Remove trailing separator and add a newline
+            row_text = row_text.rstrip(" | ") + "\n"
+        table_text += row_text
+    return table_text
+
+
+def group_page_tables(tables, difference_between_each_row=100):
     """
-    Extracts tables from a PDF and groups rows belonging to the same table using bbox.
+    Groups the tables detected on one page into full tables using bbox.
     Two rows are considered part of the same table if:
-      - Their x1 coordinates are equal, and
-      - Their y1 coordinates differ by 10 or less.
-
-    Returns a list of text chunks, each representing one full table.
+      - Their x0 coordinates are equal, and
+      - Their y0 or y1 coordinates differ by `difference_between_each_row` or less.
     """
+    grouped_tables = []
+    # Variables to hold the current grouped table's text and its bbox.
+    current_table_text = ""
+    current_bbox = None  # Expected to be a tuple (x0, y0, x1, y1)
+
+    for table in tables:
+        # Get the bounding box for the current detected table (row)
+        table_bbox = table.bbox
+        table_text = table_to_text(table)
+
+        if current_bbox is None:
+            # Start a new group for the first table (row)
+            current_table_text = table_text
+            current_bbox = table_bbox
+        elif (current_bbox[0] == table_bbox[0] and (abs(current_bbox[1] - table_bbox[1]) <= difference_between_each_row or abs(current_bbox[3] - table_bbox[3]) <= difference_between_each_row)):
+            # Same table, so concatenate the text and extend the group's bbox.
+            current_table_text += table_text
+            current_bbox = (
+                current_bbox[0], current_bbox[1], current_bbox[2], table_bbox[3])
+        else:
+            # New table group detected: store the previous group's text.
+            grouped_tables.append(current_table_text)
+            current_table_text = table_text
+            current_bbox = table_bbox
+
+    # Append any remaining grouped table text from the page.
+    if current_table_text:
+        grouped_tables.append(current_table_text)
+
+    return grouped_tables
+
+
+def page_text_blocks(page, table_rects):
+    """Returns the text blocks of a page in reading order, skipping tables and boilerplate."""
+    text_blocks = []
+
+    # Get and sort text blocks
+    blocks = page.get_text("blocks")
+    blocks.sort(key=lambda b: (round(b[1], 1), round(b[0], 1)))
+
+    for b in blocks:
+        if len(b) >= 5:
+            # Create a rect object for this text block
+            block_rect = fitz.Rect(b[0], b[1], b[2], b[3])
+
+            # Skip if block intersects with any table
+            if any(block_rect.intersects(table_rect) for table_rect in table_rects):
+                continue
+
+            text = b[4].strip()
+            if re.search(r"Downloaded from|ESC Guidelines|\.\.|©|http|^Table\s", text):
+                continue
+
+            if len(text) < 20:
+                continue
+
+            text_blocks.append(text)
+
+    return text_blocks
+
+
+def extract_page_range(pdf_path, start, stop, difference_between_each_row=100):
+    """Extracts tables and text blocks from pages [start, stop) with one find_tables call per page."""
     doc = fitz.open(pdf_path)
-    extracted_tables = []
-
-    for page_num, page in enumerate(doc):
-        tables = page.find_tables()
-        # Variables to hold the current grouped table's text and its bbox.
-        current_table_text = ""
-        current_bbox = None  # Expected to be a tuple (x0, y0, x1, y1)
-
-        for table in tables:
-            # Get the bounding box for the current detected table (row)
-            table_bbox = table.bbox
-
-            # Extract table row data as text
-            table_data = table.extract()
-            table_text = ""
-            for row in table_data:
-                row_text = ""
-                for cell in row:
-                    if cell is None or cell == "":
-                        continue
-                    cell_text = str(cell).strip().replace("\n", "")
-                    if cell_text:
-                        row_text += cell_text + " | "
-                if row_text:
-                    # Remove trailing separator and add a newline
-                    row_text = row_text.rstrip(" | ") + "\n"
-                table_text += row_text
-
-            if current_bbox is None:
-                # Start a new group for the first table (row)
-                current_table_text = table_text
-                current_bbox = table_bbox
-            else:
-                # Check if current table row belongs to the same table group.
-                # Here we compare x1 coordinates for equality and ensure the difference
-                # in y1 is at most 10 units.
-                if (current_bbox[0] == table_bbox[0] and (abs(current_bbox[1] - table_bbox[1]) <= difference_between_each_row or abs(current_bbox[3] - table_bbox[3]) <= difference_between_each_row)):
-                    # Same table, so concatenate the text.
-                    current_table_text += table_text
-                    # Optionally, update the bbox for the group:
-                    current_bbox = (
-                        current_bbox[0], current_bbox[1], current_bbox[2], table_bbox[3])
-                else:
-                    # New table group detected: store the previous group's text.
-                    extracted_tables.append(current_table_text)
-                    current_table_text = table_text
-                    current_bbox = table_bbox
-
-        # Append any remaining grouped table text from the page.
-        if current_table_text:
-            extracted_tables.append(current_table_text)
-
-    return extracted_tables
-
-
-def extract_text_from_pdf(pdf_path):
-    """Extract text from a two-column PDF in correct reading order, excluding tables."""
-    doc = fitz.open(pdf_path)
-    extracted_text = []
+    tables = []
+    text_blocks = []
+
+    for page_num in range(start, stop):
+        page = doc[page_num]
+        page_tables = page.find_tables()
+        tables.extend(group_page_tables(
+            page_tables, difference_between_each_row))
+        text_blocks.extend(page_text_blocks(
+            page, [table.bbox for table in page_tables]))
+
+    doc.close()
+    return tables, text_blocks
+
+
+def extract_pdf_content(pdf_path, difference_between_each_row=100, workers=1):
+    """
+    Extracts the tables and the ordered text of a PDF in a single pass.
+    Each page is parsed once and its table detection is shared between table and
+    text extraction. With workers > 1, page ranges are processed in parallel processes.
+
+    Returns (tables, text_blocks): the grouped table texts and the ordered
+    non-table text blocks, both in page order.
+    """
+    with fitz.open(pdf_path) as doc:
+        page_count = doc.page_count
+
+    if workers <= 1:
+        return extract_page_range(pdf_path, 0, page_count, difference_between_each_row)
 
-    for page in tqdm(doc, desc="Extracting ordered text", unit="page"):
-        # First identify all tables on the page
-        tables = page.find_tables()
-        table_rects = [table.bbox for table in tables]
+    # Several small ranges per worker keep the pool busy when pages differ in cost
+    range_size = max(1, -(-page_count // (workers * 4)))
+    starts = list(range(0, page_count, range_size))
+    stops = [min(start + range_size, page_count) for start in starts]
 
-        # Get and sort text blocks
-        blocks = page.get_text("blocks")
-        blocks.sort(key=lambda b: (round(b[1], 1), round(b[0], 1)))
+    tables = []
+    text_blocks = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(extract_page_range, [pdf_path] * len(starts), starts, stops,
+                               [difference_between_each_row] * len(starts))
+        for range_tables, range_blocks in tqdm(results, total=len(starts), desc="Extracting pages", unit="range"):
+            tables.extend(range_tables)
+            text_blocks.extend(range_blocks)
 
-        for b in blocks:
-            if len(b) >= 5:
-                # Create a rect object for this text block
-                block_rect = fitz.Rect(b[0], b[1], b[2], b[3])
+    return tables, text_blocks
 
-                # Skip if block intersects with any table
-                if any(block_rect.intersects(table_rect) for table_rect in table_rects):
-                    continue
 
-                text = b[4].strip()
-                if re.search(r"Downloaded from|ESC Guidelines|\.\.|©|http|^Table\s", text):
-                    continue
+def bounded(iterable, maxsize=8):
+    """
+    Runs `iterable` on a background thread and yields its items through a queue
+    of at most `maxsize` items, so a slow consumer applies backpressure to the producer.
+    """
+    items = queue.Queue(maxsize=maxsize)
+    done = object()
+    stop = threading.Event()
+
+    def put(item):
+        # False once the consumer has stopped and nothing will take the item
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
 
-                if len(text) < 20:
-                    continue
+    def produce():
+        source = iter(iterable)
+        try:
+            for item in source:
+                if not put(item):
+                    return
+            put(done)
+        except BaseException as e:
+            put(e)
+        finally:
+            # Release whatever the source holds open (PDF documents, ...)
+            close = getattr(source, "close", None)
+            if close is not None:
+                close()
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = items.get()
+            if item is done:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        # Let the producer exit if the consumer stops early
+        stop.set()
+
+
+def iter_page_content(pdf_paths, difference_between_each_row=100, workers=1, pages_per_task=4):
+    """
+    Streams (tables, text_blocks) for consecutive page ranges of one or more PDFs, in
+    document order. With workers > 1, ranges are parsed in a process pool with at most
+    2 * workers ranges in flight, so memory does not grow with the document size.
+    """
+    tasks = []
+    for pdf_path in pdf_paths:
+        with fitz.open(pdf_path) as doc:
+            page_count = doc.page_count
+        for start in range(0, page_count, pages_per_task):
+            tasks.append((pdf_path, start, min(start + pages_per_task, page_count),
+                          difference_between_each_row))
 
-                extracted_text.append(text)
+    if workers <= 1:
+        for task in tasks:
+            yield extract_page_range(*task)
+        return
 
-    return "\n".join(extracted_text)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = deque()
+        for task in tasks:
+            in_flight.append(executor.submit(extract_page_range, *task))
+            if len(in_flight) >= 2 * workers:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
 
 
 def extract_assistant_response_phi4(response):